@@ -10,6 +10,9 @@ import logging
 from .document import Document
 from .client import AioClient
 from .collections import AioCollection
+from .cursor import DocumentCursor
+from .cache import request_cache
+from .query import Param
 from bson.objectid import ObjectId
 
 logging.basicConfig(level=logging.DEBUG)
@@ -23,5 +26,8 @@ __all__ = [
     'Document',
     'AioClient',
     'AioCollection',
+    'DocumentCursor',
+    'request_cache',
+    'Param',
     'ObjectId'
 ]
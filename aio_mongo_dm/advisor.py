@@ -0,0 +1,268 @@
+"""
+name: advisor
+author：kavinbj
+createdAt: 2022/8/11
+version: 1.0.0
+description:
+
+Query shape recorder and index advisor
+"""
+from collections import Counter
+from typing import (
+    Optional,
+    Any,
+    Dict,
+    List,
+    Mapping,
+    MutableMapping,
+    Sequence,
+    Tuple
+)
+
+# operators of an equality predicate, others are range or unindexable predicates
+_EQUALITY_OPERATORS = ('$eq', '$in')
+_RANGE_OPERATORS = ('$gt', '$gte', '$lt', '$lte')
+
+_SortKeys = Tuple[Tuple[str, int], ...]
+
+
+class QueryShape:
+    __slots__ = ('equality', 'sort', 'range', 'other')
+
+    def __init__(
+        self,
+        equality: Tuple[str, ...] = (),
+        sort: _SortKeys = (),
+        range: Tuple[str, ...] = (),
+        other: Tuple[str, ...] = ()
+    ):
+        """
+        shape of a query, the fields of its predicates by kind, values are dropped
+        :param equality: fields of equality predicates
+        :param sort: sort keys
+        :param range: fields of range predicates
+        :param other: fields of predicates an index can hardly use, e.g. $ne, $regex, $or branches
+        """
+        self.equality = equality
+        self.sort = sort
+        self.range = range
+        self.other = other
+
+    def _key(self) -> tuple:
+        return self.equality, self.sort, self.range, self.other
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, QueryShape) and self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    def __repr__(self) -> str:
+        return f'QueryShape(equality={self.equality}, sort={self.sort}, range={self.range}, other={self.other})'
+
+    def suggest_index(self) -> List[Tuple[str, int]]:
+        """
+        compound index by the equality, sort, range rule
+        :return:
+        """
+        keys = [(key, 1) for key in self.equality]
+        keys.extend((key, direction) for key, direction in self.sort if key not in self.equality)
+        used = {key for key, _ in keys}
+        keys.extend((key, 1) for key in self.range if key not in used)
+        return keys
+
+
+def query_shape(
+    filters: Optional[Mapping[str, Any]] = None,
+    sort: Optional[Sequence[Tuple[str, int]]] = None
+) -> QueryShape:
+    """
+    normalize a query to its shape
+    :param filters: query filter
+    :param sort: list of (key, direction)
+    :return:
+    """
+    equality, range_, other = set(), set(), set()
+    for key, value in (filters or {}).items():
+        if key == '$and':
+            for branch in value:
+                shape = query_shape(branch)
+                equality.update(shape.equality)
+                range_.update(shape.range)
+                other.update(shape.other)
+        elif key.startswith('$'):
+            other.update(field for branch in (value if isinstance(value, list) else [])
+                         for field in _fields(branch))
+        elif isinstance(value, Mapping) and value and all(str(op).startswith('$') for op in value):
+            if set(value) <= set(_EQUALITY_OPERATORS):
+                equality.add(key)
+            elif set(value) & set(_RANGE_OPERATORS):
+                range_.add(key)
+            else:
+                other.add(key)
+        else:
+            equality.add(key)
+    range_ -= equality
+    other -= equality | range_
+    return QueryShape(tuple(sorted(equality)), tuple((key, direction) for key, direction in sort or ()),
+                      tuple(sorted(range_)), tuple(sorted(other)))
+
+
+def _fields(filters: Any) -> List[str]:
+    if not isinstance(filters, Mapping):
+        return []
+    shape = query_shape(filters)
+    return list(shape.equality + shape.range + shape.other)
+
+
+def index_quality(
+    shape: QueryShape,
+    index_keys: Sequence[Tuple[str, Any]]
+) -> int:
+    """
+    number of leading index keys the query can use, equality fields first, then sort keys in order
+    (or all reversed), then one range field
+    :param shape: query shape
+    :param index_keys: list of (key, direction) of the index
+    :return:
+    """
+    keys = list(index_keys)
+    position = 0
+    equality = set(shape.equality)
+    while position < len(keys) and keys[position][0] in equality:
+        position += 1
+    sort = [sort_key for sort_key in shape.sort if sort_key[0] not in equality]
+    if sort:
+        window = keys[position:position + len(sort)]
+        if window == sort or window == [(key, -direction) for key, direction in sort]:
+            position += len(sort)
+        else:
+            return position
+    if position < len(keys) and keys[position][0] in shape.range:
+        position += 1
+    return position
+
+
+def _covered(shape: QueryShape) -> int:
+    return len(shape.equality) + len([key for key, _ in shape.sort if key not in shape.equality]) + \
+        (1 if shape.range else 0)
+
+
+class QueryRecorder:
+    def __init__(self):
+        """
+        count query shapes sent by a document class, and compare them with its indexes
+        """
+        self.shapes: Counter = Counter()
+        self.operations: Dict[QueryShape, Counter] = {}
+        # first filter and sort seen of every shape, for explain
+        self.samples: Dict[QueryShape, Tuple[Mapping[str, Any], Optional[Sequence[Tuple[str, int]]]]] = {}
+
+    def record(
+        self,
+        operation: str,
+        filters: Optional[Mapping[str, Any]] = None,
+        sort: Optional[Sequence[Tuple[str, int]]] = None
+    ) -> QueryShape:
+        """
+        record one query
+        :param operation: e.g. 'find', 'find_one', 'count'
+        :param filters: query filter
+        :param sort: list of (key, direction)
+        :return:
+        """
+        if filters is not None and not isinstance(filters, Mapping):
+            filters = {'_id': filters}
+        if isinstance(sort, str):
+            sort = [(sort, 1)]
+        elif isinstance(sort, Mapping):
+            sort = list(sort.items())
+        shape = query_shape(filters, sort)
+        self.shapes[shape] += 1
+        self.operations.setdefault(shape, Counter())[operation] += 1
+        self.samples.setdefault(shape, (filters, sort))
+        return shape
+
+    def clear(self) -> None:
+        self.shapes.clear()
+        self.operations.clear()
+        self.samples.clear()
+
+    def report(
+        self,
+        index_information: MutableMapping[str, Any],
+        plans: Optional[Dict[QueryShape, str]] = None
+    ) -> List[dict]:
+        """
+        report of recorded shapes, most frequent first, status 'indexed', 'partial' (an index serves only
+        some predicates or the sort) or 'unindexed', with the best index and a suggested compound index
+        :param index_information: output of get_index_infor()
+        :param plans: winning plan stage of shapes from explain, e.g. 'COLLSCAN', 'IXSCAN'
+        :return:
+        """
+        indexes = {name: list(info['key']) for name, info in index_information.items()}
+        report = []
+        for shape, count in self.shapes.most_common():
+            best_name, best = None, 0
+            for name, keys in indexes.items():
+                quality = index_quality(shape, keys)
+                if quality > best:
+                    best_name, best = name, quality
+            needed = _covered(shape)
+            if needed == 0 or best == 0:
+                status = 'unindexed'
+            else:
+                status = 'indexed' if best >= needed else 'partial'
+            plan = (plans or {}).get(shape)
+            if plan == 'COLLSCAN':
+                status = 'unindexed'
+            report.append({
+                'shape': shape,
+                'count': count,
+                'operations': dict(self.operations[shape]),
+                'status': status,
+                'index': best_name,
+                'plan': plan,
+                'suggestion': None if status == 'indexed' else shape.suggest_index() or None
+            })
+        return report
+
+
+def scan_stage(explain: Mapping[str, Any]) -> Optional[str]:
+    """
+    the scan stage of the winning plan of explain output, e.g. 'COLLSCAN', 'IXSCAN', 'IDHACK'
+    :param explain: output of explain
+    :return:
+    """
+    stage = explain.get('queryPlanner', {}).get('winningPlan')
+    while isinstance(stage, Mapping):
+        if stage.get('stage') in ('COLLSCAN', 'IXSCAN', 'IDHACK', 'EXPRESS_IXSCAN', 'CLUSTERED_IXSCAN'):
+            return stage['stage']
+        stage = stage.get('inputStage') or (stage.get('inputStages') or [None])[0] or stage.get('queryPlan')
+    return None
+
+
+# index options compared by index_diff
+_INDEX_OPTIONS = ('unique', 'sparse', 'expireAfterSeconds', 'partialFilterExpression')
+
+
+def index_diff(
+    declared: Mapping[str, Any],
+    information: Mapping[str, Any]
+) -> set:
+    """
+    keys and options which differ between a declared index and its index_information() entry
+    :param declared: IndexModel document
+    :param information: index information of the same name
+    :return: names of different items, 'key' or index options
+    """
+    diff = set()
+    if list(declared['key'].items()) != [tuple(key) for key in information['key']]:
+        diff.add('key')
+    for option in _INDEX_OPTIONS:
+        declared_value, value = declared.get(option), information.get(option)
+        if option in ('unique', 'sparse'):
+            declared_value, value = bool(declared_value), bool(value)
+        if declared_value != value:
+            diff.add(option)
+    return diff
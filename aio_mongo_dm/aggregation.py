@@ -0,0 +1,440 @@
+"""
+name: aggregation
+author：kavinbj
+createdAt: 2022/8/10
+version: 1.0.0
+description:
+
+Fluent aggregation pipeline builder, checked against __schema__, with $match and $project pushdown
+"""
+from motor.core import ClientSession
+from pymongo.read_preferences import _ServerMode
+from .exceptions import AioMongoAttributeError, AioMongoInvalidOperation
+from .query import to_filter
+from typing import (
+    Optional,
+    Union,
+    Any,
+    AsyncIterator,
+    Iterable,
+    List,
+    Mapping,
+    Sequence,
+    Set,
+    Tuple
+)
+
+# stages which keep every field of their input documents
+_KEEP_STAGES = ('$match', '$sort', '$limit', '$skip')
+
+# field reference of the whole document, $$ROOT or $$CURRENT
+_WHOLE_DOCUMENT = '$$ROOT'
+_DOCUMENT_VARIABLES = ('$$ROOT', '$$CURRENT')
+
+
+class Record(dict):
+    __slots__ = ()
+
+    def __getattr__(self, key):
+        """
+        lightweight aggregation result, a dict with attribute access, e.g. record.total
+        :param key:
+        :return:
+        """
+        try:
+            return self[key]
+        except KeyError:
+            raise AioMongoAttributeError(f'record has no attribute {key!r}')
+
+
+def _root(key: str) -> str:
+    return key.split('.', 1)[0]
+
+
+def field_refs(expression: Any) -> Set[str]:
+    """
+    top level fields referenced by '$field' paths of an aggregation expression, '$$ROOT.field' and
+    '$$CURRENT.field' paths included, '$$ROOT' if the expression uses the whole document
+    :param expression:
+    :return:
+    """
+    if isinstance(expression, str):
+        if expression.startswith('$$'):
+            variable, _, path = expression.partition('.')
+            if variable not in _DOCUMENT_VARIABLES:
+                return set()
+            return {_root(path)} if path else {_WHOLE_DOCUMENT}
+        return {_root(expression[1:])} if expression.startswith('$') else set()
+    if isinstance(expression, Mapping):
+        return set().union(*(field_refs(value) for value in expression.values()))
+    if isinstance(expression, (list, tuple)):
+        return set().union(*(field_refs(value) for value in expression))
+    return set()
+
+
+def match_fields(filters: Mapping[str, Any]) -> Set[str]:
+    """
+    top level fields of a $match filter, with $and/$or/$nor branches and $expr references
+    :param filters:
+    :return:
+    """
+    fields = set()
+    for key, value in filters.items():
+        if key in ('$and', '$or', '$nor'):
+            fields.update(*(match_fields(branch) for branch in value))
+        elif key == '$expr':
+            fields.update(field_refs(value))
+        elif not key.startswith('$'):
+            fields.add(_root(key))
+    return fields
+
+
+def stage_inputs(stage: Mapping[str, Any]) -> Optional[Set[str]]:
+    """
+    top level input fields a stage uses, None if unknown (the stage may use the whole document)
+    :param stage:
+    :return:
+    """
+    inputs = _stage_inputs(stage)
+    if inputs is None or _WHOLE_DOCUMENT in inputs:
+        return None
+    return inputs
+
+
+def _stage_inputs(stage: Mapping[str, Any]) -> Optional[Set[str]]:
+    (name, spec), = stage.items()
+    if name == '$match':
+        return match_fields(spec)
+    if name == '$sort':
+        return {_root(key) for key in spec}
+    if name in ('$limit', '$skip'):
+        return set()
+    if name == '$project':
+        if _is_exclusion(spec):
+            return None
+        return {_root(key) for key, value in spec.items() if value in (1, True)} | field_refs(
+            [value for value in spec.values() if value not in (0, 1, True, False)]) | {'_id'}
+    if name == '$group':
+        return field_refs(spec)
+    if name == '$lookup':
+        return {_root(spec['localField'])} | field_refs(spec.get('let')) if 'localField' in spec else None
+    if name == '$unwind':
+        return field_refs(spec if isinstance(spec, str) else spec.get('path'))
+    return None
+
+
+def _is_exclusion(spec: Mapping[str, Any]) -> bool:
+    return all(value in (0, False) for key, value in spec.items() if key != '_id')
+
+
+def _stage_name(stage: Mapping[str, Any]) -> str:
+    return next(iter(stage))
+
+
+def optimize(stages: List[dict]) -> List[dict]:
+    """
+    move $match stages before $sort, $lookup, $unwind and inclusion $project stages which they don't depend on,
+    and project only the fields used by later stages before the first stage which reshapes documents
+    :param stages: pipeline stages
+    :return: optimized pipeline stages
+    """
+    stages = list(stages)
+    for index in range(1, len(stages)):
+        if _stage_name(stages[index]) != '$match':
+            continue
+        fields = match_fields(stages[index]['$match'])
+        position = index
+        while position > 0 and _can_pass(stages[position - 1], fields):
+            position -= 1
+        stages.insert(position, stages.pop(index))
+
+    start = next((index for index, stage in enumerate(stages) if _stage_name(stage) not in _KEEP_STAGES), None)
+    if start is None or _stage_name(stages[start]) == '$project':
+        return stages
+    needed = {'_id'}
+    for stage in stages[start:]:
+        inputs = stage_inputs(stage)
+        if inputs is None:
+            return stages
+        needed |= inputs
+        if _stage_name(stage) in ('$project', '$group'):
+            return stages[:start] + [{'$project': {key: 1 for key in sorted(needed)}}] + stages[start:]
+    return stages
+
+
+def _can_pass(
+    stage: Mapping[str, Any],
+    fields: Set[str]
+) -> bool:
+    """
+    whether a $match on fields can be moved before stage without changing the result
+    :param stage:
+    :param fields: top level fields of the $match
+    :return:
+    """
+    (name, spec), = stage.items()
+    if name in ('$sort', '$match'):
+        return True
+    if _WHOLE_DOCUMENT in fields:
+        return False
+    if name == '$lookup':
+        return _root(spec.get('as', '')) not in fields
+    if name == '$unwind':
+        if isinstance(spec, str):
+            return not (field_refs(spec) & fields)
+        return not ((field_refs(spec.get('path')) | {spec.get('includeArrayIndex')}) & fields)
+    if name == '$project' and not _is_exclusion(spec):
+        return all(spec.get(field) in (1, True) for field in fields)
+    return False
+
+
+class Pipeline:
+    def __init__(
+        self,
+        document_cls: type,
+        session: Optional[ClientSession] = None,
+        hydrate: Optional[bool] = None,
+        read_preference: Optional[Union[str, _ServerMode]] = None,
+        **kwargs: Any
+    ):
+        """
+        fluent aggregation pipeline of a document class, field names are checked against __schema__ until
+        a stage reshapes documents, then against the fields the stage outputs. e.g.
+            pipeline = User.aggregate().match(User.q.age > 10).group('$name', total={'$sum': 1}).sort('total', -1)
+            async for record in pipeline:
+                print(record._id, record.total)
+        :param document_cls: Document sub class
+        :param session: ClientSession instance for transaction operation
+        :param hydrate: yield document instances if True, Record if False,
+        default document instances if no stage reshapes documents
+        :param read_preference: read preference or mode name, default with the document class
+        :param kwargs: keyword arguments of motor collection aggregate()
+        """
+        self._document_cls = document_cls
+        self._session = session
+        self._hydrate = hydrate
+        self._read_preference = read_preference
+        self._kwargs = kwargs
+        self._stages: List[dict] = []
+        self._reshaped = False
+        # fields of documents after the last stage, None if unknown
+        self._fields: Optional[Set[str]] = set(document_cls.__validators__)
+
+    def _check(
+        self,
+        stage: str,
+        fields: Iterable[str]
+    ) -> None:
+        if self._fields is None:
+            return
+        unknown = sorted(set(fields) - self._fields - {_WHOLE_DOCUMENT})
+        if unknown:
+            raise AioMongoAttributeError(f'{self._document_cls.__name__!r} pipeline {stage} has unknown fields '
+                                         f'{unknown}.')
+
+    def _add(
+        self,
+        stage: dict
+    ) -> 'Pipeline':
+        self._stages.append(stage)
+        return self
+
+    def match(
+        self,
+        filters: Any
+    ) -> 'Pipeline':
+        """
+        $match stage, filters is a filter dict or a query expression, e.g. match(User.q.age > 10)
+        :param filters:
+        :return:
+        """
+        filters = to_filter(filters)
+        self._check('$match', match_fields(filters))
+        return self._add({'$match': filters})
+
+    def project(
+        self,
+        projection: Union[Mapping[str, Any], Sequence[str]]
+    ) -> 'Pipeline':
+        """
+        $project stage, a list of field names or a dict of inclusion, exclusion or computed fields
+        :param projection:
+        :return:
+        """
+        if not isinstance(projection, Mapping):
+            projection = {key: 1 for key in projection}
+        projection = dict(projection)
+        self._check('$project', stage_inputs({'$project': projection}) or
+                    {_root(key) for key in projection if key != '_id'})
+        if self._fields is not None:
+            if _is_exclusion(projection):
+                self._fields -= {key for key in projection}
+            else:
+                self._fields = {_root(key) for key, value in projection.items() if value not in (0, False)}
+                if projection.get('_id', 1) not in (0, False):
+                    self._fields.add('_id')
+        self._reshaped = True
+        return self._add({'$project': projection})
+
+    def group(
+        self,
+        _id: Any,
+        **accumulators: Mapping[str, Any]
+    ) -> 'Pipeline':
+        """
+        $group stage, e.g. group('$name', total={'$sum': 1}, age={'$avg': '$age'})
+        :param _id: group key expression
+        :param accumulators: output field -> accumulator expression
+        :return:
+        """
+        stage = {'_id': _id, **accumulators}
+        self._check('$group', field_refs(stage))
+        self._fields = {'_id', *accumulators}
+        self._reshaped = True
+        return self._add({'$group': stage})
+
+    def sort(
+        self,
+        key_or_list: Union[str, Sequence[Tuple[str, int]]],
+        direction: int = 1
+    ) -> 'Pipeline':
+        """
+        $sort stage, e.g. sort('age', -1) or sort([('name', 1), ('age', -1)])
+        :param key_or_list: a single key or a list of (key, direction) pairs
+        :param direction: sort direction if key_or_list is a single key
+        :return:
+        """
+        keys = [(key_or_list, direction)] if isinstance(key_or_list, str) else list(key_or_list)
+        self._check('$sort', {_root(key) for key, _ in keys})
+        return self._add({'$sort': dict(keys)})
+
+    def lookup(
+        self,
+        from_: Union[str, type],
+        local_field: str,
+        foreign_field: str,
+        as_: str
+    ) -> 'Pipeline':
+        """
+        $lookup stage, join documents of another collection or Document class into field as_
+        :param from_: collection name or Document sub class
+        :param local_field: field of this pipeline
+        :param foreign_field: field of the joined collection
+        :param as_: output array field
+        :return:
+        """
+        if isinstance(from_, type):
+            self._check_foreign(from_, foreign_field)
+            from_ = getattr(from_, '__collection_name__', from_.__name__.lower() + 's')
+        self._check('$lookup', {_root(local_field)})
+        if self._fields is not None:
+            self._fields.add(_root(as_))
+        self._reshaped = True
+        return self._add({'$lookup': {'from': from_, 'localField': local_field,
+                                      'foreignField': foreign_field, 'as': as_}})
+
+    @staticmethod
+    def _check_foreign(
+        document_cls: type,
+        field: str
+    ) -> None:
+        if _root(field) not in document_cls.__validators__:
+            raise AioMongoAttributeError(f'{document_cls.__name__!r} pipeline $lookup has unknown fields '
+                                         f'{[field]}.')
+
+    def unwind(
+        self,
+        path: str,
+        preserve_null_and_empty_arrays: bool = False
+    ) -> 'Pipeline':
+        """
+        $unwind stage, e.g. unwind('orders')
+        :param path: array field
+        :param preserve_null_and_empty_arrays: keep documents without elements
+        :return:
+        """
+        path = path[1:] if path.startswith('$') else path
+        self._check('$unwind', {_root(path)})
+        self._reshaped = True
+        if preserve_null_and_empty_arrays:
+            return self._add({'$unwind': {'path': f'${path}', 'preserveNullAndEmptyArrays': True}})
+        return self._add({'$unwind': f'${path}'})
+
+    def limit(
+        self,
+        limit: int
+    ) -> 'Pipeline':
+        return self._add({'$limit': limit})
+
+    def skip(
+        self,
+        skip: int
+    ) -> 'Pipeline':
+        return self._add({'$skip': skip})
+
+    def stage(
+        self,
+        stage: Mapping[str, Any]
+    ) -> 'Pipeline':
+        """
+        append a raw stage, fields of later stages are not checked anymore
+        :param stage: e.g. {'$addFields': {'adult': {'$gte': ['$age', 18]}}}
+        :return:
+        """
+        if len(stage) != 1:
+            raise AioMongoInvalidOperation('a pipeline stage must have exactly one key.')
+        self._fields = None
+        self._reshaped = True
+        return self._add(dict(stage))
+
+    def build(self) -> List[dict]:
+        """
+        optimized pipeline stages sent to mongodb
+        :return:
+        """
+        return optimize(self._stages)
+
+    async def stream(self) -> AsyncIterator:
+        """
+        stream results, document instances or Record, the server cursor is closed when the generator is closed
+        :return:
+        """
+        document_cls = self._document_cls
+        hydrate = not self._reshaped if self._hydrate is None else self._hydrate
+        pipeline = self.build()
+        leading = [stage for stage in pipeline[:2] if _stage_name(stage) in ('$match', '$sort')]
+        if leading:
+            document_cls._record_query('aggregate', leading[0].get('$match'),
+                                       list((leading[-1].get('$sort') or {}).items()) or None)
+        collection = document_cls.read_collection(self._read_preference)
+        cursor = collection.aggregate(pipeline, session=self._session, **self._kwargs)
+        try:
+            async for doc in cursor:
+                yield document_cls._from_db(doc, fill_defaults=not self._reshaped) if hydrate else Record(doc)
+        finally:
+            await cursor.close()
+
+    def __aiter__(self) -> AsyncIterator:
+        return self.stream()
+
+    async def to_list(
+        self,
+        length: Optional[int] = None
+    ) -> list:
+        """
+        get a list of results
+        :param length: maximum number of results, or None for all
+        :return:
+        """
+        result = []
+        if length is not None and length <= 0:
+            return result
+        stream = self.stream()
+        try:
+            async for doc in stream:
+                result.append(doc)
+                if length is not None and len(result) >= length:
+                    break
+        finally:
+            await stream.aclose()
+        return result
@@ -0,0 +1,253 @@
+"""
+name: cache
+author：kavinbj
+createdAt: 2022/8/5
+version: 1.0.0
+description:
+
+LRU/TTL cache for documents read by id, scoped globally or to a request
+"""
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import (
+    Any,
+    Callable,
+    Hashable,
+    Mapping,
+    Optional
+)
+
+# returned by cache get() if key not cached
+MISSING = object()
+
+cache_scope_list = ['global', 'request']
+
+# caches of the current request, DocumentCache -> LRUCache
+_request_caches = ContextVar('aio_mongo_dm_request_caches', default=None)
+
+
+@contextmanager
+def request_cache():
+    """
+    open a request scope for caches with scope 'request', caches are dropped when the scope exits, e.g.
+        with request_cache():
+            user = await User.find_by_id(user_id)
+            same_user = await User.find_by_id(user_id)
+            assert user is same_user
+    :return:
+    """
+    token = _request_caches.set({})
+    try:
+        yield
+    finally:
+        _request_caches.reset(token)
+
+
+class LRUCache:
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: Optional[float] = None,
+        timer: Callable[[], float] = time.monotonic
+    ):
+        """
+        least recently used cache with optional time to live
+        :param maxsize: max number of entries, the least recently used entry is evicted
+        :param ttl: seconds an entry is valid, None for no expiration
+        :param timer: clock of ttl
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._data: OrderedDict = OrderedDict()
+
+    def get(
+        self,
+        key: Hashable
+    ) -> Any:
+        """
+        get cached value, MISSING if not cached or expired
+        :param key:
+        :return:
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            return MISSING
+        expire_at, value = entry
+        if expire_at is not None and expire_at <= self._timer():
+            del self._data[key]
+            return MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any
+    ) -> None:
+        """
+        cache value, evict the least recently used entries above maxsize
+        :param key:
+        :param value:
+        :return:
+        """
+        expire_at = None if self.ttl is None else self._timer() + self.ttl
+        self._data[key] = (expire_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(
+        self,
+        key: Hashable
+    ) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class DocumentCache:
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: Optional[float] = None,
+        scope: str = 'global',
+        timer: Callable[[], float] = time.monotonic
+    ):
+        """
+        document cache of one Document class, with LRU eviction, ttl and hit/miss counters.
+        scope 'global' shares one LRUCache in the process, scope 'request' uses one LRUCache per request_cache()
+        scope and caches nothing outside of it.
+        :param maxsize: max number of cached documents
+        :param ttl: seconds a document is cached, None for no expiration
+        :param scope: 'global' or 'request'
+        :param timer: clock of ttl
+        """
+        if scope not in cache_scope_list:
+            raise ValueError(f'scope value not as {cache_scope_list}.')
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.scope = scope
+        self._timer = timer
+        self._global = LRUCache(maxsize, ttl, timer) if scope == 'global' else None
+        self.hits = 0
+        self.misses = 0
+
+    def _store(
+        self,
+        create: bool = True
+    ) -> Optional[LRUCache]:
+        """
+        LRUCache of the current scope, None outside of a request scope
+        :param create: create the LRUCache of the current request if not exist
+        :return:
+        """
+        if self._global is not None:
+            return self._global
+        caches = _request_caches.get()
+        if caches is None:
+            return None
+        store = caches.get(self)
+        if store is None and create:
+            store = caches[self] = LRUCache(self.maxsize, self.ttl, self._timer)
+        return store
+
+    def get(
+        self,
+        key: Hashable
+    ) -> Any:
+        """
+        get cached value, MISSING if not cached
+        :param key:
+        :return:
+        """
+        store = self._store(create=False)
+        value = MISSING if store is None else store.get(key)
+        if value is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any
+    ) -> None:
+        store = self._store()
+        if store is not None:
+            store.set(key, value)
+
+    def invalidate(
+        self,
+        key: Hashable
+    ) -> None:
+        store = self._store(create=False)
+        if store is not None:
+            store.pop(key)
+
+    def clear(self) -> None:
+        store = self._store(create=False)
+        if store is not None:
+            store.clear()
+
+    def __len__(self) -> int:
+        store = self._store(create=False)
+        return 0 if store is None else len(store)
+
+    @property
+    def stats(self) -> dict:
+        """
+        hit/miss counters and size of the current scope
+        :return:
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self)}
+
+
+def _normalize(
+    value: Any,
+    ordered: bool = True
+) -> Hashable:
+    """
+    hashable canonical form of a query part, key order of the top level filter and of operator dicts
+    is ignored, key order of other dicts is kept (it matters for an exact match of an embedded document),
+    scalars keep their type, so that True and 1 are different
+    :param value: query part
+    :param ordered: whether key order of a dict value matters
+    :return:
+    """
+    if isinstance(value, Mapping):
+        items = [(key, _normalize(item)) for key, item in value.items()]
+        if not ordered or all(str(key).startswith('$') for key in value):
+            items.sort(key=lambda item: str(item[0]))
+        return dict, tuple(items)
+    if isinstance(value, (list, tuple)):
+        return list, tuple(_normalize(item) for item in value)
+    try:
+        hash(value)
+    except TypeError:
+        return type(value), repr(value)
+    return type(value), value
+
+
+def query_key(
+    operation: str,
+    filters: Any = None,
+    **options: Any
+) -> Hashable:
+    """
+    cache key of a query, from the normalized filter and options such as projection, sort, skip, limit, e.g.
+        key = query_key('find_one', {'name': 'kavin', 'age': {'$gt': 1}}, sort=[('age', 1)])
+    :param operation: query operation, e.g. 'find', 'find_one', 'count'
+    :param filters: query filter
+    :param options: query options
+    :return:
+    """
+    return (operation, _normalize(filters, ordered=False),
+            tuple(sorted((key, _normalize(value)) for key, value in options.items() if value is not None)))
@@ -9,36 +9,244 @@ meta class, based on motor
 """
 
 import asyncio
-from asyncio.unix_events import _UnixSelectorEventLoop
+import os
+import threading
+import weakref
+from asyncio import AbstractEventLoop
 from motor.motor_asyncio import AsyncIOMotorClient
+from typing import (
+    Optional,
+    Dict,
+    List,
+    Tuple
+)
+
+
+def current_loop() -> Optional[AbstractEventLoop]:
+    """
+    the running event loop, None if called outside of a running loop
+    :return:
+    """
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
 
 
 class AioClient:
-    __clients = {}
+    # (client_name, url, loop) -> motor client
+    __clients: Dict[Tuple[str, Optional[str], Optional[AbstractEventLoop]], AsyncIOMotorClient] = {}
+    # client_name -> (url, kwargs), shared by the clients of all loops
+    __configs: Dict[str, Tuple[Optional[str], dict]] = {}
+    # clients inherited from the parent process -> (client_name, url), replaced on their next use
+    __inherited: Dict[int, Tuple[AsyncIOMotorClient, str, Optional[str]]] = {}
+    # closed clients -> (client_name, url, kwargs), replaced on their next use while a class is bound to them
+    __closed: Dict[int, Tuple[str, Optional[str], dict]] = {}
+    # pid of the process the cached clients belong to
+    __pid: int = os.getpid()
+    # incremented after every fork, cached collections of an older generation are resolved again
+    generation: int = 0
+    # guards the client registry and the collection caches of document classes against threads of other loops,
+    # reentrant as resolving a collection creates clients
+    lock: threading.RLock = threading.RLock()
 
     def __new__(
         cls,
         client_name: str = '__local__',
         url: str = None,
         cache: bool = True,
-        io_loop: _UnixSelectorEventLoop = None,
+        io_loop: AbstractEventLoop = None,
         **kwargs
     ) -> AsyncIOMotorClient:
         """
-        create motor client instance, cache with client_name
+        create motor client instance, cache with client_name, url and event loop.
+        a cached client is only returned for the loop it is bound to, for another loop a new client is created
+        with the same url and options
         :param client_name: cache name for motor client instance
-        :param url: mongodb url
+        :param url: mongodb url, default the url of client_name
         :param cache: whether to use cache client instance
-        :param io_loop: asyncio event loop
+        :param io_loop: asyncio event loop, default the running loop, outside of a running loop the client binds
+        to the loop of its first operation
         :param kwargs:
         :return: AsyncIOMotorClient instance
         """
+        if io_loop is None:
+            io_loop = current_loop()
+        cls.check_fork()
 
-        if client_name in cls.__clients and cache:
-            return cls.__clients[client_name]
-        else:
+        with cls.lock:
+            config = cls.__configs.get(client_name)
+            if url is None and config is not None:
+                url = config[0]
+            key = (client_name, url, io_loop)
+
+            if cache and key in cls.__clients:
+                return cls.__clients[key]
+            if cache and io_loop is None:
+                # outside of a running loop, the latest client of the name and url of any loop
+                for (name, _url, _), client in reversed(list(cls.__clients.items())):
+                    if name == client_name and _url == url:
+                        return client
+
+            if cache and config is not None and not kwargs and url == config[0]:
+                kwargs = config[1]
+            cls._prune()
+            # motor rejects an explicit io_loop None, without io_loop the client binds to the loop of its first
+            # operation
             if io_loop is None:
-                io_loop = asyncio.get_event_loop()
-            client = AsyncIOMotorClient(url, io_loop=io_loop, **kwargs)
-            cls.__clients[client_name] = client
+                client = AsyncIOMotorClient(url, **kwargs)
+            else:
+                client = AsyncIOMotorClient(url, io_loop=io_loop, **kwargs)
+            cls.__clients[key] = client
+            cls.__configs[client_name] = (url, kwargs)
             return client
+
+    @classmethod
+    def _prune(cls) -> None:
+        """
+        drop clients of closed loops
+        :return:
+        """
+        with cls.lock:
+            cls._drop([key for key in cls.__clients if key[2] is not None and key[2].is_closed()])
+
+    @classmethod
+    def _drop(
+        cls,
+        keys: List[Tuple[str, Optional[str], Optional[AbstractEventLoop]]]
+    ) -> None:
+        """
+        close and drop cached clients, cached collections of document classes on them are resolved again
+        :param keys: cache keys of the clients
+        :return:
+        """
+        with cls.lock:
+            for key in keys:
+                client = cls.__clients.pop(key)
+                client_name, url, _ = key
+                config = cls.__configs.get(client_name)
+                kwargs = config[1] if config is not None and config[0] == url else {}
+                cls.__closed[id(client)] = (client_name, url, kwargs)
+                weakref.finalize(client, cls.__closed.pop, id(client), None)
+                client.close()
+
+    @classmethod
+    def check_fork(cls) -> bool:
+        """
+        drop the clients inherited from the parent process, if the process has been forked since they were created.
+        called after every fork on platforms with os.register_at_fork, otherwise on the next client lookup
+        :return: whether clients were dropped
+        """
+        if os.getpid() == cls.__pid:
+            return False
+        # a thread of the parent may have held the lock at the fork, the child has only the forking thread
+        cls.lock = threading.RLock()
+        cls.__pid = os.getpid()
+        cls.generation += 1
+        # inherited clients share sockets and monitor threads with the parent, they are dropped without close,
+        # which would end the server sessions of the parent
+        for (client_name, url, _), client in cls.__clients.items():
+            cls.__inherited[id(client)] = (client, client_name, url)
+        cls.__clients = {}
+        return True
+
+    @classmethod
+    def is_inherited(
+        cls,
+        client: AsyncIOMotorClient
+    ) -> bool:
+        """
+        whether client was created by the parent process before a fork
+        :param client: motor client
+        :return:
+        """
+        inherited = cls.__inherited.get(id(client))
+        return inherited is not None and inherited[0] is client
+
+    @classmethod
+    def is_closed(
+        cls,
+        client: AsyncIOMotorClient
+    ) -> bool:
+        """
+        whether client was closed by close, close_all or because its loop was closed
+        :param client: motor client
+        :return:
+        """
+        return id(client) in cls.__closed
+
+    @classmethod
+    def for_loop(
+        cls,
+        client: AsyncIOMotorClient,
+        io_loop: Optional[AbstractEventLoop] = None
+    ) -> AsyncIOMotorClient:
+        """
+        the client of the same name and url as client, bound to io_loop
+        :param client: cached motor client
+        :param io_loop: asyncio event loop, default the running loop
+        :return: client itself if it is bound to io_loop or not cached,
+        a new client of this process if client is inherited from the parent process,
+        a new client with the same url and options if client is closed
+        """
+        io_loop = io_loop or current_loop()
+        cls.check_fork()
+        if cls.is_inherited(client):
+            _, client_name, url = cls.__inherited[id(client)]
+            return cls(client_name=client_name, url=url, io_loop=io_loop)
+        closed = cls.__closed.get(id(client))
+        if closed is not None:
+            client_name, url, kwargs = closed
+            return cls(client_name=client_name, url=url, io_loop=io_loop, **kwargs)
+        if io_loop is None:
+            return client
+        with cls.lock:
+            for (client_name, url, loop), cached in list(cls.__clients.items()):
+                if cached is client:
+                    if loop is io_loop:
+                        return client
+                    return cls(client_name=client_name, url=url, io_loop=io_loop)
+        return client
+
+    @classmethod
+    def clients(
+        cls,
+        io_loop: Optional[AbstractEventLoop] = None
+    ) -> List[AsyncIOMotorClient]:
+        """
+        cached clients, of io_loop if given
+        :param io_loop: asyncio event loop
+        :return:
+        """
+        with cls.lock:
+            return [client for (_, _, loop), client in cls.__clients.items() if io_loop is None or loop is io_loop]
+
+    @classmethod
+    def close(
+        cls,
+        io_loop: Optional[AbstractEventLoop] = None
+    ) -> None:
+        """
+        close and drop the cached clients of an event loop, e.g. when a worker thread stops its loop
+        :param io_loop: asyncio event loop, default the running loop,
+        called outside of a running loop, the clients created outside of a running loop
+        :return:
+        """
+        io_loop = io_loop or current_loop()
+        with cls.lock:
+            cls._drop([key for key in cls.__clients if key[2] is io_loop])
+
+    @classmethod
+    def close_all(cls) -> None:
+        """
+        close and drop all cached clients and their configuration
+        :return:
+        """
+        with cls.lock:
+            cls._drop(list(cls.__clients))
+            cls.__configs.clear()
+            cls.__inherited.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=AioClient.check_fork)
@@ -0,0 +1,124 @@
+"""
+name: coalescer
+author：kavinbj
+createdAt: 2022/8/3
+version: 1.0.0
+description:
+
+Write coalescer, merge concurrent save() of one document class into one bulk_write
+"""
+import asyncio
+import logging
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteError
+from pymongo import InsertOne, UpdateOne, ReplaceOne
+from asyncio import AbstractEventLoop
+from .client import current_loop
+from typing import (
+    Optional,
+    Union,
+    Dict,
+    List,
+    Tuple
+)
+
+logger = logging.getLogger(__name__)
+
+_WriteOp = Union[InsertOne, UpdateOne, ReplaceOne]
+
+
+class WriteCoalescer:
+    def __init__(
+        self,
+        document_cls: type,
+        max_delay: float = 0.002,
+        max_batch: int = 1000
+    ):
+        """
+        write operations submitted within max_delay seconds, or until max_batch operations are pending,
+        are sent as one unordered bulk_write. each submitter gets its own result or error.
+        operations are batched per event loop, a batch is written on the loop of its submitters.
+        :param document_cls: Document sub class
+        :param max_delay: max seconds an operation waits before its batch is written
+        :param max_batch: max number of operations in one batch
+        """
+        self._document_cls = document_cls
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        # event loop -> pending operations and their futures, timer handle of the loop
+        self._pending: Dict[AbstractEventLoop, List[Tuple[_WriteOp, asyncio.Future]]] = {}
+        self._handles: Dict[AbstractEventLoop, asyncio.TimerHandle] = {}
+        # number of bulk_write sent and operations written, for monitoring
+        self.batches = 0
+        self.operations = 0
+
+    async def submit(
+        self,
+        op: _WriteOp
+    ) -> None:
+        """
+        submit a write operation, return when its batch is written, raise WriteError of this operation if failed
+        :param op: write operation
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(loop, [])
+        pending.append((op, future))
+        if len(pending) >= self.max_batch:
+            self.flush(loop)
+        elif loop not in self._handles:
+            self._handles[loop] = loop.call_later(self.max_delay, self.flush, loop)
+        await future
+
+    def flush(
+        self,
+        loop: Optional[AbstractEventLoop] = None
+    ) -> None:
+        """
+        write pending operations now, those of another loop than the running one are written on their loop
+        :param loop: event loop of the operations, default all loops
+        :return:
+        """
+        running = current_loop()
+        for loop in [loop] if loop is not None else list(self._pending):
+            if loop is not running:
+                if not loop.is_closed():
+                    loop.call_soon_threadsafe(self.flush, loop)
+                continue
+            handle = self._handles.pop(loop, None)
+            if handle is not None:
+                handle.cancel()
+            batch = self._pending.pop(loop, None)
+            if batch:
+                asyncio.ensure_future(self._write(batch))
+
+    async def _write(
+        self,
+        batch: List[Tuple[_WriteOp, asyncio.Future]]
+    ) -> None:
+        """
+        write one batch with bulk_write, and resolve futures of the batch
+        :param batch: list of write operation and its future
+        :return:
+        """
+        self.batches += 1
+        self.operations += len(batch)
+        errors = {}
+        try:
+            await self._document_cls.aio_collection.bulk_write([op for op, _ in batch], ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details.get('writeErrors', []):
+                error_cls = DuplicateKeyError if write_error.get('code') == 11000 else WriteError
+                errors[write_error['index']] = error_cls(write_error.get('errmsg'), write_error.get('code'),
+                                                         write_error)
+        except Exception as e:
+            logger.warning(f'{self._document_cls.__name__} coalesced bulk_write of {len(batch)} operations failed.')
+            errors = dict.fromkeys(range(len(batch)), e)
+
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if index in errors:
+                future.set_exception(errors[index])
+            else:
+                future.set_result(None)
@@ -7,14 +7,36 @@ description:
 
 Descriptor for collection
 """
+from asyncio import AbstractEventLoop
 from motor.motor_asyncio import AsyncIOMotorCollection
-from .client import AioClient
-from .exceptions import AioMongoMissParameter
+from pymongo.errors import ConfigurationError
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name, _ServerMode
+from .client import AioClient, current_loop
+from .exceptions import AioMongoMissParameter, AioMongoInvalidOperation
 import logging
+from typing import (
+    Optional,
+    Union,
+    Any,
+    Callable,
+    Hashable,
+    Mapping,
+    Sequence
+)
 
 logger = logging.getLogger(__name__)
 
 
+# cached collections in the class dict of a document class
+_COLLECTION = '__aio_collection__'
+_RAW_COLLECTION = '__raw_collection__'
+_READ_COLLECTIONS = '__read_collections__'
+
+# class attributes the collection is resolved from, setting one of them drops the cached collections
+collection_attr_list = frozenset(['__aio_client__', '__client_name__', '__db_url__', '__db_name__',
+                                  '__collection_name__', '__collection_options__'])
+
+
 class AioCollection:
     def __init__(self):
         pass
@@ -32,25 +54,150 @@ class AioCollection:
         or use class method, Document.init_db(url=db_url)
         you can get db_name with attr "__db_name__" in document sub class
         you can get collection_name with attr "__collection_name__" in document sub class
+        you can get collection options with attr "__collection_options__" in document sub class
+        the motor collection is resolved once and cached per class and event loop, until one of these attributes is set,
+        the process is forked or clients are closed
         :param instance:
         :param owner:
         :return: motor aio collection
         """
         if instance is None:
-            _aio_client = getattr(owner, '__aio_client__', None)
-            _db_name = getattr(owner, '__db_name__', 'test')
-            _collection_name = getattr(owner, '__collection_name__', (owner.__name__.lower() + 's'))
+            loop = current_loop()
+            # event loop -> (fork generation, collection, client)
+            collections = owner.__dict__.get(_COLLECTION)
+            cached = collections.get(loop) if collections is not None else None
+            if not _is_current(cached):
+                with AioClient.lock:
+                    collections = owner.__dict__.get(_COLLECTION)
+                    if collections is None:
+                        collections = {}
+                        type.__setattr__(owner, _COLLECTION, collections)
+                    cached = collections.get(loop)
+                    if not _is_current(cached):
+                        for closed in [key for key in collections if key is not None and key.is_closed()]:
+                            del collections[closed]
+                        collection = self.resolve(owner, loop)
+                        cached = collections[loop] = (AioClient.generation, collection, collection.database.client)
+            return cached[1]
+        else:
+            return self
 
-            if _aio_client is None:
-                client_name = getattr(owner, '__client_name__', '__local__')
-                db_url = getattr(owner, '__db_url__', None)
+    @staticmethod
+    def resolve(
+        owner,
+        loop: Optional[AbstractEventLoop] = None
+    ) -> AsyncIOMotorCollection:
+        """
+        resolve the motor collection of a document class from its attributes,
+        with the client of the same name and url bound to loop, created by this process
+        :param owner: document class
+        :param loop: running event loop, None outside of a running loop
+        :return:
+        """
+        _aio_client = getattr(owner, '__aio_client__', None)
+        _db_name = getattr(owner, '__db_name__', 'test')
+        _collection_name = getattr(owner, '__collection_name__', (owner.__name__.lower() + 's'))
+        _collection_options = getattr(owner, '__collection_options__', None) or {}
 
-                if db_url is None:
-                    raise AioMongoMissParameter('miss db_url, you can define in class with attr "__db_url__", '
-                                                'or use method, Document.init_db(url=db_url)')
-                logger.info(f' Document not init, here use db_url = "{db_url}" and db = "{_db_name}" ')
-                _aio_client = AioClient(client_name=client_name, url=db_url, cache=True)
+        if _aio_client is None:
+            client_name = getattr(owner, '__client_name__', '__local__')
+            db_url = getattr(owner, '__db_url__', None)
 
-            return _aio_client[_db_name][_collection_name]
-        else:
-            return self
+            if db_url is None:
+                raise AioMongoMissParameter('miss db_url, you can define in class with attr "__db_url__", '
+                                            'or use method, Document.init_db(url=db_url)')
+            logger.info(f' Document not init, here use db_url = "{db_url}" and db = "{_db_name}" ')
+            _aio_client = AioClient(client_name=client_name, url=db_url, cache=True)
+        elif AioClient.is_inherited(_aio_client) or AioClient.is_closed(_aio_client):
+            # rebind the class which init_db bound to the client of the parent process or to a closed client
+            inherited, _aio_client = _aio_client, AioClient.for_loop(_aio_client, loop)
+            for cls in owner.__mro__:
+                if cls.__dict__.get('__aio_client__') is inherited:
+                    type.__setattr__(cls, '__aio_client__', _aio_client)
+                    break
+        elif loop is not None:
+            _aio_client = AioClient.for_loop(_aio_client, loop)
+
+        return _aio_client[_db_name].get_collection(_collection_name, **_collection_options)
+
+    @staticmethod
+    def invalidate(owner) -> None:
+        """
+        drop the cached collections of a document class and of its sub classes
+        :param owner: document class
+        :return:
+        """
+        classes = [owner]
+        with AioClient.lock:
+            while classes:
+                cls = classes.pop()
+                for key in (_COLLECTION, _RAW_COLLECTION, _READ_COLLECTIONS):
+                    if key in cls.__dict__:
+                        type.__delattr__(cls, key)
+                classes.extend(cls.__subclasses__())
+
+
+def _is_current(
+    cached: Optional[tuple]
+) -> bool:
+    """
+    whether a cached (fork generation, collection, client) can be used, its client is of this process and not closed
+    :param cached: cache entry, None if not cached
+    :return:
+    """
+    return cached is not None and cached[0] == AioClient.generation and not AioClient.is_closed(cached[2])
+
+
+def derived_collection(
+    owner,
+    attr: str,
+    collection: AsyncIOMotorCollection,
+    key: Hashable,
+    factory: Callable[[], AsyncIOMotorCollection]
+) -> AsyncIOMotorCollection:
+    """
+    collection derived from a resolved collection of a document class, e.g. with other options,
+    cached in the class dict per resolved collection (one per event loop) and key
+    :param owner: document class
+    :param attr: class attribute of the cache
+    :param collection: resolved collection, owner.aio_collection
+    :param key: key of the derived collection
+    :param factory: create the derived collection
+    :return:
+    """
+    derived = owner.__dict__.get(attr)
+    cached = derived.get((id(collection), key)) if derived is not None else None
+    if cached is None or cached[0] is not collection:
+        with AioClient.lock:
+            derived = owner.__dict__.get(attr)
+            if derived is None:
+                derived = {}
+                type.__setattr__(owner, attr, derived)
+            cached = derived.get((id(collection), key))
+            if cached is None or cached[0] is not collection:
+                # drop the collections derived from replaced collections, e.g. of closed loops or of the parent process
+                live = {id(resolved) for _, resolved, _ in owner.__dict__.get(_COLLECTION, {}).values()}
+                for stale in [stale for stale in derived if stale[0] not in live]:
+                    del derived[stale]
+                cached = derived[(id(collection), key)] = (collection, factory())
+    return cached[1]
+
+
+def read_preference(
+    mode: Union[str, _ServerMode],
+    max_staleness: int = -1,
+    tag_sets: Optional[Sequence[Mapping[str, Any]]] = None
+) -> _ServerMode:
+    """
+    pymongo read preference of a mode name, e.g. 'secondaryPreferred', a read preference instance is returned as is
+    :param mode: mode name of the connection string, or read preference instance
+    :param max_staleness: max replication lag of secondaries in seconds, -1 for no limit
+    :param tag_sets: tag sets of the eligible members, e.g. [{'dc': 'ny'}, {}]
+    :return:
+    """
+    if isinstance(mode, _ServerMode):
+        return mode
+    try:
+        return make_read_preference(read_pref_mode_from_name(mode), tag_sets and list(tag_sets), max_staleness)
+    except (ValueError, ConfigurationError) as e:
+        raise AioMongoInvalidOperation(f'invalid read preference {mode!r}: {e}')
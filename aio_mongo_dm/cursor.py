@@ -0,0 +1,382 @@
+"""
+name: cursor
+author：kavinbj
+createdAt: 2022/8/1
+version: 1.0.0
+description:
+
+Typed async cursor, yield document instances
+"""
+import asyncio
+from collections import deque
+from functools import partial
+from motor.core import ClientSession
+from pymongo.read_preferences import _ServerMode
+from motor.motor_asyncio import AsyncIOMotorCursor
+from .exceptions import AioMongoInvalidOperation
+from .cache import DocumentCache, MISSING, query_key
+from .query import to_filter
+from typing import (
+    Optional,
+    Union,
+    Any,
+    Callable,
+    List,
+    Mapping,
+    Sequence,
+    Tuple
+)
+
+# positional parameters of motor collection find()
+_FIND_ARGS = ('filter', 'projection', 'skip', 'limit', 'no_cursor_timeout', 'cursor_type', 'sort',
+              'allow_partial_results', 'oplog_replay', 'batch_size')
+
+# number of documents fetched and hydrated in one pass, if batch_size not set
+_DEFAULT_BATCH_LENGTH = 101
+
+
+def _hydrate(
+    document_cls: type,
+    lazy: bool,
+    fill_defaults: bool,
+    docs: List[Mapping[str, Any]]
+) -> list:
+    """
+    create document instances of one batch in one pass
+    :param document_cls: Document sub class
+    :param lazy: create lazy documents backed by RawBSONDocument
+    :param fill_defaults: fill default values for missing fields, False for a projected result
+    :param docs: documents returned by mongodb
+    :return:
+    """
+    if lazy:
+        from_raw = document_cls._from_raw
+        return [from_raw(doc) for doc in docs]
+    from_db = document_cls._from_db
+    return [from_db(doc, fill_defaults) for doc in docs]
+
+
+async def _prefetch_batches(
+    cursor: AsyncIOMotorCursor,
+    queue: asyncio.Queue,
+    length: int,
+    hydrate: Callable[[list], list]
+) -> None:
+    """
+    background task of a prefetching DocumentCursor, fetch and hydrate batches into the prefetch queue until
+    cursor exhausted, an empty batch marks the end, an exception is passed to the consumer.
+    the task holds no reference to the DocumentCursor, so an abandoned DocumentCursor is finalized and cancels it
+    :param cursor: motor cursor
+    :param queue: prefetch queue
+    :param length: number of documents of a batch
+    :param hydrate: create document instances of a batch
+    :return:
+    """
+    try:
+        while True:
+            docs = await cursor.to_list(length=length)
+            await queue.put(hydrate(docs))
+            if not docs:
+                return
+    except asyncio.CancelledError:
+        await cursor.close()
+        raise
+    except Exception as e:
+        await queue.put(e)
+
+
+class DocumentCursor:
+    def __init__(
+        self,
+        document_cls: type,
+        *args: Any,
+        session: Optional[ClientSession] = None,
+        lazy: bool = False,
+        read_preference: Optional[Union[str, _ServerMode]] = None,
+        **kwargs: Any
+    ):
+        """
+        cursor wrapper of motor cursor, which yields instances of document_cls.
+        the motor cursor is created on the first fetch, so options can be chained before, e.g.
+            cursor = User.find({'age': {'$gt': 10}}).sort('age').skip(10).limit(20)
+            async for user in cursor:
+                print(user.name)
+        :param document_cls: Document sub class
+        :param args: positional arguments of motor collection find()
+        :param session: ClientSession instance for transaction operation
+        :param lazy: yield lazy documents backed by RawBSONDocument
+        :param read_preference: read preference or mode name, default with the document class
+        :param kwargs: keyword arguments of motor collection find()
+        """
+        if len(args) > len(_FIND_ARGS):
+            raise TypeError(f'find() takes at most {len(_FIND_ARGS)} positional arguments')
+        kwargs.update(zip(_FIND_ARGS, args))
+        if 'filter' in kwargs:
+            kwargs['filter'] = to_filter(kwargs['filter'])
+
+        self._document_cls = document_cls
+        self._session = session
+        self._lazy = lazy
+        self._read_preference = read_preference
+        self._kwargs = kwargs
+        self._cursor = None
+        self._buffer = deque()
+        # number of batches prefetched in background, 0 for no prefetch
+        self._prefetch = 0
+        self._prefetch_queue = None
+        self._prefetch_task = None
+        self._exhausted = False
+
+    def _check_not_started(self):
+        if self._cursor is not None:
+            raise AioMongoInvalidOperation('cannot set options after executing query.')
+
+    def sort(
+        self,
+        key_or_list: Union[str, Sequence[Tuple[str, Union[int, str, Mapping[str, Any]]]]],
+        direction: Optional[Union[int, str]] = None
+    ) -> 'DocumentCursor':
+        """
+        sorts this cursor's results, e.g. cursor.sort('age', -1) or cursor.sort([('name', 1), ('age', -1)])
+        :param key_or_list: a single key or a list of (key, direction) pairs
+        :param direction: sort direction if key_or_list is a single key, default 1
+        :return:
+        """
+        self._check_not_started()
+        if isinstance(key_or_list, str):
+            self._kwargs['sort'] = [(key_or_list, 1 if direction is None else direction)]
+        else:
+            self._kwargs['sort'] = list(key_or_list)
+        return self
+
+    def skip(
+        self,
+        skip: int
+    ) -> 'DocumentCursor':
+        """
+        skips the first skip results of this cursor
+        :param skip: number of documents to skip
+        :return:
+        """
+        self._check_not_started()
+        self._kwargs['skip'] = skip
+        return self
+
+    def limit(
+        self,
+        limit: int
+    ) -> 'DocumentCursor':
+        """
+        limits the number of results to be returned by this cursor
+        :param limit: number of documents to return, 0 means no limit
+        :return:
+        """
+        self._check_not_started()
+        self._kwargs['limit'] = limit
+        return self
+
+    def batch_size(
+        self,
+        batch_size: int
+    ) -> 'DocumentCursor':
+        """
+        limits the number of documents returned in one batch, also the number of documents hydrated in one pass
+        :param batch_size: batch size
+        :return:
+        """
+        self._check_not_started()
+        self._kwargs['batch_size'] = batch_size
+        return self
+
+    def projection(
+        self,
+        projection: Union[Mapping[str, Any], Sequence[str]]
+    ) -> 'DocumentCursor':
+        """
+        fields to be returned, e.g. cursor.projection({'name': 1, 'age': 1})
+        :param projection: a list of field names or a dict specifying the fields to include or exclude
+        :return:
+        """
+        self._check_not_started()
+        self._kwargs['projection'] = projection
+        return self
+
+    def prefetch(
+        self,
+        batches: int = 1
+    ) -> 'DocumentCursor':
+        """
+        keep up to batches next batches fetched and hydrated in a background task, while the current batch
+        is consumed. The background task waits when the buffer is full. A cursor left before its end is released
+        by close(), by leaving async with, or when the cursor is garbage collected, e.g.
+            async with User.find({}).batch_size(500).prefetch(2) as cursor:
+                async for user in cursor:
+                    if await handle(user):
+                        break
+        :param batches: number of batches buffered, 0 for no prefetch
+        :return:
+        """
+        self._check_not_started()
+        if batches < 0:
+            raise ValueError('batches must be non-negative')
+        self._prefetch = batches
+        return self
+
+    @property
+    def cursor(self) -> AsyncIOMotorCursor:
+        """
+        the underlying motor cursor, created with the chained options on first access
+        :return:
+        """
+        if self._cursor is None:
+            document_cls = self._document_cls
+            document_cls._record_query('find', self._kwargs.get('filter'), self._kwargs.get('sort'))
+            collection = document_cls.read_collection(self._read_preference, self._lazy)
+            self._cursor = collection.find(session=self._session, **self._kwargs)
+        return self._cursor
+
+    @property
+    def alive(self) -> bool:
+        """
+        whether there may be more documents to yield
+        :return:
+        """
+        if self._buffer:
+            return True
+        return not self._exhausted and (self._cursor is None or self._cursor.alive)
+
+    def _hydrate(
+        self,
+        docs: List[Mapping[str, Any]]
+    ) -> list:
+        """
+        create document instances of one batch in one pass
+        :param docs: documents returned by mongodb
+        :return:
+        """
+        return _hydrate(self._document_cls, self._lazy, self._kwargs.get('projection') is None, docs)
+
+    def _batch_length(self) -> int:
+        return self._kwargs.get('batch_size') or _DEFAULT_BATCH_LENGTH
+
+    async def _fetch(self) -> None:
+        """
+        fetch next batch from DB or from the prefetch queue into buffer
+        :return:
+        """
+        if self._exhausted:
+            return
+
+        if not self._prefetch:
+            docs = await self.cursor.to_list(length=self._batch_length())
+            self._buffer.extend(self._hydrate(docs))
+            return
+
+        if self._prefetch_task is None:
+            self._prefetch_queue = asyncio.Queue(maxsize=self._prefetch)
+            hydrate = partial(_hydrate, self._document_cls, self._lazy, self._kwargs.get('projection') is None)
+            self._prefetch_task = asyncio.ensure_future(_prefetch_batches(
+                self.cursor, self._prefetch_queue, self._batch_length(), hydrate))
+
+        batch = await self._prefetch_queue.get()
+        if isinstance(batch, Exception):
+            self._exhausted = True
+            raise batch
+        if not batch:
+            self._exhausted = True
+        self._buffer.extend(batch)
+
+    def __aiter__(self) -> 'DocumentCursor':
+        return self
+
+    async def __aenter__(self) -> 'DocumentCursor':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
+    def __del__(self):
+        # an abandoned prefetching cursor cancels its background task, which closes the motor cursor
+        task = getattr(self, '_prefetch_task', None)
+        if task is not None and not task.done() and not task.get_loop().is_closed():
+            task.get_loop().call_soon_threadsafe(task.cancel)
+
+    async def __anext__(self):
+        if not self._buffer:
+            await self._fetch()
+            if not self._buffer:
+                raise StopAsyncIteration
+        return self._buffer.popleft()
+
+    async def to_list(
+        self,
+        length: Optional[int] = None
+    ) -> list:
+        """
+        get a list of document instances, e.g. users = await User.find({'name': 'kavin'}).to_list(100)
+        :param length: maximum number of documents to return, or None for all
+        :return:
+        """
+        buffer = self._buffer
+        if length is not None and length <= len(buffer):
+            return [buffer.popleft() for _ in range(length)]
+
+        cache = vars(self._document_cls).get('__query_cache__')
+        limit = self._kwargs.get('limit') or 0
+        if cache is not None and self._cursor is None and not self._exhausted and self._session is None and \
+                self._read_preference is None and (length is None or 0 < limit <= length):
+            return await self._cached_list(cache)
+
+        if self._prefetch:
+            result = []
+            while length is None or len(result) < length:
+                if not buffer:
+                    await self._fetch()
+                    if not buffer:
+                        break
+                result.append(buffer.popleft())
+            return result
+
+        result = list(buffer)
+        buffer.clear()
+        if self._exhausted:
+            return result
+        docs = await self.cursor.to_list(length=None if length is None else length - len(result))
+        result.extend(self._hydrate(docs))
+        return result
+
+    async def _cached_list(
+        self,
+        cache: DocumentCache
+    ) -> list:
+        """
+        whole result of this cursor through the query cache of the document class, the cursor is consumed
+        :param cache: query cache of the document class
+        :return:
+        """
+        document_cls = self._document_cls
+        document_cls._record_query('find', self._kwargs.get('filter'), self._kwargs.get('sort'))
+        options = dict(self._kwargs)
+        key = query_key('find', options.pop('filter', None), **options)
+        raws = cache.get(key)
+        if raws is MISSING:
+            raws = await document_cls.read_collection(lazy=True).find(**self._kwargs).to_list(length=None)
+            cache.set(key, raws)
+        self._exhausted = True
+        if not self._lazy:
+            decode_raw = document_cls._decode_raw
+            raws = [decode_raw(raw) for raw in raws]
+        return self._hydrate(raws)
+
+    async def close(self) -> None:
+        """
+        explicitly close / kill this cursor
+        :return:
+        """
+        self._buffer.clear()
+        self._exhausted = True
+        if self._prefetch_task is not None and not self._prefetch_task.done():
+            self._prefetch_task.cancel()
+            await asyncio.gather(self._prefetch_task, return_exceptions=True)
+        if self._cursor is not None:
+            await self._cursor.close()
@@ -6,19 +6,37 @@ version: 1.0.0
 description:
 
 """
+import asyncio
 import logging
 import reprlib
+import time
 from asyncio.unix_events import _UnixSelectorEventLoop
+import bson
 from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
 from datetime import datetime
 from abc import abstractmethod
-from .exceptions import AioMongoConnectError, AioMongoAttributeError, AioMongoDocumentDoesNotExist
+from .exceptions import AioMongoConnectError, AioMongoAttributeError, AioMongoDocumentDoesNotExist, \
+    AioMongoInvalidOperation, AioMongoMissParameter
 from .client import AioClient
 from .utils import func_call
-from .meta_base import MetaBase
-from .collections import AioCollection
+from .meta_base import MetaBase, document_registry
+from .collections import AioCollection, derived_collection, read_preference as make_read_preference
+from .cursor import DocumentCursor
+from .coalescer import WriteCoalescer
+from .loader import IdLoader
+from .cache import LRUCache, DocumentCache, MISSING, query_key
+from .scan import split_points, partition_filters, merge_cursors
+from .query import QueryDescriptor, to_filter
+from .aggregation import Pipeline
+from .advisor import QueryRecorder, scan_stage, index_diff
+from .pagination import sort_spec, key_values, encode_token, decode_token, seek_filter, index_matches, \
+    equality_fields
 from motor.core import ClientSession
-from motor.motor_asyncio import AsyncIOMotorCursor
+from pymongo import InsertOne, UpdateOne, ReplaceOne, IndexModel
+from pymongo.errors import BulkWriteError
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.read_preferences import _ServerMode
 from typing import (
     Optional,
     Union,
@@ -27,6 +45,11 @@ from typing import (
     Sequence,
     Tuple,
     Mapping,
+    List,
+    Hashable,
+    Callable,
+    Awaitable,
+    AsyncIterator,
     TypeVar
 )
 
@@ -34,12 +57,24 @@ _Document = TypeVar("_Document", bound="Document")
 
 logger = logging.getLogger(__name__)
 
+# maxWriteBatchSize of mongodb server since 3.6, max number of write operations in one bulk_write
+_MAX_WRITE_BATCH_SIZE = 100000
+
+# options of the createIndexes command, others are index options
+_INDEX_COMMAND_OPTIONS = ('maxTimeMS', 'commitQuorum', 'comment')
+# items of an index_information() entry which are not index options
+_INDEX_INFORMATION_ITEMS = ('key', 'v', 'ns')
+
 _ID = '_id'
 _DATA = '__doc_data__'
+_CHANGES = '__doc_changes__'
 
 
 class AbstractDocument(metaclass=MetaBase):
     __abstract__ = True
+    # compact instance layout: document data and change tracking live in slots, no instance __dict__.
+    # __doc_changes__ is None until the first write, then maps changed keys to True ($set) or False ($unset)
+    __slots__ = (_DATA, _CHANGES, '__weakref__')
 
     @abstractmethod
     def __getattr__(self, item):
@@ -84,6 +119,19 @@ class AbstractDocument(metaclass=MetaBase):
 
 class Document(AbstractDocument):
     aio_collection = AioCollection()
+    # query fields of __schema__, e.g. User.q.age > 30
+    q = QueryDescriptor()
+    # query result of find_one/find_by_id as RawBSONDocument, field decoded on first access
+    __lazy__ = False
+    # adopt query result without type check and copy
+    __trusted__ = False
+    # policy for query result fields not defined in __schema__, 'keep', 'drop' or 'raise'
+    __unknown_fields__ = 'raise'
+    # read preference of find, find_one, find_by_id, count and aggregate, e.g. 'secondaryPreferred',
+    # with max replication lag in seconds and tag sets of the eligible members, None for the collection default
+    __read_preference__ = None
+    __max_staleness__ = -1
+    __tag_sets__ = None
 
     @classmethod
     async def init_db(
@@ -92,6 +140,7 @@ class Document(AbstractDocument):
         db_name: str = 'test',
         client_name: str = '__local__',
         io_loop: _UnixSelectorEventLoop = None,
+        warm_up: Union[bool, int] = False,
         **kwargs
     ) -> AioClient:
         """
@@ -101,6 +150,8 @@ class Document(AbstractDocument):
         :param db_name: database name
         :param client_name: name for cache aio client
         :param io_loop: asyncio event loop
+        :param warm_up: open minPoolSize connections (or warm_up connections if int) and resolve the collections
+        of all sub classes before the first request
         :param kwargs:
         :return:
         """
@@ -108,18 +159,74 @@ class Document(AbstractDocument):
         setattr(cls, '__db_name__', db_name)
         setattr(cls, '__aio_client__', aio_client)
         await cls.check_health()
+        if warm_up:
+            await cls.warm_up(None if warm_up is True else warm_up)
         return aio_client
 
     @classmethod
-    async def check_health(cls):
+    async def warm_up(
+        cls,
+        connections: Optional[int] = None
+    ) -> int:
+        """
+        open pool connections with concurrent pings, so the first requests don't pay for tcp, tls and auth
+        handshakes, and resolve the collections of all defined sub classes of this class
+        :param connections: number of connections, default minPoolSize of the client, at least 1
+        :return: number of resolved collections
+        """
+        aio_client = cls.aio_collection.database.client
+        if connections is None:
+            connections = max(aio_client.options.pool_options.min_pool_size, 1)
+        await asyncio.gather(*(aio_client.admin.command('ping') for _ in range(connections)))
+
+        resolved = 0
+        for document_cls in list(document_registry.values()):
+            if issubclass(document_cls, cls):
+                try:
+                    document_cls.aio_collection
+                except AioMongoMissParameter:
+                    continue
+                resolved += 1
+        return resolved
+
+    @classmethod
+    async def check_health(
+        cls,
+        raise_error: bool = True
+    ) -> Optional[dict]:
+        """
+        check mongodb server health, e.g. for readiness probes
+        :param raise_error: raise AioMongoConnectError if the server is unreachable, otherwise return ok False
+        :return: None if no client is bound by init_db, else dict of
+        ok, latency (round trip of server_info in seconds), version, topology (e.g. 'ReplicaSetWithPrimary'),
+        servers, pool_size (maxPoolSize), min_pool_size, or error if not ok
+        """
         aio_client = getattr(cls, '__aio_client__', None)
-        if aio_client is not None:
-            try:
-                server_info = await aio_client.server_info()
-                logger.info(f'mongodb connecting '
-                            f'{"successful" if server_info and isinstance(server_info, dict) else "failed"}.')
-            except Exception:
+        if aio_client is None:
+            return None
+        aio_client = AioClient.for_loop(aio_client)
+        started_at = time.perf_counter()
+        try:
+            server_info = await aio_client.server_info()
+        except Exception as e:
+            logger.info('mongodb connecting failed.')
+            if raise_error:
                 raise AioMongoConnectError('mongodb connecting error.')
+            return {'ok': False, 'latency': time.perf_counter() - started_at, 'error': str(e)}
+        latency = time.perf_counter() - started_at
+        logger.info(f'mongodb connecting successful, {latency * 1000:.1f} ms.')
+
+        topology = aio_client.topology_description
+        pool_options = aio_client.options.pool_options
+        return {
+            'ok': True,
+            'latency': latency,
+            'version': server_info.get('version'),
+            'topology': topology.topology_type_name,
+            'servers': [f'{host}:{port}' for host, port in topology.server_descriptions()],
+            'pool_size': pool_options.max_pool_size,
+            'min_pool_size': pool_options.min_pool_size
+        }
 
     def check_key_value(
         self,
@@ -127,22 +234,18 @@ class Document(AbstractDocument):
         value: Any
     ) -> bool:
         """
-        check key and value type by __schema__ defined by document sub-class
+        check key and value type by __schema__ defined by document sub-class,
+        with the validators compiled by MetaBase
         :param key: field key
         :param value: field value
         :return:
         """
-        if key == '_id':
-            return True
-
-        if key not in self.__schema__:
+        validator = self.__validators__.get(key)
+        if validator is None:
             raise AioMongoAttributeError(f'{type(self).__name__!r} object has no attribute {key!r} definition.')
 
-        if not isinstance(value, self.__schema__[key]['type']):
-            raise AioMongoAttributeError(f'in {type(self).__name__!r}, '
-                                         f'{key!r} has not correct type {self.__schema__[key]["type"]}.')
-
-        return key in self.__schema__ and isinstance(value, self.__schema__[key]['type'])
+        validator(value)
+        return True
 
     def __getattr__(self, key):
         """
@@ -150,9 +253,12 @@ class Document(AbstractDocument):
         :param key:
         :return:
         """
+        _data = self.__doc_data__
         try:
-            return self[key]
+            return _data[key]
         except KeyError:
+            if type(_data) is not dict and key in self.__defaults__:
+                return self.__defaults__[key]
             raise AioMongoAttributeError(f'{type(self).__name__!r} object has no attribute {key!r}')
 
     def __setattr__(self, key, value):
@@ -178,10 +284,17 @@ class Document(AbstractDocument):
     def __getitem__(self, key):
         """
         get value by key value, e.g.  user['name']
+        a field missing in a lazy document reads as its schema default value, like a decoded document
         :param key:
         :return:
         """
-        return vars(self)[_DATA][key]
+        _data = self.__doc_data__
+        try:
+            return _data[key]
+        except KeyError:
+            if type(_data) is not dict and key in self.__defaults__:
+                return self.__defaults__[key]
+            raise
 
     def __setitem__(self, key, value):
         """
@@ -191,7 +304,11 @@ class Document(AbstractDocument):
         :return:
         """
         if self.check_key_value(key, value):
-            vars(self)[_DATA][key] = value
+            _data = self.__doc_data__
+            if type(_data) is not dict:
+                _data = self._materialize()
+            _data[key] = value
+            self._track(key, True)
 
     def __delitem__(self, key):
         """
@@ -199,7 +316,11 @@ class Document(AbstractDocument):
         :param key:
         :return:
         """
-        del vars(self)[_DATA][key]
+        _data = self.__doc_data__
+        if type(_data) is not dict:
+            _data = self._materialize()
+        del _data[key]
+        self._track(key, False)
 
     def __contains__(self, item):
         """
@@ -207,14 +328,14 @@ class Document(AbstractDocument):
         :param item:
         :return:
         """
-        return item in vars(self)[_DATA]
+        return item in self.__doc_data__
 
     def __iter__(self):
         """
         iterate item,  e.g.  for item in user:
         :return:
         """
-        return iter(vars(self)[_DATA])
+        return iter(self.__doc_data__)
 
     def __eq__(self, other) -> bool:
         """
@@ -224,14 +345,14 @@ class Document(AbstractDocument):
         """
         if not isinstance(other, type(self)):
             return NotImplemented
-        return vars(self)[_DATA] == vars(other)[_DATA]
+        return self._materialize() == other._materialize()
 
     def __len__(self) -> int:
         """
         return the number of items in the instance
         :return: int
         """
-        return len(vars(self)[_DATA])
+        return len(self.__doc_data__)
 
     def __repr__(self) -> str:
         """
@@ -239,29 +360,135 @@ class Document(AbstractDocument):
         :return:
         """
         name = type(self).__name__
-        repr_ = reprlib.repr(vars(self)[_DATA])
+        repr_ = reprlib.repr(self._materialize())
         return f'<{name}({repr_})>'
 
+    def _materialize(self) -> dict:
+        """
+        decode lazy RawBSONDocument data into a dict, which is kept as document data from now on,
+        default values are filled for missing fields
+        :return: document data dict
+        """
+        _data = self.__doc_data__
+        if type(_data) is not dict:
+            _data = type(self)._decode_raw(_data)
+            for key, value in self.__defaults__.items():
+                if key not in _data:
+                    _data[key] = value
+            object.__setattr__(self, _DATA, _data)
+        return _data
+
+    def mark_changed(
+        self,
+        key: str
+    ) -> None:
+        """
+        mark a field as changed, e.g. after an in-place modification such as user.tags.append('vip'),
+        which can not be tracked by __setitem__
+        :param key: field key
+        :return:
+        """
+        if key not in self:
+            raise AioMongoAttributeError(f'{type(self).__name__!r} object has no attribute {key!r}')
+        self._track(key, True)
+
+    def _track(
+        self,
+        key: str,
+        changed: bool
+    ) -> None:
+        """
+        record a changed (True) or removed (False) key, the change dict is only created on the first write
+        :param key: field key
+        :param changed: True if the key is set, False if it is removed
+        :return:
+        """
+        _changes = self.__doc_changes__
+        if _changes is None:
+            object.__setattr__(self, _CHANGES, {key: changed})
+        else:
+            _changes[key] = changed
+
+    def get_changes(self) -> dict:
+        """
+        return the update document of fields changed or removed since the last save/load, e.g.
+         {'$set': {'age': 31}, '$unset': {'sex': ''}}
+        empty dict if nothing changed.
+        fields given on creation of a new document, without '_id', are not tracked, save() inserts it whole
+        :return:
+        """
+        _changes = self.__doc_changes__
+        if not _changes:
+            return {}
+        _data = self.__doc_data__
+        update = {}
+        _set = {key: _data[key] for key, changed in _changes.items() if changed and key != _ID}
+        if _set:
+            update['$set'] = _set
+        _unset = {key: '' for key, changed in _changes.items() if not changed and key != _ID}
+        if _unset:
+            update['$unset'] = _unset
+        return update
+
+    def clear_changes(self) -> None:
+        """
+        forget all tracked changes, the instance is considered in sync with DB
+        :return:
+        """
+        object.__setattr__(self, _CHANGES, None)
+
     async def save(
         self,
         session: Optional[ClientSession] = None,
+        replace: bool = False,
         **kwargs
     ) -> _Document:
         """
         save document to DB
+        a new document is inserted, an existing document is updated with $set/$unset of changed fields only,
+        nothing is sent if no field changed.
+        if write coalescing is enabled for the class, and no session or kwargs given, the write is sent in a
+        bulk_write together with concurrent saves.
         :param session: ClientSession instance for transaction operation
+        :param replace: replace the whole document instead of updating changed fields
         :param kwargs:
         :return:
         """
+        coalescer = vars(type(self)).get('__write_coalescer__')
+        if coalescer is not None and session is None and not kwargs:
+            await func_call(self.pre_save)
+            op = self._get_write_op(replace)
+            if op is not None:
+                try:
+                    await coalescer.submit(op)
+                except Exception:
+                    if isinstance(op, InsertOne):
+                        del self.__doc_data__[_ID]
+                    raise
+                type(self)._invalidate_cache(self[_ID])
+            self.clear_changes()
+            await func_call(self.after_save)
+            return self
+
         if _ID not in self:
             await func_call(self.pre_save)
-            result = await type(self).aio_collection.insert_one(vars(self)[_DATA], session=session, **kwargs)
-            vars(self)[_DATA][_ID] = result.inserted_id
+            result = await type(self).aio_collection.insert_one(self.__doc_data__, session=session, **kwargs)
+            self.__doc_data__[_ID] = result.inserted_id
+            type(self)._invalidate_cache(result.inserted_id)
+            self.clear_changes()
             await func_call(self.after_save)
             return self
         else:
             await func_call(self.pre_save)
-            await type(self).aio_collection.replace_one({_ID: self[_ID]}, vars(self)[_DATA], session=session, **kwargs)
+            if replace:
+                await type(self).aio_collection.replace_one({_ID: self[_ID]}, self.__doc_data__,
+                                                            session=session, **kwargs)
+            else:
+                update = self.get_changes()
+                if update:
+                    await type(self).aio_collection.update_one({_ID: self[_ID]}, update, session=session, **kwargs)
+            type(self)._invalidate_cache(self[_ID])
+            self.clear_changes()
             await func_call(self.after_save)
             return self
 
@@ -286,6 +513,127 @@ class Document(AbstractDocument):
         """
         pass
 
+    @classmethod
+    def enable_coalescing(
+        cls,
+        max_delay: float = 0.002,
+        max_batch: int = 1000
+    ) -> WriteCoalescer:
+        """
+        merge concurrent save() of this class, without session, into one unordered bulk_write.
+        writes submitted within max_delay seconds, or until max_batch writes are pending, are sent together.
+        every save() still returns or raises with its own result, e.g. DuplicateKeyError.
+        :param max_delay: max seconds a write waits before its batch is sent
+        :param max_batch: max number of writes in one bulk_write
+        :return:
+        """
+        coalescer = WriteCoalescer(cls, max_delay=max_delay, max_batch=max_batch)
+        setattr(cls, '__write_coalescer__', coalescer)
+        return coalescer
+
+    @classmethod
+    def disable_coalescing(cls) -> None:
+        """
+        stop merging save() of this class, pending writes are sent now
+        :return:
+        """
+        coalescer = vars(cls).get('__write_coalescer__')
+        if coalescer is not None:
+            coalescer.flush()
+            delattr(cls, '__write_coalescer__')
+
+    def _get_write_op(
+        self,
+        replace: bool = False
+    ) -> Optional[Union[InsertOne, UpdateOne, ReplaceOne]]:
+        """
+        bulk write operation which saves this document, a new document gets its '_id' here.
+        None if the document exists and nothing changed
+        :param replace: replace the whole document instead of updating changed fields
+        :return:
+        """
+        _data = self.__doc_data__
+        if _ID not in _data:
+            _data = self._materialize()
+            _data[_ID] = ObjectId()
+            return InsertOne(_data)
+        if replace:
+            return ReplaceOne({_ID: _data[_ID]}, _data)
+        update = self.get_changes()
+        if update:
+            return UpdateOne({_ID: _data[_ID]}, update)
+        return None
+
+    @classmethod
+    async def save_many(
+        cls,
+        docs: Sequence[_Document],
+        ordered: bool = False,
+        session: Optional[ClientSession] = None,
+        replace: bool = False,
+        batch_size: int = _MAX_WRITE_BATCH_SIZE,
+        **kwargs
+    ) -> List[_Document]:
+        """
+        save many documents to DB with bulk_write, new documents are inserted, existing documents are updated
+        with changed fields. docs are written in chunks of batch_size, one bulk_write per chunk,
+        pre_save hooks of a chunk run before its bulk_write, after_save hooks after it.
+        If a write fails, the error (e.g. BulkWriteError) is raised, the failed or not executed new documents
+        have no '_id', changes of failed or not executed existing documents are kept.
+        e.g.
+            users = [User(name=f'user{i}') for i in range(10000)]
+            await User.save_many(users)
+        :param docs: document instances of this class
+        :param ordered: perform the writes in order and stop at the first error
+        :param session: ClientSession instance for transaction operation
+        :param replace: replace the whole existing documents instead of updating changed fields
+        :param batch_size: max number of documents written in one bulk_write
+        :param kwargs: keyword arguments of motor collection bulk_write()
+        :return: docs
+        """
+        docs = list(docs)
+        for start in range(0, len(docs), batch_size):
+            chunk = docs[start:start + batch_size]
+            for doc in chunk:
+                await func_call(doc.pre_save)
+
+            ops = []
+            op_docs = []
+            for doc in chunk:
+                op = doc._get_write_op(replace)
+                if op is not None:
+                    ops.append(op)
+                    op_docs.append(doc)
+
+            failed = set()
+            error = None
+            if ops:
+                try:
+                    await cls.aio_collection.bulk_write(ops, ordered=ordered, session=session, **kwargs)
+                except BulkWriteError as e:
+                    error = e
+                    failed = {write_error['index'] for write_error in e.details.get('writeErrors', [])}
+                    if ordered and failed:
+                        failed = set(range(min(failed), len(ops)))
+                except Exception as e:
+                    error = e
+                    failed = set(range(len(ops)))
+
+            for index, (op, doc) in enumerate(zip(ops, op_docs)):
+                if index in failed:
+                    if isinstance(op, InsertOne):
+                        del doc.__doc_data__[_ID]
+                else:
+                    doc.clear_changes()
+            if op_docs:
+                cls._invalidate_cache(*(doc[_ID] for doc in op_docs if _ID in doc))
+            if error is not None:
+                raise error
+
+            for doc in chunk:
+                await func_call(doc.after_save)
+        return docs
+
     async def delete(
         self,
         session: Optional[ClientSession] = None
@@ -299,6 +647,7 @@ class Document(AbstractDocument):
             raise AioMongoDocumentDoesNotExist('document not saved.')
 
         result = await type(self).aio_collection.delete_one({_ID: self[_ID]}, session=session)
+        type(self)._invalidate_cache(self[_ID])
         if result:
             del self[_ID]
 
@@ -307,15 +656,22 @@ class Document(AbstractDocument):
         session: Optional[ClientSession] = None
     ) -> _Document:
         """
-        return document instance from DB
+        return document instance from DB, read from the primary, also on a cache miss
         :param session: ClientSession instance for transaction operation
         :return:
         """
         if _ID not in self:
             raise AioMongoDocumentDoesNotExist('document not exist.')
 
-        res = await type(self).aio_collection.find_one({_ID: self[_ID]}, session=session)
-        vars(self)[_DATA] = res
+        cls = type(self)
+        cache = vars(cls).get('__id_cache__')
+        if cache is not None and session is None and cache.scope == 'global':
+            raw = await cls._cached_raw_by_id(cache, self[_ID], primary=True)
+            res = None if raw is None else cls._decode_raw(raw)
+        else:
+            res = await cls.aio_collection.find_one({_ID: self[_ID]}, session=session)
+        object.__setattr__(self, _DATA, res)
+        self.clear_changes()
         return self
 
     @classmethod
@@ -334,31 +690,428 @@ class Document(AbstractDocument):
         if obj is None or not isinstance(obj, dict):
             return None
 
+        cls.validate_data(obj)
         _instance = cls.__call__(**kwargs)
-        for key in obj:
-            _instance[key] = obj[key]
+        _instance.__doc_data__.update(obj)
+        if _ID in _instance.__doc_data__:
+            for key in obj:
+                _instance._track(key, True)
         return _instance
 
+    @classmethod
+    def _adopt(
+        cls,
+        data: Mapping[str, Any]
+    ) -> _Document:
+        """
+        create a document instance which takes data as its document data, without validation, copy or default value
+        :param data: dict or RawBSONDocument returned by mongodb
+        :return:
+        """
+        _instance = object.__new__(cls)
+        object.__setattr__(_instance, _DATA, data)
+        object.__setattr__(_instance, _CHANGES, None)
+        return _instance
+
+    @classmethod
+    def _from_raw(
+        cls,
+        obj: Optional[RawBSONDocument]
+    ) -> Optional[_Document]:
+        """
+        create a lazy document instance from a RawBSONDocument DB result
+        :param obj: RawBSONDocument returned by mongodb
+        :return:
+        """
+        if obj is None:
+            return None
+        return cls._adopt(obj)
+
+    @classmethod
+    def _lazy_collection(cls) -> AsyncIOMotorCollection:
+        """
+        aio collection which returns RawBSONDocument
+        :return:
+        """
+        collection = cls.aio_collection
+        return derived_collection(cls, '__raw_collection__', collection, None, lambda: collection.with_options(
+            codec_options=collection.codec_options.with_options(document_class=RawBSONDocument)))
+
+    @classmethod
+    def read_collection(
+        cls,
+        read_preference: Optional[Union[str, _ServerMode]] = None,
+        lazy: bool = False
+    ) -> AsyncIOMotorCollection:
+        """
+        aio collection of reads, with the read preference of the call or the class attribute __read_preference__,
+        __max_staleness__ and __tag_sets__. collections are cached per read preference
+        :param read_preference: read preference or mode name, e.g. ReadPreference.NEAREST or 'secondary',
+        default the class read preference
+        :param lazy: collection which returns RawBSONDocument
+        :return:
+        """
+        if read_preference is None:
+            read_preference = cls.__read_preference__
+            if read_preference is None:
+                return cls._lazy_collection() if lazy else cls.aio_collection
+            max_staleness, tag_sets = cls.__max_staleness__, cls.__tag_sets__
+        else:
+            max_staleness, tag_sets = -1, None
+
+        collection = cls.aio_collection
+        base = cls._lazy_collection() if lazy else collection
+        return derived_collection(
+            cls, '__read_collections__', collection, (lazy, repr(read_preference), max_staleness, repr(tag_sets)),
+            lambda: base.with_options(read_preference=make_read_preference(read_preference, max_staleness, tag_sets)))
+
+    @classmethod
+    def _from_db(
+        cls,
+        obj: Optional[dict],
+        fill_defaults: bool = True
+    ) -> Optional[_Document]:
+        """
+        create a document instance from a DB result, the instance takes obj as its document data and starts
+        without tracked changes.
+        fields are type checked unless class attribute __trusted__ is True,
+        fields not defined in __schema__ are handled with class attribute __unknown_fields__,
+        default values are filled for missing fields.
+        :param obj: document returned by mongodb
+        :param fill_defaults: fill default values for missing fields, False for a projected result
+        :return:
+        """
+        if obj is None:
+            return None
+
+        trusted = cls.__trusted__
+        policy = cls.__unknown_fields__
+        if not trusted or policy != 'keep':
+            validators = cls.__validators__
+            unknown = [key for key in obj if key not in validators]
+            if unknown:
+                if policy == 'raise':
+                    raise AioMongoAttributeError(f'{cls.__name__!r} object has no attribute '
+                                                 f'{unknown[0]!r} definition.')
+                if policy == 'drop':
+                    for key in unknown:
+                        del obj[key]
+            if not trusted:
+                for key, value in obj.items():
+                    validator = validators.get(key)
+                    if validator is not None:
+                        validator(value)
+
+        if fill_defaults:
+            for key, value in cls.__defaults__.items():
+                if key not in obj:
+                    obj[key] = value
+
+        return cls._adopt(obj)
+
     @classmethod
     async def find_by_id(
         cls,
         oid: Union[str, ObjectId],
-        session: Optional[ClientSession] = None
+        session: Optional[ClientSession] = None,
+        lazy: Optional[bool] = None,
+        read_preference: Optional[Union[str, _ServerMode]] = None
     ) -> Optional[_Document]:
         """
         document query based on document ID
+        if cache is enabled for the class, and no session or read_preference given, the document is read through
+        the cache.
+        if batch loading is enabled for the class, and no session or read_preference given, the query is merged
+        with concurrent find_by_id of the same event loop tick.
         :param oid: document ID
         :param session: ClientSession instance for transaction operation
+        :param lazy: return a lazy document backed by RawBSONDocument, default with class attribute __lazy__
+        :param read_preference: read preference of this query, default with class attribute __read_preference__
         :return:
         """
         if oid is None or oid == '':
             return None
+        if lazy is None:
+            lazy = cls.__lazy__
+        cls._record_query('find_by_id', {_ID: oid})
         try:
-            result = await cls.aio_collection.find_one({_ID: ObjectId(oid)}, session=session)
-            return cls.create_instance(result)
+            if session is None and read_preference is None:
+                cache = vars(cls).get('__id_cache__')
+                if cache is not None:
+                    return await cls._find_by_id_cached(cache, ObjectId(oid), lazy)
+                loader = vars(cls).get('__id_loader__')
+                if loader is not None:
+                    return await loader.load(ObjectId(oid), lazy)
+            collection = cls.read_collection(read_preference, lazy)
+            result = await collection.find_one({_ID: ObjectId(oid)}, session=session)
+            if lazy:
+                return cls._from_raw(result)
+            return cls._from_db(result)
         except Exception as e:
             raise AioMongoDocumentDoesNotExist(str(e))
 
+    @classmethod
+    def _decode_raw(
+        cls,
+        raw: RawBSONDocument
+    ) -> dict:
+        """
+        decode RawBSONDocument into a dict, with codec options of the collection
+        :param raw:
+        :return:
+        """
+        return bson.decode(raw.raw, codec_options=cls.aio_collection.codec_options)
+
+    @classmethod
+    async def _cached_raw_by_id(
+        cls,
+        cache: DocumentCache,
+        oid: ObjectId,
+        primary: bool = False
+    ) -> Optional[RawBSONDocument]:
+        """
+        read a document by id as RawBSONDocument through the cache, with batch loading if enabled
+        :param cache: cache of this class
+        :param oid: document ID
+        :param primary: read a miss from the primary, instead of with the class read preference
+        :return:
+        """
+        raw = cache.get(oid)
+        if raw is MISSING:
+            loader = vars(cls).get('__id_loader__')
+            if primary:
+                raw = await cls._lazy_collection().find_one({_ID: oid})
+            elif loader is not None:
+                raw = await loader.load_raw(oid)
+            else:
+                raw = await cls.read_collection(lazy=True).find_one({_ID: oid})
+            if raw is not None:
+                cache.set(oid, raw)
+        return raw
+
+    @classmethod
+    async def _find_by_id_cached(
+        cls,
+        cache: DocumentCache,
+        oid: ObjectId,
+        lazy: bool
+    ) -> Optional[_Document]:
+        """
+        find_by_id through the cache. scope 'global' caches RawBSONDocument and returns a new instance per call,
+        scope 'request' caches the instance, the same instance is returned in the request (identity map).
+        :param cache: cache of this class
+        :param oid: document ID
+        :param lazy: return a lazy document backed by RawBSONDocument
+        :return:
+        """
+        if cache.scope == 'request':
+            doc = cache.get(oid)
+            if doc is MISSING:
+                loader = vars(cls).get('__id_loader__')
+                if loader is not None:
+                    doc = await loader.load(oid, lazy)
+                elif lazy:
+                    doc = cls._from_raw(await cls.read_collection(lazy=True).find_one({_ID: oid}))
+                else:
+                    doc = cls._from_db(await cls.read_collection().find_one({_ID: oid}))
+                if doc is not None:
+                    cache.set(oid, doc)
+            return doc
+
+        raw = await cls._cached_raw_by_id(cache, oid)
+        if raw is None:
+            return None
+        if lazy:
+            return cls._from_raw(raw)
+        return cls._from_db(cls._decode_raw(raw))
+
+    @classmethod
+    def _invalidate_cache(
+        cls,
+        *oids: ObjectId
+    ) -> None:
+        """
+        drop cached documents written or deleted through this class, and all cached query results of this class
+        :param oids: document IDs
+        :return:
+        """
+        cache = vars(cls).get('__id_cache__')
+        if cache is not None:
+            for oid in oids:
+                cache.invalidate(oid)
+        query_cache = vars(cls).get('__query_cache__')
+        if query_cache is not None:
+            query_cache.clear()
+
+    @classmethod
+    def enable_cache(
+        cls,
+        maxsize: int = 1024,
+        ttl: Optional[float] = None,
+        scope: str = 'global'
+    ) -> DocumentCache:
+        """
+        cache documents of this class read by find_by_id/refresh without session, with LRU eviction and ttl.
+        save/save_many/delete/delete_by_id invalidate the cached documents.
+        scope 'global' is shared in the process, scope 'request' is an identity map of one request_cache() scope.
+        e.g.
+            cache = User.enable_cache(maxsize=10000, ttl=60)
+            user = await User.find_by_id(user_id)
+            print(cache.stats)
+        :param maxsize: max number of cached documents
+        :param ttl: seconds a document is cached, None for no expiration
+        :param scope: 'global' or 'request'
+        :return:
+        """
+        cache = DocumentCache(maxsize=maxsize, ttl=ttl, scope=scope)
+        setattr(cls, '__id_cache__', cache)
+        return cache
+
+    @classmethod
+    def disable_cache(cls) -> None:
+        """
+        stop caching documents of this class
+        :return:
+        """
+        if '__id_cache__' in vars(cls):
+            delattr(cls, '__id_cache__')
+
+    @classmethod
+    def enable_query_cache(
+        cls,
+        maxsize: int = 1024,
+        ttl: Optional[float] = None
+    ) -> DocumentCache:
+        """
+        cache results of find_one, count and cursor to_list of this class without session, keyed by the normalized
+        filter, projection, sort, skip and limit, with LRU eviction and ttl.
+        writes through this class clear all cached results of the class, use watch_invalidation() for writes
+        of other clients. e.g.
+            cache = User.enable_query_cache(maxsize=1000, ttl=10)
+            count = await User.count({'name': 'kavin'})
+        :param maxsize: max number of cached results
+        :param ttl: seconds a result is cached, None for no expiration
+        :return:
+        """
+        cache = DocumentCache(maxsize=maxsize, ttl=ttl)
+        setattr(cls, '__query_cache__', cache)
+        return cache
+
+    @classmethod
+    def disable_query_cache(cls) -> None:
+        """
+        stop caching query results of this class
+        :return:
+        """
+        if '__query_cache__' in vars(cls):
+            delattr(cls, '__query_cache__')
+
+    @classmethod
+    def watch_invalidation(cls) -> asyncio.Task:
+        """
+        start a task watching the change stream of the collection, which invalidates cached documents and
+        query results of this class on every change, also by other clients. change stream needs replica set.
+        cancel the returned task to stop watching.
+        :return:
+        """
+        async def watch():
+            try:
+                async with cls.aio_collection.watch() as stream:
+                    async for change in stream:
+                        document_key = change.get('documentKey') or {}
+                        cls._invalidate_cache(*([document_key[_ID]] if _ID in document_key else []))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f'{cls.__name__} change stream invalidation stopped, {e!r}.')
+
+        return asyncio.ensure_future(watch())
+
+    @classmethod
+    def enable_query_recording(cls) -> QueryRecorder:
+        """
+        count the shapes of queries sent by find, find_one, count, find_by_id, delete_by_id and aggregate of this
+        class, for index_report(). e.g.
+            User.enable_query_recording()
+            ...
+            for item in await User.index_report():
+                print(item['shape'], item['count'], item['status'], item['suggestion'])
+        :return:
+        """
+        recorder = QueryRecorder()
+        setattr(cls, '__query_recorder__', recorder)
+        return recorder
+
+    @classmethod
+    def disable_query_recording(cls) -> None:
+        """
+        stop recording query shapes of this class
+        :return:
+        """
+        if '__query_recorder__' in vars(cls):
+            delattr(cls, '__query_recorder__')
+
+    @classmethod
+    def _record_query(
+        cls,
+        operation: str,
+        filters: Optional[Any] = None,
+        sort: Optional[Any] = None
+    ) -> None:
+        recorder = vars(cls).get('__query_recorder__')
+        if recorder is not None:
+            recorder.record(operation, filters, sort)
+
+    @classmethod
+    async def index_report(
+        cls,
+        explain: bool = False
+    ) -> List[dict]:
+        """
+        compare recorded query shapes with the indexes of the collection, most frequent shape first.
+        each item has shape, count, operations, status ('indexed', 'partial' or 'unindexed'), index (best index name),
+        plan (scan stage of explain) and suggestion (compound index by the equality, sort, range rule)
+        :param explain: run explain of a sample query of every shape, a COLLSCAN plan is reported as unindexed
+        :return:
+        """
+        recorder = vars(cls).get('__query_recorder__')
+        if recorder is None:
+            raise AioMongoInvalidOperation(f'query recording of {cls.__name__} not enabled.')
+        plans = {}
+        if explain:
+            for shape, (filters, sort) in list(recorder.samples.items()):
+                cursor = cls.aio_collection.find(filters or {}, sort=sort or None)
+                plans[shape] = scan_stage(await cursor.explain())
+        return recorder.report(await cls.get_index_infor(), plans)
+
+    @classmethod
+    def enable_batch_loading(
+        cls,
+        max_batch: int = 1000
+    ) -> IdLoader:
+        """
+        merge find_by_id of this class, without session, awaited in the same event loop tick into one
+        find({'_id': {'$in': [...]}}), repeated ids are fetched once, e.g.
+            User.enable_batch_loading()
+            users = await asyncio.gather(*[User.find_by_id(order.user_id) for order in orders])
+        :param max_batch: max number of ids in one query
+        :return:
+        """
+        loader = IdLoader(cls, max_batch=max_batch)
+        setattr(cls, '__id_loader__', loader)
+        return loader
+
+    @classmethod
+    def disable_batch_loading(cls) -> None:
+        """
+        stop merging find_by_id of this class, pending ids are fetched now
+        :return:
+        """
+        loader = vars(cls).get('__id_loader__')
+        if loader is not None:
+            loader.dispatch()
+            delattr(cls, '__id_loader__')
+
     @classmethod
     async def delete_by_id(
         cls,
@@ -375,7 +1128,10 @@ class Document(AbstractDocument):
             raise AioMongoDocumentDoesNotExist('oid is None')
 
         try:
-            result = await cls.aio_collection.delete_one({_ID: ObjectId(oid)}, session=session)
+            oid = ObjectId(oid)
+            cls._record_query('delete_by_id', {_ID: oid})
+            result = await cls.aio_collection.delete_one({_ID: oid}, session=session)
+            cls._invalidate_cache(oid)
             return result.deleted_count
         except Exception as e:
             raise AioMongoDocumentDoesNotExist(str(e))
@@ -385,16 +1141,129 @@ class Document(AbstractDocument):
         cls,
         *args,
         session: Optional[ClientSession] = None,
+        lazy: Optional[bool] = None,
+        read_preference: Optional[Union[str, _ServerMode]] = None,
         **kwargs
-    ) -> AsyncIOMotorCursor:
+    ) -> DocumentCursor:
         """
-        document query, create a MotorCursor.
-        :param args:
+        document query, create a DocumentCursor which yields document instances, e.g.
+         async for user in User.find({'age': {'$gt': 10}}).sort('age'):
+             print(user.name)
+        :param args: positional arguments of motor collection find(), e.g. filter, projection
         :param session: ClientSession instance for transaction operation
-        :param kwargs:
+        :param lazy: yield lazy documents backed by RawBSONDocument, default with class attribute __lazy__
+        :param read_preference: read preference of this query, default with class attribute __read_preference__
+        :param kwargs: keyword arguments of motor collection find()
         :return:
         """
-        return cls.aio_collection.find(*args, session=session, **kwargs)
+        if lazy is None:
+            lazy = cls.__lazy__
+        return DocumentCursor(cls, *args, session=session, lazy=lazy, read_preference=read_preference, **kwargs)
+
+    @classmethod
+    def aggregate(
+        cls,
+        session: Optional[ClientSession] = None,
+        hydrate: Optional[bool] = None,
+        read_preference: Optional[Union[str, _ServerMode]] = None,
+        **kwargs: Any
+    ) -> Pipeline:
+        """
+        create an aggregation pipeline builder, field names are checked against __schema__,
+        $match and $project are pushed down before the pipeline is sent. e.g.
+            pipeline = User.aggregate().match(User.q.age > 10).group('$name', total={'$sum': 1})
+            async for record in pipeline:
+                print(record._id, record.total)
+        :param session: ClientSession instance for transaction operation
+        :param hydrate: yield document instances if True, Record if False,
+        default document instances if no stage reshapes documents
+        :param read_preference: read preference of this pipeline, default with class attribute __read_preference__
+        :param kwargs: keyword arguments of motor collection aggregate(), e.g. allowDiskUse
+        :return:
+        """
+        return Pipeline(cls, session=session, hydrate=hydrate, read_preference=read_preference, **kwargs)
+
+    @classmethod
+    async def parallel_scan(
+        cls,
+        filters: Optional[Mapping[str, Any]] = None,
+        partitions: int = 4,
+        key: str = _ID,
+        ordered: bool = False,
+        batch_size: Optional[int] = None,
+        lazy: Optional[bool] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[_Document]:
+        """
+        scan documents with partitions cursors running concurrently on the connection pool, each cursor scans
+        one range of key, split from a $sample of key values. key should be indexed. e.g.
+            async for user in User.parallel_scan({'sex': True}, partitions=8):
+                await export(user)
+        :param filters: query filter
+        :param partitions: max number of concurrent cursors
+        :param key: partition key, default _id
+        :param ordered: yield partitions in ascending key ranges, documents of one partition in server order,
+        otherwise yield documents as fetched
+        :param batch_size: number of documents fetched in one pass of each cursor
+        :param lazy: yield lazy documents backed by RawBSONDocument, default with class attribute __lazy__
+        :param kwargs: keyword arguments of motor collection find(), e.g. projection
+        :return: async iterator of documents
+        """
+        filters = to_filter(filters) or {}
+        points = await split_points(cls, filters, key, partitions)
+        cursors = [cls.find(partition, lazy=lazy, **kwargs) for partition in partition_filters(filters, key, points)]
+        if batch_size:
+            for cursor in cursors:
+                cursor.batch_size(batch_size)
+        async for doc in merge_cursors(cursors, ordered=ordered, batch_length=batch_size or 101):
+            yield doc
+
+    @classmethod
+    async def paginate(
+        cls,
+        filters: Optional[Mapping[str, Any]] = None,
+        sort: Optional[Union[str, Sequence[Tuple[str, int]]]] = None,
+        after: Optional[str] = None,
+        limit: int = 20,
+        session: Optional[ClientSession] = None,
+        lazy: Optional[bool] = None,
+        check_index: bool = True,
+        **kwargs: Any
+    ) -> Tuple[List[_Document], Optional[str]]:
+        """
+        keyset pagination, the next page starts after the sort key values of the last document in the token,
+        so the server seeks in the index instead of skipping documents. _id is appended to sort as tie-breaker.
+        e.g.
+            users, token = await User.paginate({'sex': True}, sort=[('age', -1)], limit=50)
+            next_users, token = await User.paginate({'sex': True}, sort=[('age', -1)], after=token, limit=50)
+        :param filters: query filter
+        :param sort: a single key or a list of (key, direction) pairs, direction 1 or -1
+        :param after: token of the previous page, None for the first page
+        :param limit: number of documents of a page
+        :param session: ClientSession instance for transaction operation
+        :param lazy: return lazy documents backed by RawBSONDocument, default with class attribute __lazy__
+        :param check_index: raise AioMongoInvalidOperation if no index declared in __schema__ matches the sort,
+        after the equality matched fields of filters it starts with
+        :param kwargs: keyword arguments of motor collection find(), e.g. projection
+        :return: documents of the page, and token of the next page or None for the last page
+        """
+        filters = to_filter(filters)
+        spec = sort_spec(sort)
+        equality = equality_fields(filters)
+        if check_index and not any(index_matches(keys, spec, equality)
+                                   for keys in [[(_ID, 1)]] + cls._schema_indexes()):
+            raise AioMongoInvalidOperation(f'no index of {cls.__name__} matches the sort {spec}.')
+
+        query = dict(filters or {})
+        if after is not None:
+            seek = seek_filter(spec, decode_token(after, spec))
+            query = {'$and': [query, seek]} if query else seek
+
+        docs = await cls.find(query, sort=spec, limit=limit + 1, session=session, lazy=lazy, **kwargs).to_list()
+        if len(docs) <= limit:
+            return docs, None
+        docs = docs[:limit]
+        return docs, encode_token(spec, key_values(docs[-1].__doc_data__, spec))
 
     @classmethod
     async def find_one(
@@ -402,6 +1271,8 @@ class Document(AbstractDocument):
         filters: Optional[Any] = None,
         *args: Any,
         session: Optional[ClientSession] = None,
+        lazy: Optional[bool] = None,
+        read_preference: Optional[Union[str, _ServerMode]] = None,
         **kwargs: Any
     ) -> Optional[_Document]:
         """
@@ -410,17 +1281,42 @@ class Document(AbstractDocument):
         the value for a query for "_id".
         :param args: any additional positional arguments are the same as the arguments to find()
         :param session: ClientSession instance for transaction operation
+        :param lazy: return a lazy document backed by RawBSONDocument, default with class attribute __lazy__
+        :param read_preference: read preference of this query, default with class attribute __read_preference__
         :param kwargs:
         :return:
         """
-        result = await cls.aio_collection.find_one(filters, *args, session=session, **kwargs)
-        return cls.create_instance(result)
+        if lazy is None:
+            lazy = cls.__lazy__
+        filters = to_filter(filters)
+        cls._record_query('find_one', filters, kwargs.get('sort'))
+        projection = args[0] if args else kwargs.get('projection')
+
+        cache = vars(cls).get('__query_cache__')
+        if cache is not None and session is None and read_preference is None:
+            key = query_key('find_one', filters, args=args, **kwargs)
+            raw = cache.get(key)
+            if raw is MISSING:
+                raw = await cls.read_collection(lazy=True).find_one(filters, *args, **kwargs)
+                cache.set(key, raw)
+            if lazy or raw is None:
+                return cls._from_raw(raw)
+            return cls._from_db(cls._decode_raw(raw), fill_defaults=projection is None)
+
+        collection = cls.read_collection(read_preference, lazy)
+        result = await collection.find_one(filters, *args, session=session, **kwargs)
+        if lazy:
+            return cls._from_raw(result)
+        return cls._from_db(result, fill_defaults=projection is None)
 
     @classmethod
     async def count(
         cls,
         *filters: Mapping[str, Any],
         session: Optional[ClientSession] = None,
+        estimated: bool = False,
+        max_staleness: Optional[float] = None,
+        read_preference: Optional[Union[str, _ServerMode]] = None,
         **kwargs
     ) -> int:
         """
@@ -429,6 +1325,8 @@ class Document(AbstractDocument):
         1、 users_num = await User.count()
         2、 users_name_num = await User.count({'name': 'kavin'})
         3、 users_age_num = await User.count({'age': {$gt: 30}}})
+        4、 users_num = await User.count(estimated=True)
+        5、 users_num = await User.count(estimated=True, max_staleness=30)
 
         All optional parameters should be passed as keyword arguments to this method. Valid options include:
          skip (int): The number of matching documents to skip before returning results.
@@ -442,11 +1340,75 @@ class Document(AbstractDocument):
         :param filters: A query document that selects which documents to count in the collection.
         Can be an empty document to count all documents.
         :param session: ClientSession instance for transaction operation
+        :param estimated: without filter, count from collection metadata with estimated_document_count,
+        which may be inaccurate after an unclean shutdown or with orphaned documents of a sharded cluster
+        :param max_staleness: reuse a count of the same query started at most max_staleness seconds ago,
+        concurrent callers share one count. writes do not invalidate it, so the count is approximate.
+        :param read_preference: read preference of this count, default with class attribute __read_preference__
         :param kwargs:
         :return:
         """
-        _filter = {} if filters == () else filters[0]
-        return await cls.aio_collection.count_documents(_filter, session=session, **kwargs)
+        _filter = {} if filters == () else to_filter(filters[0])
+        cls._record_query('count', _filter)
+        collection = cls.read_collection(read_preference)
+        # shared counts of a per call read preference are kept apart
+        preference_key = None if read_preference is None else repr(read_preference)
+        if estimated and not _filter and session is None:
+            return await cls._count_shared(
+                query_key('estimated_count', read_preference=preference_key, **kwargs), max_staleness,
+                lambda: collection.estimated_document_count(**kwargs))
+
+        if max_staleness is not None and session is None:
+            return await cls._count_shared(
+                query_key('count', _filter, read_preference=preference_key, **kwargs), max_staleness,
+                lambda: collection.count_documents(_filter, **kwargs))
+
+        cache = vars(cls).get('__query_cache__')
+        if cache is not None and session is None and read_preference is None:
+            key = query_key('count', _filter, **kwargs)
+            count = cache.get(key)
+            if count is MISSING:
+                count = await collection.count_documents(_filter, **kwargs)
+                cache.set(key, count)
+            return count
+
+        return await collection.count_documents(_filter, session=session, **kwargs)
+
+    @classmethod
+    async def _count_shared(
+        cls,
+        key: Hashable,
+        max_staleness: Optional[float],
+        counter: Callable[[], Awaitable[int]]
+    ) -> int:
+        """
+        run counter, or reuse the count of the same key started at most max_staleness seconds ago
+        :param key: query key of the count
+        :param max_staleness: seconds a count is reused, None for no reuse
+        :param counter: coroutine function of the count
+        :return:
+        """
+        if max_staleness is None:
+            return await counter()
+
+        counts = vars(cls).get('__count_cache__')
+        if counts is None:
+            counts = LRUCache(maxsize=1024)
+            setattr(cls, '__count_cache__', counts)
+
+        # the count future is awaitable on its own event loop only
+        key = (asyncio.get_running_loop(), key)
+        entry = counts.get(key)
+        now = time.monotonic()
+        if entry is MISSING or entry[0] + max_staleness < now:
+            entry = (now, asyncio.ensure_future(counter()))
+            counts.set(key, entry)
+        try:
+            return await asyncio.shield(entry[1])
+        except Exception:
+            if counts.get(key) is entry:
+                counts.pop(key)
+            raise
 
     @classmethod
     def get_collection(
@@ -472,7 +1434,7 @@ class Document(AbstractDocument):
         """
         create index on this collection.
         When defining document subclasses, index can be defined in schema，
-        In this function, we will create all the previously defined default indexes one by one
+        In this function, we will create all the previously defined default indexes with one createIndexes command
         return index str list
         e.g.
             class User(Document):
@@ -487,24 +1449,134 @@ class Document(AbstractDocument):
             assert res == ['index_-1', 'age_1', 'createdAt_-1']
 
         :param session: ClientSession instance for transaction operation
-        :param kwargs:
+        :param kwargs: index options of every index, e.g. background=True,
+        and options of the createIndexes command, maxTimeMS, commitQuorum and comment
         :return:
         """
-        _doc_index = []
-        __schema__ = getattr(cls, '__schema__', None)
-        if __schema__ is not None:
-            for key in __schema__:
-                if 'index' in __schema__[key]:
-                    _doc_index.append((key, __schema__[key]['index']))
-
-        if len(_doc_index) > 0:
-            res_list = []
-            for index_info in _doc_index:
-                res = await cls.aio_collection.create_index([index_info], session=session, **kwargs)
-                res_list.append(res)
-            return res_list
-        else:
+        command_options = {key: kwargs.pop(key) for key in _INDEX_COMMAND_OPTIONS if key in kwargs}
+        models = cls._index_models(**kwargs)
+        if not models:
             return []
+        return await cls.aio_collection.create_indexes(models, session=session, **command_options)
+
+    @classmethod
+    async def ensure_all_indexes(cls) -> dict:
+        """
+        create the indexes of every defined sub class of this class concurrently, e.g. at startup.
+        classes without client, neither bound by init_db nor with __db_url__, are skipped
+            results = await Document.ensure_all_indexes()
+        :return: dict of class qualified name -> index str list
+        """
+        classes = {}
+        for name, document_cls in list(document_registry.items()):
+            if issubclass(document_cls, cls) and document_cls._index_models():
+                try:
+                    document_cls.aio_collection
+                except AioMongoMissParameter:
+                    continue
+                classes[name] = document_cls
+        results = await asyncio.gather(*(document_cls.create_index() for document_cls in classes.values()))
+        return dict(zip(classes, results))
+
+    @classmethod
+    def _index_models(
+        cls,
+        **kwargs: Any
+    ) -> List[IndexModel]:
+        """
+        indexes declared in __schema__ and __indexes__
+        :param kwargs: index options of every index
+        :return:
+        """
+        __schema__ = getattr(cls, '__schema__', None) or {}
+        models = [IndexModel([(key, definition['index'])], **kwargs)
+                  for key, definition in __schema__.items() if 'index' in definition]
+        models.extend(IndexModel(index['keys'], **{**kwargs, **{k: v for k, v in index.items() if k != 'keys'}})
+                      for index in getattr(cls, '__indexes__', None) or [])
+        return models
+
+    @classmethod
+    def _schema_indexes(cls) -> List[List[Tuple[str, Any]]]:
+        """
+        indexes declared in __schema__ and __indexes__, as lists of (key, index type)
+        :return:
+        """
+        return [list(model.document['key'].items()) for model in cls._index_models()]
+
+    @classmethod
+    async def reconcile_indexes(
+        cls,
+        drop: bool = False,
+        rolling: bool = False,
+        dry_run: bool = False,
+        session: Optional[ClientSession] = None
+    ) -> dict:
+        """
+        diff the indexes declared in __schema__ and __indexes__ with index_information(), create missing indexes,
+        rebuild changed indexes, change expireAfterSeconds in place with collMod, and drop stale indexes if drop.
+        changed indexes are dropped and rebuilt one at a time after the missing indexes are built, so at most one
+        index is missing at any time; if a rebuild fails, the old index is built again and the error is raised.
+        e.g.
+            result = await User.reconcile_indexes(drop=True, rolling=True)
+        :param drop: drop indexes not declared, except _id_
+        :param rolling: build indexes one at a time, instead of one createIndexes command, for large collections
+        :param dry_run: only report the differences
+        :param session: ClientSession instance for transaction operation
+        :return: dict of index names 'created', 'rebuilt', 'modified', 'stale' and 'dropped'
+        """
+        collection = cls.aio_collection
+        existing = await collection.index_information(session=session)
+        result = {'created': [], 'rebuilt': [], 'modified': [], 'stale': [], 'dropped': []}
+
+        builds = []
+        rebuilds = []
+        for model in cls._index_models():
+            document = model.document
+            name = document['name']
+            info = existing.get(name)
+            if info is None:
+                result['created'].append(name)
+                builds.append(model)
+                continue
+            diff = index_diff(document, info)
+            if not diff:
+                continue
+            if diff == {'expireAfterSeconds'} and 'expireAfterSeconds' in info:
+                result['modified'].append(name)
+                if not dry_run:
+                    await collection.database.command('collMod', collection.name, session=session,
+                                                      index={'name': name,
+                                                             'expireAfterSeconds': document['expireAfterSeconds']})
+                continue
+            result['rebuilt'].append(name)
+            rebuilds.append((model, info))
+
+        declared = {model.document['name'] for model in cls._index_models()}
+        result['stale'] = [name for name in existing if name != '_id_' and name not in declared]
+        if dry_run:
+            return result
+
+        if rolling:
+            for model in builds:
+                await collection.create_indexes([model], session=session)
+        elif builds:
+            await collection.create_indexes(builds, session=session)
+
+        for model, info in rebuilds:
+            name = model.document['name']
+            await collection.drop_index(name, session=session)
+            try:
+                await collection.create_indexes([model], session=session)
+            except Exception:
+                options = {key: value for key, value in info.items() if key not in _INDEX_INFORMATION_ITEMS}
+                await collection.create_indexes([IndexModel(info['key'], name=name, **options)], session=session)
+                raise
+
+        if drop:
+            for name in result['stale']:
+                await collection.drop_index(name, session=session)
+                result['dropped'].append(name)
+        return result
 
     @classmethod
     async def create_compound_index(
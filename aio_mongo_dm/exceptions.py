@@ -34,3 +34,7 @@ class AioMongoAttributeError(AioMongoDMException):
 
 class AioMongoDocumentDoesNotExist(AioMongoDMException):
     pass
+
+
+class AioMongoInvalidOperation(AioMongoDMException):
+    pass
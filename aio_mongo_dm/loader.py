@@ -0,0 +1,143 @@
+"""
+name: loader
+author：kavinbj
+createdAt: 2022/8/4
+version: 1.0.0
+description:
+
+DataLoader-style batching of find_by_id
+"""
+import asyncio
+from asyncio import AbstractEventLoop
+from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
+from .client import current_loop
+from typing import (
+    Optional,
+    Dict
+)
+
+
+class IdLoader:
+    def __init__(
+        self,
+        document_cls: type,
+        max_batch: int = 1000
+    ):
+        """
+        ids loaded in the same event loop tick are fetched with one find({'_id': {'$in': [...]}}),
+        repeated ids are fetched once. documents are fetched as RawBSONDocument, so every caller gets
+        its own document instance. ids are batched per event loop, a batch is fetched on the loop of its callers.
+        :param document_cls: Document sub class
+        :param max_batch: max number of ids in one query
+        """
+        self._document_cls = document_cls
+        self.max_batch = max_batch
+        # event loop -> pending ids and their futures, handle of the dispatch of the loop
+        self._pending: Dict[AbstractEventLoop, Dict[ObjectId, asyncio.Future]] = {}
+        self._handles: Dict[AbstractEventLoop, asyncio.Handle] = {}
+        # pending future -> number of callers waiting on it
+        self._waiters: Dict[asyncio.Future, int] = {}
+        # number of queries sent and ids loaded, for monitoring
+        self.batches = 0
+        self.loads = 0
+
+    async def load_raw(
+        self,
+        oid: ObjectId
+    ) -> Optional[RawBSONDocument]:
+        """
+        load a document by id as RawBSONDocument, None if not exist.
+        callers of the same id share one future, a cancelled caller does not cancel the others,
+        the id is dropped from the batch once no caller waits on it anymore
+        :param oid: document ID
+        :return:
+        """
+        self.loads += 1
+        loop = asyncio.get_running_loop()
+        pending = self._pending.setdefault(loop, {})
+        future = pending.get(oid)
+        if future is None:
+            future = loop.create_future()
+            pending[oid] = future
+            if loop not in self._handles:
+                self._handles[loop] = loop.call_soon(self.dispatch, loop)
+        waiters = self._waiters
+        waiters[future] = waiters.get(future, 0) + 1
+        try:
+            return await asyncio.shield(future)
+        finally:
+            count = waiters.pop(future) - 1
+            if count:
+                waiters[future] = count
+            elif not future.done():
+                future.cancel()
+                if pending.get(oid) is future:
+                    del pending[oid]
+
+    async def load(
+        self,
+        oid: ObjectId,
+        lazy: bool = False
+    ):
+        """
+        load a document instance by id, None if not exist
+        :param oid: document ID
+        :param lazy: return a lazy document backed by RawBSONDocument
+        :return:
+        """
+        raw = await self.load_raw(oid)
+        if raw is None:
+            return None
+        document_cls = self._document_cls
+        if lazy:
+            return document_cls._from_raw(raw)
+        return document_cls._from_db(document_cls._decode_raw(raw))
+
+    def dispatch(
+        self,
+        loop: Optional[AbstractEventLoop] = None
+    ) -> None:
+        """
+        fetch pending ids now, those of another loop than the running one are fetched on their loop
+        :param loop: event loop of the ids, default all loops
+        :return:
+        """
+        running = current_loop()
+        for loop in [loop] if loop is not None else list(self._pending):
+            if loop is not running:
+                if not loop.is_closed():
+                    loop.call_soon_threadsafe(self.dispatch, loop)
+                continue
+            handle = self._handles.pop(loop, None)
+            if handle is not None:
+                handle.cancel()
+            pending = self._pending.pop(loop, None) or {}
+            oids = list(pending)
+            for start in range(0, len(oids), self.max_batch):
+                batch = {oid: pending[oid] for oid in oids[start:start + self.max_batch]}
+                asyncio.ensure_future(self._fetch(batch))
+
+    async def _fetch(
+        self,
+        batch: Dict[ObjectId, asyncio.Future]
+    ) -> None:
+        """
+        fetch one batch of ids, and resolve futures with RawBSONDocument or None
+        :param batch: dict of id and its future
+        :return:
+        """
+        self.batches += 1
+        try:
+            cursor = self._document_cls.read_collection(lazy=True).find({'_id': {'$in': list(batch)}})
+            docs = await cursor.to_list(length=None)
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        found: Dict[ObjectId, Optional[RawBSONDocument]] = {doc['_id']: doc for doc in docs}
+        for oid, future in batch.items():
+            if not future.done():
+                future.set_result(found.get(oid))
@@ -6,8 +6,11 @@ version: 1.0.0
 description:
 
 """
-from .exceptions import AioMongoDMSchemaError
+import weakref
+from .exceptions import AioMongoDMSchemaError, AioMongoAttributeError, AioMongoInvalidOperation
 from .utils import find_token
+from .query import QueryFields
+from .collections import AioCollection, collection_attr_list, read_preference
 
 # pymongo.ASCENDING = 1 # Ascending sort order.
 # pymongo.DESCENDING = -1 # Descending sort order.
@@ -18,6 +21,15 @@ from .utils import find_token
 
 index_type_list = [1, -1, '2d', '2dsphere', 'hashed', 'text']
 
+# options of an index declared in __indexes__
+index_option_list = ['name', 'unique', 'expireAfterSeconds', 'partialFilterExpression', 'sparse']
+
+# policy for DB result fields not defined in __schema__
+unknown_fields_list = ['keep', 'drop', 'raise']
+
+# document classes by qualified name, a redefined class replaces the old one
+document_registry = weakref.WeakValueDictionary()
+
 
 class MetaBase(type):
     def __new__(mcs, name, bases, clsargs):
@@ -29,8 +41,15 @@ class MetaBase(type):
         :return:
         """
         abstract = clsargs.pop('__abstract__', False)
+
+        # keep the compact slot layout of AbstractDocument, subclass instances get no __dict__
+        clsargs.setdefault('__slots__', ())
+
         if abstract or name == 'Document':
-            return super().__new__(mcs, name, bases, clsargs)
+            cls = super().__new__(mcs, name, bases, clsargs)
+            setattr(cls, '__validators__', mcs.compile_validators(name, {}))
+            setattr(cls, '__defaults__', {})
+            return cls
 
         _schema = clsargs.pop('__schema__', find_token(bases, '__schema__'))
 
@@ -40,9 +59,33 @@ class MetaBase(type):
         # check schema
         mcs.check_schema(_schema)
 
+        _indexes = clsargs.pop('__indexes__', find_token(bases, '__indexes__')) or []
+        mcs.check_indexes(_indexes, _schema)
+
+        _unknown_fields = clsargs.get('__unknown_fields__', find_token(bases, '__unknown_fields__'))
+        if _unknown_fields is not None and _unknown_fields not in unknown_fields_list:
+            raise AioMongoDMSchemaError(f"'__unknown_fields__' value not as {unknown_fields_list}.")
+
+        _read_preference = clsargs.get('__read_preference__', find_token(bases, '__read_preference__'))
+        if _read_preference is not None:
+            try:
+                read_preference(_read_preference,
+                                clsargs.get('__max_staleness__', find_token(bases, '__max_staleness__')) or -1,
+                                clsargs.get('__tag_sets__', find_token(bases, '__tag_sets__')))
+            except AioMongoInvalidOperation as e:
+                raise AioMongoDMSchemaError(f"'__read_preference__' has error definition, {e.args[0]}.")
+
         cls = super().__new__(mcs, name, bases, clsargs)
         setattr(cls, '__schema__', _schema)
+        setattr(cls, '__indexes__', [{**index, 'keys': [tuple(key) for key in index['keys']]} for index in _indexes])
+
+        # compile schema, field key -> validator, field key -> default value
+        setattr(cls, '__validators__', mcs.compile_validators(name, _schema))
+        setattr(cls, '__query_fields__', QueryFields(name, cls.__validators__))
+        setattr(cls, '__defaults__', {key: definition['default']
+                                      for key, definition in _schema.items() if 'default' in definition})
 
+        document_registry[f'{cls.__module__}.{cls.__qualname__}'] = cls
         return cls
 
     @staticmethod
@@ -81,26 +124,112 @@ class MetaBase(type):
             if len(error_key_list) > 0:
                 raise AioMongoDMSchemaError(f"field: '{field_key}' has error definition key {error_key_list}.")
 
+    @staticmethod
+    def check_indexes(indexes, schema):
+        """
+        check index declarations
+        e.g.
+        class User(Document):
+                __schema__ = {...}
+                __indexes__ = [
+                    {'keys': [('name', 1), ('createdAt', -1)]},
+                    {'keys': [('email', 1)], 'unique': True},
+                    {'keys': [('createdAt', 1)], 'expireAfterSeconds': 3600},
+                    {'keys': [('age', 1)], 'partialFilterExpression': {'age': {'$gte': 18}}, 'name': 'adult_age'}
+                ]
+        :param indexes:
+        :param schema: checked schema
+        :return:
+        """
+        if not isinstance(indexes, (list, tuple)):
+            raise AioMongoDMSchemaError("'__indexes__' must be a list of index definitions.")
+
+        for index in indexes:
+            if not isinstance(index, dict) or not index.get('keys') or not isinstance(index['keys'], (list, tuple)):
+                raise AioMongoDMSchemaError(f"index: {index!r} not has 'keys' definition.")
+
+            for key in index['keys']:
+                if not isinstance(key, (list, tuple)) or len(key) != 2:
+                    raise AioMongoDMSchemaError(f"index: {index!r} key {key!r} is not (field, index type).")
+                field, index_type = key
+                if field.split('.', 1)[0] not in schema and field != '_id':
+                    raise AioMongoDMSchemaError(f"index: {index!r} field {field!r} not defined in schema.")
+                if index_type not in index_type_list:
+                    raise AioMongoDMSchemaError(f"index: {index!r} index value not as {index_type_list}.")
+
+            error_key_list = [k for k in index.keys() if k != 'keys' and k not in index_option_list]
+            if len(error_key_list) > 0:
+                raise AioMongoDMSchemaError(f"index: {index!r} has error definition key {error_key_list}.")
+
+    @staticmethod
+    def compile_validators(name, schema):
+        """
+        compile schema into validators, one pre-bound callable per field key,
+        a validator raises AioMongoAttributeError if value has not correct type.
+        '_id' is always accepted.
+        :param name: document class name
+        :param schema: checked schema
+        :return: dict of field key -> validator
+        """
+        def accept(value):
+            pass
+
+        def make_validator(key, _type):
+            def validator(value):
+                if not isinstance(value, _type):
+                    raise AioMongoAttributeError(f'in {name!r}, {key!r} has not correct type {_type}.')
+            return validator
+
+        validators = {key: make_validator(key, definition['type']) for key, definition in schema.items()}
+        validators['_id'] = accept
+        return validators
+
+    def validate_data(cls, data):
+        """
+        validate a whole dict of field key and value in one pass, e.g. User.validate_data({'name': 'kavin'})
+        :param data: dict of field key and value
+        :return:
+        """
+        validators = cls.__validators__
+        for key, value in data.items():
+            validator = validators.get(key)
+            if validator is None:
+                raise AioMongoAttributeError(f'{cls.__name__!r} object has no attribute {key!r} definition.')
+            validator(value)
+
+    def __setattr__(cls, key, value):
+        """
+        set class attribute, drop the cached collections if an attribute the collection is resolved from changes
+        :param key:
+        :param value:
+        :return:
+        """
+        super().__setattr__(key, value)
+        if key in collection_attr_list:
+            AioCollection.invalidate(cls)
+
+    def __delattr__(cls, key):
+        super().__delattr__(key)
+        if key in collection_attr_list:
+            AioCollection.invalidate(cls)
+
     def __call__(cls, **kwargs):
         """
         create document subclass instance, and initial it
         :param kwargs:
         :return:
         """
-        self = super().__call__()
+        if kwargs:
+            cls.validate_data(kwargs)
 
-        # initial instance
-        _doc_data = {}
-        __schema__ = getattr(cls, '__schema__', None)
-        if __schema__ is not None:
-            for key in __schema__:
-                if 'default' in __schema__[key]:
-                    _doc_data[key] = __schema__[key]['default']
+        self = super().__call__()
 
-        # set default value for __doc_data__
-        vars(self)['__doc_data__'] = _doc_data
+        # initial instance with default value, then kwargs
+        _doc_data = dict(cls.__defaults__)
+        _doc_data.update(kwargs)
 
-        for k, v in kwargs.items():
-            self[k] = v
+        # set __doc_data__ slot, a new document is inserted whole, only kwargs of a given '_id' are tracked as changed
+        object.__setattr__(self, '__doc_data__', _doc_data)
+        object.__setattr__(self, '__doc_changes__', dict.fromkeys(kwargs, True) if '_id' in kwargs else None)
 
         return self
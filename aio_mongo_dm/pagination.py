@@ -0,0 +1,193 @@
+"""
+name: pagination
+author：kavinbj
+createdAt: 2022/8/7
+version: 1.0.0
+description:
+
+Keyset (seek) pagination, opaque page tokens and range predicates of sort keys
+"""
+import base64
+import binascii
+import re
+import bson
+from bson.errors import BSONError
+from bson.regex import Regex
+from .exceptions import AioMongoInvalidOperation
+from typing import (
+    Optional,
+    Union,
+    Any,
+    Iterable,
+    List,
+    Mapping,
+    Sequence,
+    Tuple
+)
+
+_ID = '_id'
+
+_SortSpec = List[Tuple[str, int]]
+
+
+def sort_spec(
+    sort: Optional[Union[str, Sequence[Tuple[str, int]]]] = None
+) -> _SortSpec:
+    """
+    normalize sort to a list of (key, direction), with _id appended as tie-breaker, so that the order is total
+    :param sort: a single key or a list of (key, direction) pairs, direction 1 or -1
+    :return:
+    """
+    if sort is None:
+        spec = []
+    elif isinstance(sort, str):
+        spec = [(sort, 1)]
+    else:
+        spec = [(key, direction) for key, direction in sort]
+    for key, direction in spec:
+        if direction not in (1, -1):
+            raise AioMongoInvalidOperation(f"sort direction of '{key}' must be 1 or -1 for pagination.")
+    if _ID not in (key for key, _ in spec):
+        spec.append((_ID, spec[-1][1] if spec else 1))
+    return spec
+
+
+def key_values(
+    doc: Mapping[str, Any],
+    spec: _SortSpec
+) -> list:
+    """
+    values of sort keys in a document, dotted keys walk embedded documents.
+    a missing key is None, as mongodb sorts missing and null values alike
+    :param doc: document data
+    :param spec: sort spec
+    :return:
+    """
+    values = []
+    for key, _ in spec:
+        value = doc
+        for part in key.split('.'):
+            if not isinstance(value, Mapping) or part not in value:
+                value = None
+                break
+            value = value[part]
+        values.append(value)
+    return values
+
+
+def encode_token(
+    spec: _SortSpec,
+    values: list
+) -> str:
+    """
+    opaque url-safe token of the last document of a page
+    :param spec: sort spec
+    :param values: sort key values of the last document
+    :return:
+    """
+    data = bson.encode({'s': [[key, direction] for key, direction in spec], 'v': values})
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_token(
+    token: str,
+    spec: _SortSpec
+) -> list:
+    """
+    sort key values of a token, the token must be created with the same sort
+    :param token: page token
+    :param spec: sort spec
+    :return:
+    """
+    try:
+        data = bson.decode(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (BSONError, binascii.Error, ValueError, TypeError):
+        raise AioMongoInvalidOperation('invalid page token.')
+    if [tuple(item) for item in data.get('s', [])] != spec or len(data.get('v', [])) != len(spec):
+        raise AioMongoInvalidOperation('page token does not match the sort.')
+    return data['v']
+
+
+def seek_filter(
+    spec: _SortSpec,
+    values: list
+) -> dict:
+    """
+    range predicate of documents after the sort key values, e.g. for sort [('age', 1), ('_id', 1)]
+        {'$or': [{'age': {'$gt': age}}, {'age': age, '_id': {'$gt': oid}}]}
+    null and missing values sort before all others: after null come all non-null values in ascending order,
+    nothing in descending order, and null values come after every value in descending order.
+    :param spec: sort spec
+    :param values: sort key values of the last document
+    :return:
+    """
+    branches = []
+    for index, (key, direction) in enumerate(spec):
+        branch = {prefix_key: value for (prefix_key, _), value in zip(spec[:index], values)}
+        value = values[index]
+        if value is None:
+            if direction == -1:
+                continue
+            branch[key] = {'$ne': None}
+        elif direction == 1:
+            branch[key] = {'$gt': value}
+        elif key == _ID:
+            branch[key] = {'$lt': value}
+        else:
+            branch['$or'] = [{key: {'$lt': value}}, {key: None}]
+        branches.append(branch)
+    return branches[0] if len(branches) == 1 else {'$or': branches}
+
+
+def equality_fields(
+    filters: Optional[Mapping[str, Any]]
+) -> set:
+    """
+    fields matched with a single value by filters, e.g. {'sex': True, 'age': {'$gt': 20}} -> {'sex'}
+    :param filters: query filter
+    :return:
+    """
+    fields = set()
+    for key, value in (filters or {}).items():
+        if key == '$and':
+            for clause in value:
+                fields |= equality_fields(clause)
+        elif key.startswith('$') or isinstance(value, (re.Pattern, Regex)):
+            continue
+        elif isinstance(value, Mapping) and any(operator.startswith('$') for operator in value):
+            if '$eq' in value:
+                fields.add(key)
+        else:
+            fields.add(key)
+    return fields
+
+
+def index_matches(
+    index_keys: Sequence[Tuple[str, Any]],
+    spec: _SortSpec,
+    equality: Iterable[str] = ()
+) -> bool:
+    """
+    whether an index can walk the sort, the keys and directions of the index are the sort keys, or all reversed.
+    the _id tie-breaker may be missing in the index, and the index may start with fields of equality matches,
+    e.g. index [('sex', 1), ('age', 1)] walks sort [('age', 1)] of filter {'sex': True}.
+    :param index_keys: list of (key, direction) of the index
+    :param spec: sort spec
+    :param equality: fields matched with a single value by the query filter
+    :return:
+    """
+    index_keys = [(key, direction) for key, direction in index_keys]
+    equality = set(equality)
+    prefix = 0
+    while prefix < len(index_keys) and index_keys[prefix][0] in equality:
+        prefix += 1
+    for start in range(prefix + 1):
+        keys = index_keys[start:]
+        for sort_keys in (spec, spec[:-1] if spec[-1][0] == _ID else spec):
+            if not sort_keys:
+                continue
+            if keys[:len(sort_keys)] == sort_keys:
+                return True
+            if keys[:len(sort_keys)] == [(key, -direction) for key, direction in sort_keys]:
+                return True
+    return False
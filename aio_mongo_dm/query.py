@@ -0,0 +1,372 @@
+"""
+name: query
+author：kavinbj
+createdAt: 2022/8/9
+version: 1.0.0
+description:
+
+Typed field-expression query builder, compiled to mongodb filter dicts, e.g.
+    users = await User.find((User.q.age > 30) & User.q.name.in_(['kavin', 'felix'])).to_list()
+"""
+import copy
+from abc import ABC, abstractmethod
+from .exceptions import AioMongoAttributeError, AioMongoMissParameter
+from typing import (
+    Optional,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Tuple
+)
+
+
+class Param:
+    __slots__ = ('name',)
+
+    def __init__(
+        self,
+        name: str
+    ):
+        """
+        placeholder of a value in a query template, bound with Expr.bind(), e.g.
+            older_than = User.q.age > Param('age')
+            users = await User.find(older_than.bind(age=30)).to_list()
+        :param name: parameter name
+        """
+        self.name = name
+
+    def __repr__(self) -> str:
+        return f'Param({self.name!r})'
+
+
+class Expr(ABC):
+    __slots__ = ('_filter', '_params')
+
+    def __init__(self):
+        self._filter = None
+        # (path to the value in compiled filter, param, validator) of every Param in the expression
+        self._params = None
+
+    @abstractmethod
+    def _compile(
+        self,
+        params: list,
+        path: tuple
+    ) -> dict:
+        """
+        compile the expression to a filter dict, collecting the Param placeholders of its values
+        :param params: list of (path to the value in compiled filter, param, validator) to append to
+        :param path: path of this expression in the compiled filter
+        :return:
+        """
+
+    def to_filter(self) -> dict:
+        """
+        mongodb filter dict of the expression, compiled once and cached in the expression.
+        the returned dict is shared, don't modify it
+        :return:
+        """
+        if self._filter is None:
+            params = []
+            self._filter = self._compile(params, ())
+            self._params = params
+        return self._filter
+
+    def bind(
+        self,
+        **values: Any
+    ) -> dict:
+        """
+        filter dict of the query template with params replaced by values, only containers on the paths of
+        params are copied, values are validated against the field type
+        :param values: param name -> value
+        :return:
+        """
+        template = self.to_filter()
+        if not self._params:
+            return template
+        result = copy.copy(template)
+        copied = {(): result}
+        for path, param, validator in self._params:
+            if param.name not in values:
+                raise AioMongoMissParameter(f'query param {param.name!r} not bound.')
+            value = values[param.name]
+            _validate(validator, value)
+            container = result
+            for depth, step in enumerate(path[:-1], 1):
+                sub_path = path[:depth]
+                if sub_path not in copied:
+                    copied[sub_path] = copy.copy(container[step])
+                    container[step] = copied[sub_path]
+                container = copied[sub_path]
+            container[path[-1]] = value
+        return result
+
+    def __and__(self, other: 'Expr') -> 'Expr':
+        return And(self, other)
+
+    def __or__(self, other: 'Expr') -> 'Expr':
+        return Or(self, other)
+
+    def __invert__(self) -> 'Expr':
+        return Nor(self)
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.to_filter()!r})'
+
+
+class Condition(Expr):
+    __slots__ = ('field', 'op', 'value', 'validator')
+
+    def __init__(
+        self,
+        field: str,
+        op: Optional[str],
+        value: Any,
+        validator: Optional[Callable[[Any], None]] = None
+    ):
+        """
+        condition on one field, e.g. {'age': {'$gt': 30}}, or {'age': 30} if op is None
+        :param field: field key
+        :param op: query operator, None for equality
+        :param value: operand, may contain Param
+        :param validator: validator of the values of Param
+        """
+        super().__init__()
+        self.field = field
+        self.op = op
+        self.value = value
+        self.validator = validator
+
+    def _compile(self, params, path):
+        if self.op is None:
+            path, condition = path + (self.field,), self.value
+        else:
+            path, condition = path + (self.field, self.op), {self.op: self.value}
+        if isinstance(self.value, Param):
+            params.append((path, self.value, self.validator))
+        elif isinstance(self.value, list):
+            params.extend((path + (index,), item, self.validator)
+                          for index, item in enumerate(self.value) if isinstance(item, Param))
+        return {self.field: condition}
+
+
+class And(Expr):
+    __slots__ = ('exprs',)
+
+    def __init__(self, *exprs: Expr):
+        super().__init__()
+        self.exprs = [sub for expr in exprs for sub in (expr.exprs if type(expr) is And else [expr])]
+
+    def _compile(self, params, path):
+        # merge conditions of different fields, or of different operators of one field, into one dict
+        merged: Dict[str, Any] = {}
+        merged_params: List[Tuple[tuple, Param, Any]] = []
+        for expr in self.exprs:
+            expr_params = []
+            compiled = expr._compile(expr_params, ())
+            if not _mergeable(merged, compiled):
+                sub_params = []
+                result = {'$and': [sub._compile(sub_params, (index,)) for index, sub in enumerate(self.exprs)]}
+                params.extend((path + ('$and',) + sub_path, param, validator)
+                              for sub_path, param, validator in sub_params)
+                return result
+            for key, condition in compiled.items():
+                if key in merged:
+                    merged[key] = {**merged[key], **condition}
+                else:
+                    merged[key] = condition
+            merged_params.extend(expr_params)
+        params.extend((path + sub_path, param, validator) for sub_path, param, validator in merged_params)
+        return merged
+
+
+class Or(Expr):
+    __slots__ = ('exprs',)
+    operator = '$or'
+
+    def __init__(self, *exprs: Expr):
+        super().__init__()
+        self.exprs = [sub for expr in exprs for sub in (expr.exprs if type(expr) is Or is type(self) else [expr])]
+
+    def _compile(self, params, path):
+        return {self.operator: [expr._compile(params, path + (self.operator, index))
+                                for index, expr in enumerate(self.exprs)]}
+
+
+class Nor(Or):
+    __slots__ = ()
+    operator = '$nor'
+
+    def __invert__(self) -> 'Expr':
+        return self.exprs[0] if len(self.exprs) == 1 else Or(*self.exprs)
+
+
+def _mergeable(
+    merged: dict,
+    compiled: dict
+) -> bool:
+    """
+    whether compiled conditions can be merged into one dict, same field only if both are operator
+    dicts without common operator
+    :param merged:
+    :param compiled:
+    :return:
+    """
+    for key, condition in compiled.items():
+        if key.startswith('$'):
+            if key in merged:
+                return False
+            continue
+        if key not in merged:
+            continue
+        current = merged[key]
+        if not (_is_operators(current) and _is_operators(condition)) or set(current) & set(condition):
+            return False
+    return True
+
+
+def _is_operators(value: Any) -> bool:
+    return isinstance(value, dict) and bool(value) and all(str(key).startswith('$') for key in value)
+
+
+def _validate(
+    validator: Optional[Callable[[Any], None]],
+    value: Any
+) -> None:
+    if validator is not None and value is not None and not isinstance(value, Param):
+        validator(value)
+
+
+class Field:
+    __slots__ = ('name', 'validator')
+
+    def __init__(
+        self,
+        name: str,
+        validator: Optional[Callable[[Any], None]] = None
+    ):
+        """
+        query field descriptor, comparisons build Condition expressions, values are validated with
+        the field validator compiled from __schema__
+        :param name: field key
+        :param validator: validator of field values
+        """
+        self.name = name
+        self.validator = validator
+
+    def _condition(
+        self,
+        op: Optional[str],
+        value: Any
+    ) -> Condition:
+        _validate(self.validator, value)
+        return Condition(self.name, op, value, self.validator)
+
+    def _conditions(
+        self,
+        op: str,
+        values: Iterable[Any]
+    ) -> Condition:
+        values = list(values)
+        for value in values:
+            _validate(self.validator, value)
+        return Condition(self.name, op, values, self.validator)
+
+    def __eq__(self, value: Any) -> Condition:  # type: ignore[override]
+        return self._condition(None, value)
+
+    def __ne__(self, value: Any) -> Condition:  # type: ignore[override]
+        return self._condition('$ne', value)
+
+    def __gt__(self, value: Any) -> Condition:
+        return self._condition('$gt', value)
+
+    def __ge__(self, value: Any) -> Condition:
+        return self._condition('$gte', value)
+
+    def __lt__(self, value: Any) -> Condition:
+        return self._condition('$lt', value)
+
+    def __le__(self, value: Any) -> Condition:
+        return self._condition('$lte', value)
+
+    __hash__ = object.__hash__
+
+    def in_(self, values: Iterable[Any]) -> Condition:
+        return self._conditions('$in', values)
+
+    def nin(self, values: Iterable[Any]) -> Condition:
+        return self._conditions('$nin', values)
+
+    def exists(self, exists: bool = True) -> Condition:
+        return Condition(self.name, '$exists', exists)
+
+    def regex(self, pattern: str, options: str = '') -> Expr:
+        if options:
+            return And(Condition(self.name, '$regex', pattern), Condition(self.name, '$options', options))
+        return Condition(self.name, '$regex', pattern)
+
+    def __repr__(self) -> str:
+        return f'Field({self.name!r})'
+
+
+class QueryFields:
+    def __init__(
+        self,
+        name: str,
+        validators: Dict[str, Callable[[Any], None]]
+    ):
+        """
+        query fields of a document class, generated by MetaBase from __schema__, e.g. User.q.age > 30.
+        unknown fields raise AioMongoAttributeError instead of silently scanning the collection
+        :param name: document class name
+        :param validators: field key -> validator
+        """
+        self._name = name
+        self._fields = {key: Field(key, validator) for key, validator in validators.items()}
+
+    def __getattr__(self, key: str) -> Field:
+        try:
+            return self._fields[key]
+        except KeyError:
+            raise AioMongoAttributeError(f'{self._name!r} has no field {key!r} in __schema__.')
+
+    def __getitem__(self, key: str) -> Field:
+        return self.__getattr__(key)
+
+    def __dir__(self):
+        return list(self._fields)
+
+
+class QueryDescriptor:
+    def __get__(self, instance, owner):
+        """
+        class access returns the query fields of the document class,
+        instance access returns the document field 'q' if defined in __schema__
+        :param instance:
+        :param owner:
+        :return:
+        """
+        if instance is not None:
+            return owner.__getattr__(instance, 'q')
+        fields = vars(owner).get('__query_fields__')
+        if fields is None:
+            raise AioMongoAttributeError(f'{owner.__name__!r} has no __schema__ to query.')
+        return fields
+
+
+def to_filter(filters: Any) -> Any:
+    """
+    compile expression to filter dict, other filters are returned as is
+    :param filters: Expr or filter
+    :return:
+    """
+    if not isinstance(filters, Expr):
+        return filters
+    result = filters.to_filter()
+    if filters._params:
+        raise AioMongoMissParameter(f'query params {[param.name for _, param, _ in filters._params]} not bound.')
+    return result
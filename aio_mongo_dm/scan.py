@@ -0,0 +1,136 @@
+"""
+name: scan
+author：kavinbj
+createdAt: 2022/8/8
+version: 1.0.0
+description:
+
+Parallel partitioned collection scan, key ranges scanned by concurrent cursors
+"""
+import asyncio
+from collections import Counter
+from typing import (
+    Any,
+    List,
+    Mapping,
+    AsyncIterator
+)
+
+# sampled key values per partition for split points
+_SAMPLES_PER_PARTITION = 20
+
+
+async def split_points(
+    document_cls: type,
+    filters: Mapping[str, Any],
+    key: str,
+    partitions: int
+) -> list:
+    """
+    split points of key, which cut the matched documents into about equal partitions, from a $sample of key values.
+    only values of the most common type are used, documents of other types fall into the first partition.
+    without filters $sample is the first stage, which the server serves with a random cursor, reading only the
+    sampled documents. with filters the server has to read all matched documents to sample from them,
+    through an index of the filters if there is one.
+    :param document_cls: Document sub class
+    :param filters: query filter
+    :param key: partition key
+    :param partitions: number of partitions
+    :return: sorted distinct split points, at most partitions - 1
+    """
+    if partitions < 2:
+        return []
+    # documents without key are sampled too and skipped below, a $match before $sample would read every document
+    pipeline = [
+        {'$sample': {'size': partitions * _SAMPLES_PER_PARTITION}},
+        {'$project': {'_id': 0, 'value': f'${key}'}}
+    ]
+    if filters:
+        pipeline.insert(0, {'$match': dict(filters)})
+    samples = await document_cls.read_collection().aggregate(pipeline).to_list(length=None)
+    values = [sample['value'] for sample in samples if sample.get('value') is not None]
+    if not values:
+        return []
+    value_type = Counter(type(value) for value in values).most_common(1)[0][0]
+    values = sorted(value for value in values if type(value) is value_type)
+
+    points = []
+    for index in range(1, partitions):
+        point = values[index * len(values) // partitions]
+        if point != values[0] and (not points or point != points[-1]):
+            points.append(point)
+    return points
+
+
+def partition_filters(
+    filters: Mapping[str, Any],
+    key: str,
+    points: list
+) -> List[dict]:
+    """
+    filters of partitions cut at split points, partitions are disjoint and cover all documents of filters,
+    the first partition also matches documents whose key is missing or of another type
+    :param filters: query filter
+    :param key: partition key
+    :param points: sorted split points
+    :return:
+    """
+    if not points:
+        return [dict(filters)]
+    ranges = [{key: {'$not': {'$gte': points[0]}}}]
+    ranges.extend({key: {'$gte': low, '$lt': high}} for low, high in zip(points, points[1:]))
+    ranges.append({key: {'$gte': points[-1]}})
+    if not filters:
+        return ranges
+    return [{'$and': [dict(filters), key_range]} for key_range in ranges]
+
+
+async def merge_cursors(
+    cursors: list,
+    ordered: bool = False,
+    batch_length: int = 101,
+    buffer: int = 2
+) -> AsyncIterator:
+    """
+    fetch cursors concurrently and yield their documents, cursors are closed when the generator is closed
+    :param cursors: DocumentCursor instances
+    :param ordered: yield documents of the first cursor first, then of the second..., otherwise as fetched
+    :param batch_length: number of documents fetched in one pass
+    :param buffer: number of batches buffered per cursor
+    :return:
+    """
+    queues = [asyncio.Queue(maxsize=buffer) for _ in cursors] if ordered else \
+        [asyncio.Queue(maxsize=buffer * len(cursors))] * len(cursors)
+
+    async def produce(cursor, queue):
+        try:
+            while True:
+                docs = await cursor.to_list(length=batch_length)
+                if not docs:
+                    break
+                await queue.put(docs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(e)
+        await queue.put(None)
+
+    tasks = [asyncio.ensure_future(produce(cursor, queue)) for cursor, queue in zip(cursors, queues)]
+    try:
+        for queue in (queues if ordered else queues[:1]):
+            # the shared queue of unordered scan gets one end mark per cursor
+            pending = 1 if ordered else len(cursors)
+            while pending:
+                batch = await queue.get()
+                if batch is None:
+                    pending -= 1
+                    continue
+                if isinstance(batch, Exception):
+                    raise batch
+                for doc in batch:
+                    yield doc
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.gather(*(cursor.close() for cursor in cursors), return_exceptions=True)
@@ -40,7 +40,8 @@ app = Sanic(__name__)
 async def notify_server_started(_app: Sanic, _loop):
     print('notify_server_started, tap http://localhost:3000/pub in web browser')
     # When the asynchronous web framework （sanic） starts, a new loop will be generated.
-    # so mongo client needs to be initialized here, and cache the mongo name
+    # so mongo client needs to be initialized here, and cache the mongo name.
+    # clients are cached per loop, a client of another loop is never reused on this one
     await Document.init_db(url=_db_url, db_name='mytest', io_loop=_loop)
 
 
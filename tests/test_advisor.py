@@ -0,0 +1,66 @@
+"""
+name: test_advisor
+author：kavinbj
+createdAt: 2022/8/11
+version: 1.0.0
+description:
+
+"""
+# import sys
+# sys.path.append("..")
+from aio_mongo_dm.advisor import QueryShape, QueryRecorder, query_shape, index_quality, scan_stage
+
+
+def test_query_shape():
+    shape = query_shape({'name': 'kavin', 'sex': {'$in': [True]}, 'age': {'$gt': 1, '$lt': 9},
+                         'info': {'$regex': '^a'}}, [('createdAt', -1)])
+    assert shape == QueryShape(equality=('name', 'sex'), sort=(('createdAt', -1),), range=('age',), other=('info',))
+    assert shape == query_shape({'age': {'$gte': 5}, 'info': {'$ne': 'x'}, 'sex': True, 'name': 'felix'},
+                                [('createdAt', -1)])
+    assert shape.suggest_index() == [('name', 1), ('sex', 1), ('createdAt', -1), ('age', 1)]
+
+    shape = query_shape({'$and': [{'name': 'kavin'}, {'age': {'$lt': 9}}], '$or': [{'sex': True}]})
+    assert shape == QueryShape(equality=('name',), range=('age',), other=('sex',))
+
+
+def test_index_quality():
+    shape = query_shape({'name': 'kavin', 'age': {'$gt': 1}}, [('createdAt', -1)])
+    assert index_quality(shape, [('name', 1), ('createdAt', 1), ('age', 1)]) == 3
+    assert index_quality(shape, [('name', 1), ('age', 1)]) == 1
+    assert index_quality(shape, [('age', 1)]) == 0
+
+
+def test_query_recorder():
+    recorder = QueryRecorder()
+    recorder.record('find', {'name': 'kavin'}, [('age', 1)])
+    recorder.record('find', {'name': 'felix'}, [('age', 1)])
+    recorder.record('count', {'sex': True})
+    recorder.record('find_one', {'name': 'kavin', 'age': {'$gt': 10}})
+    recorder.record('find_by_id', {'_id': 'xxx'})
+
+    indexes = {
+        '_id_': {'key': [('_id', 1)]},
+        'name_-1': {'key': [('name', -1)]},
+        'name_1_age_1': {'key': [('name', 1), ('age', 1)]}
+    }
+    report = recorder.report(indexes)
+    assert [(item['status'], item['count'], item['index'], item['suggestion']) for item in report] == [
+        ('indexed', 2, 'name_1_age_1', None),
+        ('unindexed', 1, None, [('sex', 1)]),
+        ('indexed', 1, 'name_1_age_1', None),
+        ('indexed', 1, '_id_', None)
+    ]
+    assert report[0]['operations'] == {'find': 2}
+
+    report = recorder.report(indexes, {query_shape({'sex': True}): 'COLLSCAN'})
+    assert report[1]['plan'] == 'COLLSCAN'
+
+    recorder.clear()
+    assert recorder.report(indexes) == []
+
+
+def test_scan_stage():
+    explain = {'queryPlanner': {'winningPlan': {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN'}}}}
+    assert scan_stage(explain) == 'IXSCAN'
+    assert scan_stage({'queryPlanner': {'winningPlan': {'stage': 'COLLSCAN'}}}) == 'COLLSCAN'
+    assert scan_stage({}) is None
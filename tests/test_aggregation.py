@@ -0,0 +1,109 @@
+"""
+name: test_aggregation
+author：kavinbj
+createdAt: 2022/8/10
+version: 1.0.0
+description:
+
+"""
+import pytest
+# import sys
+# sys.path.append("..")
+from aio_mongo_dm.exceptions import AioMongoAttributeError
+from aio_mongo_dm.aggregation import optimize, Record
+
+
+def test_optimize_match_pushdown():
+    stages = [
+        {'$sort': {'age': 1}},
+        {'$lookup': {'from': 'orders', 'localField': '_id', 'foreignField': 'user', 'as': 'orders'}},
+        {'$match': {'name': 'kavin'}},
+        {'$match': {'orders.amount': {'$gt': 10}}},
+        {'$group': {'_id': '$name', 'total': {'$sum': '$age'}}}
+    ]
+    assert optimize(stages) == [
+        {'$match': {'name': 'kavin'}},
+        {'$sort': {'age': 1}},
+        {'$project': {'_id': 1, 'age': 1, 'name': 1, 'orders': 1}},
+        {'$lookup': {'from': 'orders', 'localField': '_id', 'foreignField': 'user', 'as': 'orders'}},
+        {'$match': {'orders.amount': {'$gt': 10}}},
+        {'$group': {'_id': '$name', 'total': {'$sum': '$age'}}}
+    ]
+
+    stages = [{'$limit': 10}, {'$match': {'name': 'kavin'}}]
+    assert optimize(stages) == stages
+
+    stages = [{'$project': {'name': 1, 'n': {'$toUpper': '$name'}}}, {'$match': {'name': 'kavin', 'n': 'KAVIN'}}]
+    assert optimize(stages) == stages
+
+
+def test_optimize_project_pushdown():
+    stages = [{'$match': {'sex': True}}, {'$group': {'_id': '$name', 'age': {'$avg': '$age'}}}]
+    assert optimize(stages) == [
+        {'$match': {'sex': True}},
+        {'$project': {'_id': 1, 'age': 1, 'name': 1}},
+        {'$group': {'_id': '$name', 'age': {'$avg': '$age'}}}
+    ]
+
+    stages = [{'$match': {'sex': True}}, {'$project': {'name': 1}}]
+    assert optimize(stages) == stages
+
+    stages = [{'$addFields': {'adult': True}}, {'$group': {'_id': '$name'}}]
+    assert optimize(stages) == stages
+
+
+def test_optimize_whole_document(user_document):
+    # $$ROOT and $$CURRENT use every field, no projection is pushed down
+    stages = [{'$sort': {'age': 1}}, {'$group': {'_id': '$name', 'docs': {'$push': '$$ROOT'}}}]
+    assert optimize(stages) == stages
+
+    stages = [
+        {'$lookup': {'from': 'orders', 'localField': '_id', 'foreignField': 'user', 'as': 'orders'}},
+        {'$group': {'_id': '$name', 'first': {'$first': '$$CURRENT'}}}
+    ]
+    assert optimize(stages) == stages
+
+    stages = [{'$sort': {'age': 1}}, {'$group': {'_id': '$$ROOT.name', 'age': {'$max': '$$CURRENT.age'}}}]
+    assert optimize(stages) == [
+        {'$sort': {'age': 1}},
+        {'$project': {'_id': 1, 'age': 1, 'name': 1}},
+        {'$group': {'_id': '$$ROOT.name', 'age': {'$max': '$$CURRENT.age'}}}
+    ]
+
+    stages = [
+        {'$lookup': {'from': 'orders', 'localField': '_id', 'foreignField': 'user', 'as': 'orders'}},
+        {'$match': {'$expr': {'$gt': [{'$size': {'$objectToArray': '$$ROOT'}}, 3]}}}
+    ]
+    assert optimize(stages) == stages
+
+    pipeline = user_document.aggregate().group('$name', docs={'$push': '$$ROOT'})
+    assert pipeline.build() == [{'$group': {'_id': '$name', 'docs': {'$push': '$$ROOT'}}}]
+
+
+def test_pipeline_builder(user_document):
+    q = user_document.q
+    pipeline = user_document.aggregate().match(q.age > 10).group('$name', total={'$sum': 1}).sort('total', -1)
+    assert pipeline.build() == [
+        {'$match': {'age': {'$gt': 10}}},
+        {'$project': {'_id': 1, 'name': 1}},
+        {'$group': {'_id': '$name', 'total': {'$sum': 1}}},
+        {'$sort': {'total': -1}}
+    ]
+
+    with pytest.raises(AioMongoAttributeError) as e:
+        user_document.aggregate().match({'agee': 1})
+    exec_msg = e.value.args[0]
+    assert exec_msg == "'User' pipeline $match has unknown fields ['agee']."
+
+    with pytest.raises(AioMongoAttributeError) as e:
+        user_document.aggregate().group('$name', total={'$sum': 1}).sort('age')
+    exec_msg = e.value.args[0]
+    assert exec_msg == "'User' pipeline $sort has unknown fields ['age']."
+
+    pipeline = user_document.aggregate().stage({'$addFields': {'adult': True}}).match({'adult': True})
+    assert len(pipeline.build()) == 2
+
+    record = Record(total=1)
+    assert record.total == 1
+    with pytest.raises(AioMongoAttributeError):
+        record.count
@@ -0,0 +1,95 @@
+"""
+name: test_cache
+author：kavinbj
+createdAt: 2022/8/5
+version: 1.0.0
+description:
+
+"""
+import pytest
+# import sys
+# sys.path.append("..")
+from aio_mongo_dm import request_cache
+from aio_mongo_dm.cache import LRUCache, DocumentCache, MISSING, query_key
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_cache_eviction():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+
+    cache.set('c', 3)
+    assert len(cache) == 2
+    assert cache.get('b') is MISSING
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+
+def test_lru_cache_ttl():
+    timer = FakeTimer()
+    cache = LRUCache(maxsize=2, ttl=10, timer=timer)
+    cache.set('a', 1)
+
+    timer.now = 9.9
+    assert cache.get('a') == 1
+
+    timer.now = 10
+    assert cache.get('a') is MISSING
+    assert len(cache) == 0
+
+
+def test_document_cache_stats():
+    cache = DocumentCache(maxsize=10)
+    assert cache.get('a') is MISSING
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+
+    cache.invalidate('a')
+    assert cache.get('a') is MISSING
+    assert cache.stats == {'hits': 1, 'misses': 2, 'size': 0}
+
+
+def test_document_cache_request_scope():
+    cache = DocumentCache(maxsize=10, scope='request')
+    cache.set('a', 1)
+    assert cache.get('a') is MISSING
+
+    with request_cache():
+        cache.set('a', 1)
+        assert cache.get('a') == 1
+        assert len(cache) == 1
+
+        with request_cache():
+            assert cache.get('a') is MISSING
+
+    assert cache.get('a') is MISSING
+    assert len(cache) == 0
+
+
+def test_document_cache_error_scope():
+    with pytest.raises(ValueError) as e:
+        DocumentCache(scope='session')
+    exec_msg = e.value.args[0]
+    assert exec_msg == "scope value not as ['global', 'request']."
+
+
+def test_query_key():
+    key = query_key('find_one', {'name': 'kavin', 'age': {'$gt': 1, '$lt': 9}}, sort=[('age', 1)])
+    assert key == query_key('find_one', {'age': {'$lt': 9, '$gt': 1}, 'name': 'kavin'}, sort=[('age', 1)])
+    assert hash(key) == hash(query_key('find_one', {'age': {'$lt': 9, '$gt': 1}, 'name': 'kavin'},
+                                       sort=[('age', 1)]))
+
+    assert key != query_key('find', {'name': 'kavin', 'age': {'$gt': 1, '$lt': 9}}, sort=[('age', 1)])
+    assert key != query_key('find_one', {'name': 'kavin', 'age': {'$gt': 1, '$lt': 9}}, sort=[('age', -1)])
+    assert query_key('count', {'a': {'b': 1, 'c': 2}}) != query_key('count', {'a': {'c': 2, 'b': 1}})
+    assert query_key('count', {'a': True}) != query_key('count', {'a': 1})
+    assert query_key('count', {}, limit=None) == query_key('count', {})
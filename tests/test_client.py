@@ -6,10 +6,14 @@ version: 1.0.0
 description:
 
 """
+import asyncio
+import os
+import threading
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 # import sys
 # sys.path.append("..")
-from aio_mongo_dm import AioClient
+from aio_mongo_dm import AioClient, Document
 
 
 @pytest.mark.asyncio
@@ -29,3 +33,154 @@ async def test_aio_client_no_loop(get_mongo_url):
 
     server_info = await aio_client.server_info()
     assert server_info is not None and isinstance(server_info, dict)
+
+
+def test_aio_client_outside_loop(get_mongo_url):
+    client = AioClient(client_name='__sync_client__', url=get_mongo_url)
+    assert AioClient(client_name='__sync_client__') is client
+
+    AioClient.close()
+    assert id(client) not in map(id, AioClient.clients())
+
+
+def test_aio_client_per_loop(get_mongo_url):
+    loop_a, loop_b = asyncio.new_event_loop(), asyncio.new_event_loop()
+    try:
+        client_a = AioClient(client_name='__loop_client__', url=get_mongo_url, io_loop=loop_a, maxPoolSize=5)
+        assert AioClient(client_name='__loop_client__', io_loop=loop_a) is client_a
+
+        client_b = AioClient(client_name='__loop_client__', io_loop=loop_b)
+        assert client_b is not client_a
+        assert AioClient.for_loop(client_a, loop_b) is client_b
+        assert AioClient.for_loop(client_a, loop_a) is client_a
+        assert [id(client) for client in AioClient.clients(loop_a)] == [id(client_a)]
+
+        AioClient.close(loop_a)
+        assert id(client_a) not in map(id, AioClient.clients())
+        assert AioClient(client_name='__loop_client__', io_loop=loop_b) is client_b
+    finally:
+        AioClient.close(loop_b)
+        loop_a.close()
+        loop_b.close()
+
+
+def test_aio_client_threads(get_mongo_url):
+    class ThreadUser(Document):
+        __client_name__ = '__thread_client__'
+        __db_url__ = get_mongo_url
+        __db_name__ = 'mmtest'
+        __schema__ = {
+            'name': {'type': str}
+        }
+
+    barrier = threading.Barrier(8)
+
+    async def work():
+        # loops of worker threads create clients and resolve collections at the same time
+        barrier.wait()
+        collection = ThreadUser.aio_collection
+        client = AioClient(client_name='__thread_client__')
+        return client, collection, asyncio.get_running_loop()
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(lambda _: asyncio.run(work()), range(8)))
+
+    assert len({id(client) for client, _, _ in results}) == 8
+    assert all(collection.database.client is client for client, collection, _ in results)
+    for _, _, loop in results:
+        AioClient.close(loop)
+
+
+def test_aio_client_closed_loop(get_mongo_url):
+    loop = asyncio.new_event_loop()
+    client = AioClient(client_name='__closed_loop_client__', url=get_mongo_url, io_loop=loop)
+    loop.close()
+
+    other = asyncio.new_event_loop()
+    try:
+        client_other = AioClient(client_name='__closed_loop_client__', io_loop=other)
+        assert client_other is not client and id(client) not in map(id, AioClient.clients())
+    finally:
+        AioClient.close(other)
+        other.close()
+
+
+def test_aio_client_close_rebind(get_mongo_url):
+    loop = asyncio.new_event_loop()
+    client = AioClient(client_name='__close_client__', url=get_mongo_url, io_loop=loop)
+
+    class CloseUser(Document):
+        __aio_client__ = client
+        __db_name__ = 'mmtest'
+        __schema__ = {
+            'name': {'type': str}
+        }
+
+    try:
+        collection = CloseUser.aio_collection
+        assert collection.database.client is client
+
+        # the class bound to a closed client gets a new client with the same url on its next use
+        AioClient.close(loop)
+        assert AioClient.is_closed(client)
+        new_collection = CloseUser.aio_collection
+        assert new_collection is not collection
+        assert vars(CloseUser)['__aio_client__'] is not client
+        assert new_collection.database.client is CloseUser.__aio_client__
+        assert not AioClient.is_closed(CloseUser.__aio_client__)
+        assert AioClient.for_loop(client) is CloseUser.__aio_client__
+    finally:
+        AioClient.close()
+        loop.close()
+
+
+def test_aio_client_fork(get_mongo_url, monkeypatch):
+    client = AioClient(client_name='__fork_client__', url=get_mongo_url, cache=False)
+
+    class ForkUser(Document):
+        __aio_client__ = client
+        __db_name__ = 'mmtest'
+        __schema__ = {
+            'name': {'type': str}
+        }
+
+    class ForkAdmin(ForkUser):
+        pass
+
+    collection = ForkAdmin.aio_collection
+    assert AioClient.check_fork() is False
+
+    # the process looks forked, the clients of the parent are dropped
+    monkeypatch.setattr(AioClient, '_AioClient__pid', -1)
+    generation = AioClient.generation
+    assert AioClient.check_fork() is True
+    assert AioClient.generation == generation + 1
+    assert AioClient.is_inherited(client)
+    assert id(client) not in map(id, AioClient.clients())
+
+    # resolving the sub class rebinds the class bound to the inherited client, not the sub class
+    worker_collection = ForkAdmin.aio_collection
+    assert worker_collection is not collection
+    assert '__aio_client__' not in vars(ForkAdmin)
+    assert vars(ForkUser)['__aio_client__'] is not client
+    assert not AioClient.is_inherited(ForkUser.__aio_client__)
+    assert worker_collection.database.client is ForkUser.__aio_client__
+    assert ForkUser.aio_collection.database.client is ForkUser.__aio_client__
+    assert AioClient.for_loop(client) is ForkUser.__aio_client__
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='no fork')
+def test_aio_client_fork_hook(get_mongo_url):
+    AioClient(client_name='__fork_hook_client__', url=get_mongo_url)
+    generation = AioClient.generation
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        ok = AioClient.generation == generation + 1 and not AioClient.clients()
+        os.write(write_fd, b'1' if ok else b'0')
+        os._exit(0)
+    os.close(write_fd)
+    os.waitpid(pid, 0)
+    assert os.read(read_fd, 1) == b'1'
+    os.close(read_fd)
+    assert AioClient.generation == generation
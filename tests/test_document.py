@@ -6,6 +6,7 @@ version: 1.0.0
 description:
 
 """
+import weakref
 import pytest
 # import sys
 # sys.path.append("..")
@@ -177,6 +178,54 @@ def test_document_id(user_document):
     assert '_id' in user
 
 
+def test_document_changes(user_document):
+    user = user_document(name='kavin', age=30, sex=True)
+    user.clear_changes()
+    assert user.get_changes() == {}
+
+    user.age += 1
+    del user.sex
+    assert user.get_changes() == {'$set': {'age': 31}, '$unset': {'sex': ''}}
+
+    user.sex = False
+    assert user.get_changes() == {'$set': {'age': 31, 'sex': False}}
+
+
+def test_document_changes_lazy(user_document):
+    user = user_document(name='kavin', age=30)
+    assert user.__doc_changes__ is None
+    assert user.get_changes() == {}
+
+    user.age = 31
+    assert user.__doc_changes__ == {'age': True}
+    user.clear_changes()
+    assert user.__doc_changes__ is None
+
+    user = user_document(_id='fake_id', age=30)
+    assert user.get_changes() == {'$set': {'age': 30}}
+
+
+def test_document_mark_changed(user_document):
+    user = user_document(name='kavin')
+    user.clear_changes()
+    user.mark_changed('name')
+    assert user.get_changes() == {'$set': {'name': 'kavin'}}
+
+    with pytest.raises(exceptions.AioMongoAttributeError) as e:
+        user.mark_changed('sex')
+    exec_msg = e.value.args[0]
+    assert exec_msg == "'User' object has no attribute 'sex'"
+
+
+def test_document_compact_layout(user_document):
+    user = user_document(name='kavin', age=30, sex=True)
+    assert user_document.__slots__ == ()
+    assert '__dict__' not in dir(user_document)
+
+    assert user.__doc_data__ == {'name': 'kavin', 'age': 30, 'sex': True}
+    assert weakref.ref(user)() is user
+
+
 def test_absdocument():
     doc = AbstractDocument()
     doc2 = AbstractDocument()
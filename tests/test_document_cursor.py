@@ -0,0 +1,119 @@
+"""
+name: test_document_cursor
+author：kavinbj
+createdAt: 2022/8/1
+version: 1.0.0
+description:
+
+"""
+import asyncio
+import gc
+import pytest
+# import sys
+# sys.path.append("..")
+from aio_mongo_dm import exceptions, Document, DocumentCursor
+
+
+@pytest.mark.asyncio
+async def test_cursor_clear_collection(get_mongo_url, event_loop, user_document):
+    await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
+    await user_document.get_collection().drop()
+
+    for age in range(10):
+        await user_document(name='cursor', age=age, sex=age % 2 == 0).save()
+
+
+def test_cursor_chain(user_document):
+    cursor = user_document.find({'name': 'cursor'}, {'age': 1}).sort('age', -1).skip(2).limit(5).batch_size(2)
+    assert isinstance(cursor, DocumentCursor)
+
+    cursor = cursor.projection({'name': 1, 'age': 1}).sort([('age', 1), ('name', -1)])
+    assert isinstance(cursor, DocumentCursor)
+
+
+@pytest.mark.asyncio
+async def test_cursor_async_for(user_document):
+    ages = []
+    async for user in user_document.find({'name': 'cursor'}).sort('age', -1).skip(2).limit(5).batch_size(2):
+        assert isinstance(user, user_document)
+        ages.append(user.age)
+    assert ages == [7, 6, 5, 4, 3]
+
+
+@pytest.mark.asyncio
+async def test_cursor_to_list(user_document):
+    cursor = user_document.find({'name': 'cursor'}).sort('age').batch_size(3)
+    users = await cursor.to_list(4)
+    assert [user.age for user in users] == [0, 1, 2, 3]
+    assert users[0].get_changes() == {}
+
+    users = await cursor.to_list()
+    assert [user.age for user in users] == [4, 5, 6, 7, 8, 9]
+    assert await cursor.to_list() == []
+
+
+@pytest.mark.asyncio
+async def test_cursor_projection(user_document):
+    cursor = user_document.find({'name': 'cursor', 'age': 1}).projection({'sex': 1})
+    users = await cursor.to_list()
+    assert len(users) == 1
+    assert users[0].sex is False
+    assert 'name' not in users[0]
+
+
+@pytest.mark.asyncio
+async def test_cursor_started_error(user_document):
+    cursor = user_document.find({'name': 'cursor'})
+    await cursor.to_list(1)
+
+    with pytest.raises(exceptions.AioMongoInvalidOperation) as e:
+        cursor.limit(2)
+    exec_msg = e.value.args[0]
+    assert exec_msg == 'cannot set options after executing query.'
+    await cursor.close()
+
+
+@pytest.mark.asyncio
+async def test_cursor_prefetch(user_document):
+    ages = []
+    async for user in user_document.find({'name': 'cursor'}).sort('age').batch_size(3).prefetch(2):
+        assert isinstance(user, user_document)
+        ages.append(user.age)
+    assert ages == list(range(10))
+
+    users = await user_document.find({'name': 'cursor'}).sort('age').batch_size(4).prefetch(1).to_list(5)
+    assert [user.age for user in users] == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.asyncio
+async def test_cursor_prefetch_close(user_document):
+    cursor = user_document.find({'name': 'cursor'}).sort('age').batch_size(2).prefetch(1)
+    user = await cursor.__anext__()
+    assert user.age == 0
+
+    await cursor.close()
+    assert not cursor.alive
+    assert await cursor.to_list() == []
+
+
+@pytest.mark.asyncio
+async def test_cursor_prefetch_early_exit(user_document):
+    # leaving async with releases the background task
+    async with user_document.find({'name': 'cursor'}).sort('age').batch_size(2).prefetch(1) as cursor:
+        async for user in cursor:
+            if user.age == 2:
+                break
+        task = cursor._prefetch_task
+    assert task.done()
+
+    # an abandoned cursor cancels its background task when garbage collected
+    cursor = user_document.find({'name': 'cursor'}).sort('age').batch_size(2).prefetch(1)
+    users = await cursor.to_list(3)
+    assert [user.age for user in users] == [0, 1, 2]
+    task = cursor._prefetch_task
+    await asyncio.sleep(0)
+    assert not task.done()
+    del cursor
+    gc.collect()
+    await asyncio.gather(task, return_exceptions=True)
+    assert task.cancelled()
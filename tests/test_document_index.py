@@ -7,7 +7,9 @@ description:
 
 """
 import pytest
+from datetime import datetime
 from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import DuplicateKeyError
 # import sys
 # sys.path.append("..")
 from aio_mongo_dm import Document
@@ -73,3 +75,110 @@ async def test_get_index_information(user_document):
     index_keys = list(index_information.keys())
 
     assert index_keys == ['_id_', 'name_-1', 'age_1', 'createdAt_-1', 'updatedAt_-1', 'name_1_createdAt_-1']
+
+
+@pytest.mark.asyncio
+async def test_ensure_all_indexes(get_mongo_url, event_loop):
+    await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
+
+    class BaseDocument(Document):
+        __abstract__ = True
+
+    class Shop(BaseDocument):
+        __schema__ = {
+            'name': {'type': str, 'index': 1},
+            'city': {'type': str, 'index': 'hashed'},
+        }
+
+    class Product(BaseDocument):
+        __schema__ = {
+            'title': {'type': str, 'index': -1},
+        }
+
+    class Tag(BaseDocument):
+        __schema__ = {
+            'title': {'type': str},
+        }
+
+    # a class without client is skipped
+    class Draft(BaseDocument):
+        __aio_client__ = None
+        __schema__ = {
+            'title': {'type': str, 'index': 1},
+        }
+
+    results = await BaseDocument.ensure_all_indexes()
+    assert results == {
+        f'{__name__}.test_ensure_all_indexes.<locals>.Shop': ['name_1', 'city_hashed'],
+        f'{__name__}.test_ensure_all_indexes.<locals>.Product': ['title_-1'],
+    }
+    assert list(await Product.get_index_infor()) == ['_id_', 'title_-1']
+
+
+@pytest.mark.asyncio
+async def test_reconcile_indexes(get_mongo_url, event_loop):
+    await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
+
+    class Account(Document):
+        __schema__ = {
+            'email': {'type': str, 'index': 1},
+            'name': {'type': str},
+            'createdAt': {'type': datetime},
+        }
+        __indexes__ = [
+            {'keys': [('name', 1), ('createdAt', -1)]},
+            {'keys': [('createdAt', 1)], 'expireAfterSeconds': 3600},
+        ]
+
+    await Account.get_collection().drop_indexes()
+    await Account.aio_collection.create_index([('email', 1)], unique=True)
+    await Account.aio_collection.create_index([('name', -1)])
+
+    result = await Account.reconcile_indexes(dry_run=True)
+    assert result == {'created': ['name_1_createdAt_-1', 'createdAt_1'], 'rebuilt': ['email_1'], 'modified': [],
+                      'stale': ['name_-1'], 'dropped': []}
+    assert list(await Account.get_index_infor()) == ['_id_', 'email_1', 'name_-1']
+
+    result = await Account.reconcile_indexes(drop=True, rolling=True)
+    assert result['dropped'] == ['name_-1']
+    index_information = await Account.get_index_infor()
+    assert sorted(index_information) == ['_id_', 'createdAt_1', 'email_1', 'name_1_createdAt_-1']
+    assert not index_information['email_1'].get('unique')
+
+    result = await Account.reconcile_indexes()
+    assert result == {'created': [], 'rebuilt': [], 'modified': [], 'stale': [], 'dropped': []}
+
+
+@pytest.mark.asyncio
+async def test_reconcile_indexes_failed_rebuild(get_mongo_url, event_loop):
+    await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
+
+    class Member(Document):
+        __schema__ = {
+            'name': {'type': str},
+        }
+        __indexes__ = [
+            {'keys': [('name', 1)], 'unique': True},
+        ]
+
+    await Member.get_collection().drop_indexes()
+    await Member.aio_collection.delete_many({})
+    await Member.aio_collection.create_index([('name', 1)])
+    await Member.aio_collection.insert_many([{'name': 'member'}, {'name': 'member'}])
+
+    # the unique index can not be built, the old index is built again
+    with pytest.raises(DuplicateKeyError):
+        await Member.reconcile_indexes()
+    index_information = await Member.get_index_infor()
+    assert 'name_1' in index_information and not index_information['name_1'].get('unique')
+
+
+@pytest.mark.asyncio
+async def test_create_index_command_options(user_document):
+    await user_document.get_collection().drop_indexes()
+    index_list = await user_document.create_index(maxTimeMS=10000, comment='create_index')
+    assert index_list == ['name_-1', 'age_1', 'createdAt_-1', 'updatedAt_-1']
+
+    # command options are not index options
+    index_information = await user_document.get_index_infor()
+    assert all('maxTimeMS' not in info and 'comment' not in info for info in index_information.values())
@@ -6,11 +6,13 @@ version: 1.0.0
 description:
 
 """
+import asyncio
 import pytest
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 # import sys
 # sys.path.append("..")
-from aio_mongo_dm import exceptions, Document, ObjectId
+from aio_mongo_dm import exceptions, Document, ObjectId, AioClient
 
 
 @pytest.mark.asyncio
@@ -80,6 +82,111 @@ async def test_document_save_no_time(user_document_no_time):
     assert 'updatedAt' not in user_no_time
 
 
+@pytest.mark.asyncio
+async def test_document_save_changes(user_document):
+    user = user_document(name='kavin', age=30, sex=True)
+    await user.save()
+    assert user.get_changes() == {}
+
+    # modified by another client
+    await user_document.get_collection().update_one({'_id': user['_id']}, {'$set': {'name': 'felix'}})
+
+    user.age += 1
+    del user.sex
+    await user.save()
+    assert user.get_changes() == {}
+
+    await user.refresh()
+    assert user.name == 'felix'
+    assert user.age == 31
+    assert 'sex' not in user
+
+
+@pytest.mark.asyncio
+async def test_document_save_replace(user_document):
+    user = user_document(name='kavin', age=30, sex=True)
+    await user.save()
+
+    await user_document.get_collection().update_one({'_id': user['_id']}, {'$set': {'name': 'felix'}})
+
+    await user.save(replace=True)
+    await user.refresh()
+    assert user.name == 'kavin'
+
+
+@pytest.mark.asyncio
+async def test_document_save_many(user_document):
+    old_users = [user_document(name='save_many_old', age=i) for i in range(3)]
+    await user_document.save_many(old_users)
+    assert all('_id' in user for user in old_users)
+    assert all(user.get_changes() == {} for user in old_users)
+
+    old_users[0].age = 100
+    new_users = [user_document(name='save_many_new', age=i) for i in range(5)]
+    result = await user_document.save_many(old_users + new_users, batch_size=2)
+    assert result == old_users + new_users
+    assert all('_id' in user and 'createdAt' in user for user in new_users)
+
+    assert await user_document.count({'name': 'save_many_new'}) == 5
+    await old_users[1].refresh()
+    assert old_users[1].age == 1
+    await old_users[0].refresh()
+    assert old_users[0].age == 100
+
+
+@pytest.mark.asyncio
+async def test_document_save_many_error():
+    class Member(Document):
+        __schema__ = {
+            'name': {'type': str}
+        }
+
+    await Member.get_collection().drop()
+    await Member.get_collection().create_index('name', unique=True)
+    await Member(name='kavin').save()
+
+    members = [Member(name='felix'), Member(name='kavin'), Member(name='tom')]
+    with pytest.raises(BulkWriteError):
+        await Member.save_many(members, ordered=False)
+
+    assert '_id' in members[0]
+    assert '_id' not in members[1]
+    assert '_id' in members[2]
+    assert await Member.count() == 3
+
+
+@pytest.mark.asyncio
+async def test_document_save_coalescing():
+    class Member(Document):
+        __collection_name__ = 'coalescing_members'
+        __schema__ = {
+            'name': {'type': str},
+            'age': {'type': int, 'default': 20}
+        }
+
+    await Member.get_collection().drop()
+    await Member.get_collection().create_index('name', unique=True)
+    member = await Member(name='kavin').save()
+
+    coalescer = Member.enable_coalescing(max_delay=0.01)
+    member.age = 30
+    members = [Member(name=f'member{i}') for i in range(20)]
+    results = await asyncio.gather(member.save(), Member(name='kavin').save(), *[m.save() for m in members],
+                                   return_exceptions=True)
+    Member.disable_coalescing()
+
+    assert coalescer.batches == 1
+    assert coalescer.operations == 22
+    assert results[0] is member
+    assert isinstance(results[1], DuplicateKeyError)
+    assert results[2:] == members
+    assert all('_id' in m for m in members)
+    assert await Member.count() == 21
+
+    await member.refresh()
+    assert member.age == 30
+
+
 @pytest.mark.asyncio
 async def test_document_delete(user_document):
     user = user_document()
@@ -158,3 +265,25 @@ async def test_document_after_save_hook():
         await user.save()
     exec_msg = e.value.args[0]
     assert exec_msg == "User after_save hook method run."
+
+
+@pytest.mark.asyncio
+async def test_document_check_health(get_mongo_url, event_loop):
+    await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop, warm_up=True)
+    health = await Document.check_health()
+    assert health['ok'] is True and health['latency'] >= 0
+    assert isinstance(health['version'], str) and isinstance(health['topology'], str)
+    assert health['servers'] and health['pool_size'] >= health['min_pool_size']
+
+    assert await Document.warm_up(2) >= 1
+
+
+@pytest.mark.asyncio
+async def test_document_check_health_error(event_loop):
+    class ProbeDocument(Document):
+        pass
+
+    ProbeDocument.__aio_client__ = AioClient(client_name='__probe__', url='error_url', cache=False,
+                                             io_loop=event_loop, serverSelectionTimeoutMS=3)
+    health = await ProbeDocument.check_health(raise_error=False)
+    assert health['ok'] is False and health['error']
@@ -7,11 +7,14 @@ version: 1.0.0
 description:
 
 """
+import asyncio
 import pytest
+from bson.raw_bson import RawBSONDocument
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReadPreference
 # import sys
 # sys.path.append("..")
-from aio_mongo_dm import exceptions, Document
+from aio_mongo_dm import exceptions, Document, ObjectId, request_cache
 
 
 @pytest.mark.asyncio
@@ -61,6 +64,187 @@ async def test_document_find_by_id(get_mongo_url, event_loop, user_document):
     assert find_user.sex == user.sex
 
 
+@pytest.mark.asyncio
+async def test_document_find_by_id_lazy(get_mongo_url, event_loop, user_document):
+    await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
+
+    user = user_document.create_instance({'name': 'kavin', 'age': 30, 'sex': True})
+    await user.save()
+
+    find_user = await user_document.find_by_id(user['_id'], lazy=True)
+    assert isinstance(find_user.__doc_data__, RawBSONDocument)
+    assert find_user.name == 'kavin'
+    assert find_user.age == 30
+
+    find_user.age += 1
+    assert isinstance(find_user.__doc_data__, dict)
+    assert find_user.get_changes() == {'$set': {'age': 31}}
+    await find_user.save()
+
+    await user.refresh()
+    assert user.age == 31
+
+    # a missing field reads as its default value, like a decoded document
+    await user_document.aio_collection.update_one({'_id': user['_id']}, {'$unset': {'age': ''}})
+    find_user = await user_document.find_by_id(user['_id'], lazy=True)
+    assert find_user.age == find_user['age'] == (await user_document.find_by_id(user['_id'])).age
+    find_user.name = 'felix'
+    assert find_user.age == find_user.__doc_data__['age']
+
+
+@pytest.mark.asyncio
+async def test_document_find_by_id_batch_loading(get_mongo_url, event_loop, user_document):
+    await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
+
+    users = [user_document(name='loader', age=i) for i in range(3)]
+    await user_document.save_many(users)
+    oids = [user['_id'] for user in users]
+
+    loader = user_document.enable_batch_loading()
+    find_users = await asyncio.gather(*[user_document.find_by_id(oid) for oid in oids + [oids[0], ObjectId()]])
+    user_document.disable_batch_loading()
+
+    assert loader.batches == 1
+    assert loader.loads == 5
+    assert [user.age for user in find_users[:4]] == [0, 1, 2, 0]
+    assert find_users[0] == find_users[3]
+    assert find_users[0] is not find_users[3]
+    assert find_users[4] is None
+
+    # a cancelled caller does not cancel the other callers of the same id
+    loader = user_document.enable_batch_loading()
+    first = asyncio.ensure_future(user_document.find_by_id(oids[1]))
+    second = asyncio.ensure_future(user_document.find_by_id(oids[1]))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert (await second).age == 1
+    assert first.cancelled()
+
+    # an id no caller waits on anymore is not fetched
+    alone = asyncio.ensure_future(user_document.find_by_id(oids[2]))
+    await asyncio.sleep(0)
+    alone.cancel()
+    await asyncio.sleep(0)
+    assert loader.batches == 1
+    user_document.disable_batch_loading()
+
+
+@pytest.mark.asyncio
+async def test_document_multi_loop(get_mongo_url, event_loop, user_document):
+    await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
+
+    users = [user_document(name='multi_loop', age=i) for i in range(4)]
+    await user_document.save_many(users)
+    oids = [user['_id'] for user in users]
+
+    # batch loading, write coalescing and shared counts used from loops of worker threads at the same time
+    user_document.enable_batch_loading()
+    user_document.enable_coalescing(max_delay=0.01)
+
+    async def work(age):
+        found = await asyncio.gather(*[user_document.find_by_id(oid) for oid in oids])
+        await asyncio.gather(*[user_document(name='multi_loop_saved', age=age).save() for _ in range(3)])
+        count = await user_document.count({'name': 'multi_loop'}, max_staleness=10)
+        return [user.age for user in found], count
+
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(work(1), *(loop.run_in_executor(None, asyncio.run, work(age)) for age in (2, 3)))
+    user_document.disable_batch_loading()
+    user_document.disable_coalescing()
+
+    assert results == [([0, 1, 2, 3], 4)] * 3
+    assert await user_document.count({'name': 'multi_loop_saved'}) == 9
+
+
+@pytest.mark.asyncio
+async def test_document_find_by_id_cache(get_mongo_url, event_loop, user_document):
+    await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
+
+    user = await user_document(name='cache', age=30).save()
+    cache = user_document.enable_cache(maxsize=10, ttl=60)
+
+    find_user1 = await user_document.find_by_id(user['_id'])
+    find_user2 = await user_document.find_by_id(user['_id'])
+    assert find_user1.age == find_user2.age == 30
+    assert find_user1 is not find_user2
+    assert cache.stats == {'hits': 1, 'misses': 1, 'size': 1}
+
+    user.age = 31
+    await user.save()
+    assert len(cache) == 0
+    find_user3 = await user_document.find_by_id(user['_id'])
+    assert find_user3.age == 31
+
+    await user_document.delete_by_id(user['_id'])
+    assert await user_document.find_by_id(user['_id']) is None
+    user_document.disable_cache()
+
+
+@pytest.mark.asyncio
+async def test_document_refresh_cache_primary(get_mongo_url, event_loop, user_document, monkeypatch):
+    await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
+
+    user = await user_document(name='cache_refresh', age=30).save()
+    cache = user_document.enable_cache(maxsize=10, ttl=60)
+
+    # a cache miss of refresh is read from the primary, not with the class read preference
+    def read_collection(*args, **kwargs):
+        raise AssertionError('refresh read with the class read preference')
+    monkeypatch.setattr(user_document, 'read_collection', read_collection)
+    await user.refresh()
+    assert user.age == 30
+    assert cache.stats == {'hits': 0, 'misses': 1, 'size': 1}
+    user_document.disable_cache()
+
+
+@pytest.mark.asyncio
+async def test_document_find_by_id_identity_map(get_mongo_url, event_loop, user_document):
+    await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
+
+    user = await user_document(name='identity', age=30).save()
+    user_document.enable_cache(scope='request')
+
+    with request_cache():
+        find_user1 = await user_document.find_by_id(user['_id'])
+        find_user2 = await user_document.find_by_id(user['_id'])
+        assert find_user1 is find_user2
+
+    find_user3 = await user_document.find_by_id(user['_id'])
+    assert find_user3 is not find_user1
+    user_document.disable_cache()
+
+
+@pytest.mark.asyncio
+async def test_document_query_cache(get_mongo_url, event_loop, user_document):
+    await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
+
+    await user_document(name='query_cache', age=1).save()
+    cache = user_document.enable_query_cache(maxsize=10, ttl=60)
+
+    assert await user_document.count({'name': 'query_cache'}) == 1
+    assert await user_document.count({'name': 'query_cache'}) == 1
+    find_user1 = await user_document.find_one({'name': 'query_cache'})
+    find_user2 = await user_document.find_one({'name': 'query_cache'})
+    assert find_user1 == find_user2
+    assert find_user1 is not find_user2
+    users = await user_document.find({'name': 'query_cache'}).to_list()
+    users = await user_document.find({'name': 'query_cache'}).to_list()
+    assert [user.age for user in users] == [1]
+    assert cache.stats == {'hits': 3, 'misses': 3, 'size': 3}
+
+    await user_document(name='query_cache', age=2).save()
+    assert len(cache) == 0
+    assert await user_document.count({'name': 'query_cache'}) == 2
+    users = await user_document.find({'name': 'query_cache'}).sort('age').to_list()
+    assert [user.age for user in users] == [1, 2]
+
+    find_user1.age = 3
+    await find_user1.save()
+    find_user3 = await user_document.find_one({'name': 'query_cache'}, sort=[('age', -1)])
+    assert find_user3.age == 3
+    user_document.disable_query_cache()
+
+
 @pytest.mark.asyncio
 async def test_document_find_by_id_error(get_mongo_url, event_loop, user_document):
     await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
@@ -76,6 +260,37 @@ async def test_document_find_by_id_error(get_mongo_url, event_loop, user_documen
     assert exec_msg == "'error_id' is not a valid ObjectId, it must be a 12-byte input or a 24-character hex string"
 
 
+@pytest.mark.asyncio
+async def test_document_find_unknown_fields(get_mongo_url, event_loop):
+    await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
+
+    class Order(Document):
+        __collection_name__ = 'unknown_orders'
+        __schema__ = {
+            'total_fee': {'type': int},
+            'status': {'type': str, 'default': 'Normal'}
+        }
+
+    result = await Order.get_collection().insert_one({'total_fee': 100, 'remark': 'vip'})
+
+    with pytest.raises(exceptions.AioMongoAttributeError) as e:
+        await Order.find_one({'_id': result.inserted_id})
+    exec_msg = e.value.args[0]
+    assert exec_msg == "'Order' object has no attribute 'remark' definition."
+
+    Order.__unknown_fields__ = 'drop'
+    order = await Order.find_by_id(result.inserted_id)
+    assert 'remark' not in order
+    assert order.status == 'Normal'
+    assert order.get_changes() == {}
+
+    Order.__unknown_fields__ = 'keep'
+    Order.__trusted__ = True
+    order = await Order.find_one({'_id': result.inserted_id})
+    assert order.remark == 'vip'
+    assert order.total_fee == 100
+
+
 @pytest.mark.asyncio
 async def test_document_delete_by_id(get_mongo_url, event_loop, user_document):
     await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
@@ -139,3 +354,187 @@ async def test_document_count(get_mongo_url, event_loop, user_document):
 
     count = await user_document.count({'name': 'felix'})
     assert count == 3
+
+
+@pytest.mark.asyncio
+async def test_document_count_estimated(get_mongo_url, event_loop, user_document):
+    await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
+
+    count = await user_document.count()
+    assert await user_document.count(estimated=True) == count
+    assert await user_document.count({'name': 'felix'}, estimated=True) == 3
+
+    counts = await asyncio.gather(*[user_document.count(estimated=True, max_staleness=60) for _ in range(3)])
+    assert counts == [count] * 3
+    await user_document(name='estimated').save()
+    assert await user_document.count(estimated=True, max_staleness=60) == count
+    assert await user_document.count(estimated=True, max_staleness=0) == count + 1
+    assert await user_document.count({'name': 'estimated'}, max_staleness=60) == 1
+
+
+@pytest.mark.asyncio
+async def test_document_paginate(get_mongo_url, event_loop, user_document):
+    await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
+
+    await user_document.save_many([user_document(name='paginate', age=i % 3) for i in range(7)])
+
+    ages = []
+    token = None
+    for _ in range(4):
+        users, token = await user_document.paginate({'name': 'paginate'}, sort=[('age', -1)], after=token, limit=3)
+        ages.extend(user.age for user in users)
+        if token is None:
+            break
+    assert ages == [2, 2, 1, 1, 0, 0, 0]
+    assert token is None
+
+    with pytest.raises(exceptions.AioMongoInvalidOperation) as e:
+        await user_document.paginate({'name': 'paginate'}, sort='sex')
+    exec_msg = e.value.args[0]
+    assert exec_msg == "no index of User matches the sort [('sex', 1), ('_id', 1)]."
+
+    users, token = await user_document.paginate({'name': 'paginate'}, sort='sex', limit=10, check_index=False)
+    assert len(users) == 7 and token is None
+
+    await user_document.save_many([user_document(name='paginate', sex=bool(i % 2)) for i in range(3)])
+    for sort in ('sex', [('sex', -1)]):
+        seen = []
+        token = None
+        for _ in range(5):
+            users, token = await user_document.paginate({'name': 'paginate'}, sort=sort, after=token, limit=3,
+                                                        check_index=False)
+            seen.extend(users)
+            if token is None:
+                break
+        assert len({user._id for user in seen}) == len(seen) == 10
+        sexes = [user.__doc_data__.get('sex') for user in seen]
+        assert sexes == ([None] * 7 + [False, False, True] if sort == 'sex' else [True, False, False] + [None] * 7)
+
+
+@pytest.mark.asyncio
+async def test_document_parallel_scan(get_mongo_url, event_loop, user_document):
+    await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
+
+    users = await user_document.save_many([user_document(name='scan', age=i) for i in range(50)])
+    await user_document(name='scan').save()
+    await user_document.aio_collection.update_one({'name': 'scan', 'age': 20}, {'$unset': {'age': ''}})
+    oids = {user['_id'] for user in users}
+
+    scanned = [user async for user in user_document.parallel_scan({'name': 'scan'}, partitions=4, batch_size=5)]
+    assert len(scanned) == 51
+    assert {user['_id'] for user in scanned} >= oids
+
+    scanned = [user async for user in user_document.parallel_scan({'name': 'scan'}, partitions=4, key='age',
+                                                                  ordered=True, sort=[('age', 1)])]
+    assert len(scanned) == 51
+    # the document without age is in the first partition, and gets the default age
+    ages = [user.age for user in scanned]
+    assert ages[1:] == sorted(ages[1:])
+
+    async for user in user_document.parallel_scan({'name': 'scan'}, partitions=4):
+        break
+
+    # without filters the whole collection is sampled and scanned
+    total = await user_document.count()
+    scanned = [user async for user in user_document.parallel_scan(partitions=4, key='age')]
+    assert len(scanned) == len({user['_id'] for user in scanned}) == total
+
+
+@pytest.mark.asyncio
+async def test_document_query_builder(get_mongo_url, event_loop, user_document):
+    await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
+
+    q = user_document.q
+    users = await user_document.find((q.name == 'felix') & (q.age >= 20)).sort('age').to_list()
+    assert [user.age for user in users] == [20, 30]
+    assert await user_document.count(q.name.in_(['felix'])) == 3
+    find_user = await user_document.find_one((q.name == 'felix') & (q.sex == False))  # noqa: E712
+    assert find_user.age == 20
+
+
+@pytest.mark.asyncio
+async def test_document_aggregate(get_mongo_url, event_loop, user_document):
+    await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
+
+    q = user_document.q
+    records = await user_document.aggregate().match(q.name == 'felix').group(
+        '$sex', total={'$sum': 1}, age={'$max': '$age'}).sort('_id').to_list()
+    assert [(record._id, record.total, record.age) for record in records] == [(False, 1, 20), (True, 2, 30)]
+
+    users = [user async for user in user_document.aggregate().match(q.name == 'felix').sort('age', -1).limit(2)]
+    assert all(isinstance(user, user_document) for user in users)
+    assert [user.age for user in users] == [30, 20]
+
+
+@pytest.mark.asyncio
+async def test_document_aggregate_to_list_close(get_mongo_url, event_loop, user_document, monkeypatch):
+    await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
+
+    class SpyCursor:
+        def __init__(self, cursor):
+            self.cursor, self.read, self.closed = cursor, 0, False
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            doc = await self.cursor.__anext__()
+            self.read += 1
+            return doc
+
+        async def close(self):
+            self.closed = True
+            await self.cursor.close()
+
+    collection = user_document.read_collection()
+    cursors = []
+    aggregate = collection.aggregate
+
+    def spy_aggregate(*args, **kwargs):
+        cursors.append(SpyCursor(aggregate(*args, **kwargs)))
+        return cursors[-1]
+    monkeypatch.setattr(collection, 'aggregate', spy_aggregate)
+
+    # the length is checked after every document, the cursor is closed when leaving early
+    users = await user_document.aggregate().match({'name': 'felix'}).to_list(2)
+    assert len(users) == 2
+    assert cursors[0].read == 2 and cursors[0].closed
+    assert await user_document.aggregate().to_list(0) == [] and len(cursors) == 1
+
+
+@pytest.mark.asyncio
+async def test_document_index_report(get_mongo_url, event_loop, user_document):
+    await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
+
+    await user_document.create_index()
+    with pytest.raises(exceptions.AioMongoInvalidOperation):
+        await user_document.index_report()
+
+    recorder = user_document.enable_query_recording()
+    await user_document.find({'name': 'felix'}).sort('age').to_list()
+    await user_document.find_one({'sex': True})
+    await user_document.count({'age': {'$gt': 10}})
+    assert sum(recorder.shapes.values()) == 3
+
+    report = {item['operations'].popitem()[0]: item for item in await user_document.index_report()}
+    assert report['find']['status'] == 'partial'
+    assert report['find']['suggestion'] == [('name', 1), ('age', 1)]
+    assert report['find_one']['status'] == 'unindexed'
+    assert report['count']['status'] == 'indexed'
+    user_document.disable_query_recording()
+
+
+@pytest.mark.asyncio
+async def test_document_read_preference(get_mongo_url, event_loop, user_document):
+    await Document.init_db(url=get_mongo_url, db_name='mytest', io_loop=event_loop)
+
+    await user_document(name='read_preference', age=30).save()
+
+    users = await user_document.find({'name': 'read_preference'}, read_preference='primaryPreferred').to_list()
+    assert [user.age for user in users] == [30]
+    user = await user_document.find_one({'name': 'read_preference'}, read_preference=ReadPreference.PRIMARY_PREFERRED)
+    assert await user_document.find_by_id(user._id, read_preference='primaryPreferred') == user
+    assert await user_document.count({'name': 'read_preference'}, read_preference='primaryPreferred') == 1
+    records = await user_document.aggregate(read_preference='primaryPreferred').match(
+        {'name': 'read_preference'}).to_list()
+    assert [record.age for record in records] == [30]
@@ -6,8 +6,10 @@ version: 1.0.0
 description:
 
 """
+import asyncio
 import pytest
 from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ReadPreference, WriteConcern
 # import sys
 # sys.path.append("..")
 from aio_mongo_dm import exceptions, Document, AioCollection
@@ -119,3 +121,193 @@ def test_document_define_error_key():
     exec_msg = e.value.args[0]
     assert e.type is exceptions.AioMongoDMSchemaError
     assert exec_msg == "field: 'name' has error definition key ['error_key']."
+
+
+def test_document_compile_validators():
+    assert list(User.__validators__) == ['name', 'sex', 'age', '_id']
+    assert User.__defaults__ == {'name': 'my_default_name', 'age': 20}
+
+    User.__validators__['name']('kavin')
+    User.__validators__['_id']('fake_id')
+    with pytest.raises(exceptions.AioMongoAttributeError) as e:
+        User.__validators__['age']('30')
+    exec_msg = e.value.args[0]
+    assert exec_msg == "in 'User', 'age' has not correct type <class 'int'>."
+
+
+def test_document_validate_data():
+    User.validate_data({'_id': 'fake_id', 'name': 'kavin', 'age': 30, 'sex': True})
+
+    with pytest.raises(exceptions.AioMongoAttributeError) as e:
+        User.validate_data({'name': 'kavin', 'error_key': 'error_value'})
+    exec_msg = e.value.args[0]
+    assert exec_msg == "'User' object has no attribute 'error_key' definition."
+
+
+def test_document_define_error_unknown_fields():
+    with pytest.raises(exceptions.AioMongoDMSchemaError) as e:
+        class UserErrorUnknownFields(Document):
+            __unknown_fields__ = 'ignore'
+            __schema__ = {
+                'name': {'type': str, 'default': 'my_default_name'}
+            }
+    exec_msg = e.value.args[0]
+    assert exec_msg == "'__unknown_fields__' value not as ['keep', 'drop', 'raise']."
+
+
+def test_document_define_indexes():
+    class UserIndexes(Document):
+        __schema__ = {
+            'name': {'type': str},
+            'age':  {'type': int}
+        }
+        __indexes__ = [
+            {'keys': [['name', 1], ('age', -1)], 'unique': True},
+            {'keys': [('age', 1)], 'partialFilterExpression': {'age': {'$gte': 18}}, 'name': 'adult_age'}
+        ]
+
+    assert UserIndexes.__indexes__[0]['keys'] == [('name', 1), ('age', -1)]
+
+
+def test_document_define_error_indexes():
+    with pytest.raises(exceptions.AioMongoDMSchemaError) as e:
+        class UserErrorIndexes(Document):
+            __schema__ = {
+                'name': {'type': str}
+            }
+            __indexes__ = [
+                {'keys': [('nmae', 1)]}
+            ]
+    exec_msg = e.value.args[0]
+    assert exec_msg == "index: {'keys': [('nmae', 1)]} field 'nmae' not defined in schema."
+
+    with pytest.raises(exceptions.AioMongoDMSchemaError) as e:
+        class UserErrorIndexOption(Document):
+            __schema__ = {
+                'name': {'type': str}
+            }
+            __indexes__ = [
+                {'keys': [('name', 1)], 'expire': 10}
+            ]
+    exec_msg = e.value.args[0]
+    assert exec_msg == "index: {'keys': [('name', 1)], 'expire': 10} has error definition key ['expire']."
+
+    with pytest.raises(exceptions.AioMongoDMSchemaError) as e:
+        class UserErrorIndexKeys(Document):
+            __schema__ = {
+                'name': {'type': str}
+            }
+            __indexes__ = [
+                {'unique': True}
+            ]
+    exec_msg = e.value.args[0]
+    assert exec_msg == "index: {'unique': True} not has 'keys' definition."
+
+
+def test_collection_cache():
+    class Order(Document):
+        __client_name__ = '__test_client__'
+        __db_url__ = 'mongodb://localhostlocalhost:27017'
+        __aio_client__ = None
+        __db_name__ = 'mmtest'
+        __schema__ = {
+            'name': {'type': str}
+        }
+
+    class PayOrder(Order):
+        __collection_options__ = {'read_preference': ReadPreference.SECONDARY_PREFERRED,
+                                  'write_concern': WriteConcern(w='majority')}
+
+    collection = Order.aio_collection
+    assert collection is Order.aio_collection
+    assert collection.name == 'orders'
+    assert PayOrder.aio_collection.read_preference == ReadPreference.SECONDARY_PREFERRED
+    assert PayOrder.aio_collection.write_concern == WriteConcern(w='majority')
+
+    pay_collection = PayOrder.aio_collection
+    Order.__db_name__ = 'mmtest2'
+    assert Order.aio_collection is not collection
+    assert Order.aio_collection.database.name == 'mmtest2'
+    assert PayOrder.aio_collection is not pay_collection
+    assert PayOrder.aio_collection.database.name == 'mmtest2'
+
+    collection = Order.aio_collection
+    assert Order.get_collection(db_name='mmtest3').database.name == 'mmtest3'
+    assert Order.aio_collection is not collection
+
+
+def test_collection_cache_per_loop():
+    class Invoice(Document):
+        __client_name__ = '__test_client__'
+        __db_url__ = 'mongodb://localhostlocalhost:27017'
+        __aio_client__ = None
+        __db_name__ = 'mmtest'
+        __schema__ = {
+            'name': {'type': str}
+        }
+
+    async def collection():
+        return Invoice.aio_collection
+
+    loop_a, loop_b = asyncio.new_event_loop(), asyncio.new_event_loop()
+    try:
+        collection_a = loop_a.run_until_complete(collection())
+        collection_b = loop_b.run_until_complete(collection())
+        assert collection_a is not collection_b
+        # the collection of every loop stays cached
+        assert loop_a.run_until_complete(collection()) is collection_a
+        assert loop_b.run_until_complete(collection()) is collection_b
+    finally:
+        loop_a.close()
+        loop_b.close()
+    assert Invoice.aio_collection is Invoice.aio_collection
+
+
+def test_read_preference():
+    class Report(Document):
+        __client_name__ = '__test_client__'
+        __db_url__ = 'mongodb://localhostlocalhost:27017'
+        __aio_client__ = None
+        __db_name__ = 'mmtest'
+        __read_preference__ = 'secondaryPreferred'
+        __max_staleness__ = 120
+        __tag_sets__ = [{'dc': 'ny'}, {}]
+        __schema__ = {
+            'name': {'type': str}
+        }
+
+    collection = Report.read_collection()
+    assert collection is Report.read_collection()
+    assert collection.read_preference == ReadPreference.SECONDARY_PREFERRED.__class__(
+        tag_sets=[{'dc': 'ny'}, {}], max_staleness=120)
+    assert Report.read_collection(lazy=True).read_preference == collection.read_preference
+    assert Report.read_collection(ReadPreference.NEAREST).read_preference == ReadPreference.NEAREST
+    assert Report.read_collection('primary').read_preference == ReadPreference.PRIMARY
+    assert User.read_collection() is User.aio_collection
+
+    async def read_collection():
+        return Report.read_collection()
+
+    # read collections are cached per event loop
+    loop = asyncio.new_event_loop()
+    try:
+        loop_collection = loop.run_until_complete(read_collection())
+        assert loop_collection is not collection and loop_collection.read_preference == collection.read_preference
+        assert Report.read_collection() is collection
+        assert loop.run_until_complete(read_collection()) is loop_collection
+    finally:
+        loop.close()
+
+    Report.__db_name__ = 'mmtest2'
+    assert Report.read_collection() is not collection
+    assert Report.read_collection().database.name == 'mmtest2'
+
+    with pytest.raises(exceptions.AioMongoDMSchemaError):
+        class ReportError(Document):
+            __read_preference__ = 'secondaryFirst'
+            __schema__ = {
+                'name': {'type': str}
+            }
+
+    with pytest.raises(exceptions.AioMongoInvalidOperation):
+        Report.read_collection('secondaryFirst')
@@ -0,0 +1,91 @@
+"""
+name: test_pagination
+author：kavinbj
+createdAt: 2022/8/7
+version: 1.0.0
+description:
+
+"""
+import pytest
+from datetime import datetime
+from bson.objectid import ObjectId
+# import sys
+# sys.path.append("..")
+from aio_mongo_dm.exceptions import AioMongoInvalidOperation
+from aio_mongo_dm.pagination import sort_spec, key_values, encode_token, decode_token, seek_filter, index_matches, \
+    equality_fields
+
+
+def test_sort_spec():
+    assert sort_spec() == [('_id', 1)]
+    assert sort_spec('age') == [('age', 1), ('_id', 1)]
+    assert sort_spec([('age', -1)]) == [('age', -1), ('_id', -1)]
+    assert sort_spec([('_id', -1), ('age', 1)]) == [('_id', -1), ('age', 1)]
+
+    with pytest.raises(AioMongoInvalidOperation) as e:
+        sort_spec([('name', 'text')])
+    exec_msg = e.value.args[0]
+    assert exec_msg == "sort direction of 'name' must be 1 or -1 for pagination."
+
+
+def test_page_token():
+    spec = sort_spec([('createdAt', -1), ('info.age', 1)])
+    oid = ObjectId()
+    values = key_values({'_id': oid, 'createdAt': datetime(2022, 8, 7), 'info': {'age': 10}}, spec)
+    assert values == [datetime(2022, 8, 7), 10, oid]
+
+    token = encode_token(spec, values)
+    assert isinstance(token, str)
+    assert decode_token(token, spec) == values
+
+    with pytest.raises(AioMongoInvalidOperation) as e:
+        decode_token(token, sort_spec('createdAt'))
+    exec_msg = e.value.args[0]
+    assert exec_msg == 'page token does not match the sort.'
+
+    with pytest.raises(AioMongoInvalidOperation) as e:
+        decode_token('error_token', spec)
+    exec_msg = e.value.args[0]
+    assert exec_msg == 'invalid page token.'
+
+
+def test_seek_filter():
+    oid = ObjectId()
+    assert seek_filter(sort_spec(), [oid]) == {'_id': {'$gt': oid}}
+    assert seek_filter(sort_spec([('age', -1)]), [10, oid]) == {
+        '$or': [{'$or': [{'age': {'$lt': 10}}, {'age': None}]}, {'age': 10, '_id': {'$lt': oid}}]
+    }
+
+
+def test_seek_filter_null():
+    oid = ObjectId()
+    spec = sort_spec([('sex', 1)])
+    assert key_values({'_id': oid}, spec) == [None, oid]
+    assert seek_filter(spec, [None, oid]) == {
+        '$or': [{'sex': {'$ne': None}}, {'sex': None, '_id': {'$gt': oid}}]
+    }
+    assert seek_filter(sort_spec([('sex', -1)]), [None, oid]) == {'sex': None, '_id': {'$lt': oid}}
+
+    token = encode_token(spec, [None, oid])
+    assert decode_token(token, spec) == [None, oid]
+
+
+def test_index_matches():
+    spec = sort_spec([('age', 1)])
+    assert index_matches([('age', 1)], spec)
+    assert index_matches([('age', -1), ('_id', -1)], spec)
+    assert not index_matches([('name', 1)], spec)
+    assert not index_matches([('name', 1), ('age', 1)], spec)
+    assert index_matches([('_id', 1)], sort_spec())
+
+
+def test_index_matches_equality():
+    spec = sort_spec([('age', 1)])
+    assert equality_fields({'sex': True, 'name': {'$eq': 'kavin'}, 'age': {'$gt': 20}}) == {'sex', 'name'}
+    assert equality_fields({'$and': [{'sex': True}], 'tags': {'$in': [1, 2]}}) == {'sex'}
+    assert index_matches([('sex', 1), ('age', 1)], spec, {'sex'})
+    assert index_matches([('sex', 1), ('name', -1), ('age', -1)], spec, {'sex', 'name'})
+    assert not index_matches([('sex', 1), ('age', 1)], spec)
+    assert not index_matches([('sex', 1), ('name', 1), ('age', 1)], spec, {'sex'})
+    # an equality field which is also a sort key
+    assert index_matches([('age', 1)], spec, {'age'})
@@ -0,0 +1,94 @@
+"""
+name: test_query
+author：kavinbj
+createdAt: 2022/8/9
+version: 1.0.0
+description:
+
+"""
+import pytest
+# import sys
+# sys.path.append("..")
+from aio_mongo_dm import Document, ObjectId
+from aio_mongo_dm.exceptions import AioMongoAttributeError, AioMongoMissParameter
+from aio_mongo_dm.query import Expr, Param, to_filter
+
+
+def test_query_compile(user_document):
+    q = user_document.q
+    assert (q.age > 30).to_filter() == {'age': {'$gt': 30}}
+    assert (q.name == 'kavin').to_filter() == {'name': 'kavin'}
+    assert ((q.age >= 10) & (q.age < 20) & q.name.in_(['kavin', 'felix'])).to_filter() == {
+        'age': {'$gte': 10, '$lt': 20}, 'name': {'$in': ['kavin', 'felix']}
+    }
+    assert ((q.age > 10) & (q.age > 20)).to_filter() == {'$and': [{'age': {'$gt': 10}}, {'age': {'$gt': 20}}]}
+    assert ((q.sex == True) | (q.age != 20) | q.name.exists(False)).to_filter() == {  # noqa: E712
+        '$or': [{'sex': True}, {'age': {'$ne': 20}}, {'name': {'$exists': False}}]
+    }
+    assert (~(q.age <= 20)).to_filter() == {'$nor': [{'age': {'$lte': 20}}]}
+    assert (~~(q.age <= 20)).to_filter() == {'age': {'$lte': 20}}
+    assert q.name.regex('^ka', 'i').to_filter() == {'name': {'$regex': '^ka', '$options': 'i'}}
+
+    oid = ObjectId()
+    assert to_filter(q._id == oid) == {'_id': oid}
+    assert to_filter({'age': 1}) == {'age': 1}
+
+    expr = q.age > 30
+    assert expr.to_filter() is expr.to_filter()
+
+
+def test_query_error(user_document):
+    with pytest.raises(AioMongoAttributeError) as e:
+        user_document.q.agee > 30
+    exec_msg = e.value.args[0]
+    assert exec_msg == "'User' has no field 'agee' in __schema__."
+
+    with pytest.raises(AioMongoAttributeError) as e:
+        user_document.q.age.in_([1, '2'])
+    exec_msg = e.value.args[0]
+    assert exec_msg == "in 'User', 'age' has not correct type <class 'int'>."
+
+    with pytest.raises(AioMongoAttributeError) as e:
+        Document.q
+    exec_msg = e.value.args[0]
+    assert exec_msg == "'Document' has no __schema__ to query."
+
+
+def test_query_template(user_document):
+    q = user_document.q
+    template = (q.name == Param('name')) & ((q.age > Param('age')) | q.sex.in_([True, Param('sex')]))
+    assert template.bind(name='kavin', age=30, sex=False) == {
+        'name': 'kavin', '$or': [{'age': {'$gt': 30}}, {'sex': {'$in': [True, False]}}]
+    }
+    assert template.bind(name='felix', age=20, sex=True) == {
+        'name': 'felix', '$or': [{'age': {'$gt': 20}}, {'sex': {'$in': [True, True]}}]
+    }
+    assert template.to_filter()['name'].name == 'name'
+
+    with pytest.raises(AioMongoAttributeError):
+        template.bind(name='kavin', age='30', sex=False)
+
+    with pytest.raises(AioMongoMissParameter) as e:
+        template.bind(name='kavin')
+    exec_msg = e.value.args[0]
+    assert exec_msg == "query param 'age' not bound."
+
+    with pytest.raises(AioMongoMissParameter) as e:
+        to_filter(template)
+    exec_msg = e.value.args[0]
+    assert exec_msg == "query params ['name', 'age', 'sex'] not bound."
+
+
+def test_query_field_instance():
+    class Note(Document):
+        __schema__ = {
+            'q': {'type': str},
+        }
+
+    assert (Note.q.q == 'x').to_filter() == {'q': 'x'}
+    assert Note(q='x').q == 'x'
+
+
+def test_expr_abstract():
+    with pytest.raises(TypeError):
+        Expr()